@@ -34,6 +34,8 @@ import sys
 
 import numpy
 
+from silx.image.stats import statistics
+
 
 _logger = logging.getLogger(__name__)
 
@@ -310,12 +312,13 @@ class BackendMatplotlib(BackendBase.BackendBase):
 
                 # Set unset/negative bounds to positive bounds
                 if vmin is None or vmax is None:
-                    posData = data[data > 0]
+                    stats = statistics(data)
+                    hasPositive = stats['min_positive'] is not None
                     if vmax is None:
                         # 1. as an ultimate fallback
-                        vmax = posData.max() if posData.size > 0 else 1.
+                        vmax = stats['max'] if hasPositive else 1.
                     if vmin is None:
-                        vmin = posData.min() if posData.size > 0 else vmax
+                        vmin = stats['min_positive'] if hasPositive else vmax
                     if vmin > vmax:
                         vmin = vmax
 
@@ -323,8 +326,10 @@ class BackendMatplotlib(BackendBase.BackendBase):
 
             else:  # Linear normalization
                 if colormap['autoscale']:
-                    vmin = data.min()
-                    vmax = data.max()
+                    stats = statistics(data)
+                    vmin, vmax = stats['min'], stats['max']
+                    if vmin is None:  # No finite value
+                        vmin, vmax = 0., 1.
                 else:
                     vmin = colormap['vmin']
                     vmax = colormap['vmax']
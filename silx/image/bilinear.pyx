@@ -25,44 +25,397 @@
 
 __authors__ = ["J. Kieffer"]
 __license__ = "MIT"
-__date__ = "09/05/2016"
-__doc__ = "Bilinear interpolator, peak finder, line-profile for images"
+__date__ = "22/06/2016"
+__doc__ = "Bilinear interpolator, peak finder, line-profile and affine transforms for images"
 
 import cython
 from cython.view cimport array as cvarray
+from cython.parallel import prange
+import multiprocessing
 import numpy
-from libc.math cimport floor, ceil, sin, cos, sqrt, atan2  
+from libc.math cimport floor, ceil, sin, cos, sqrt, atan2, fabs
 import logging
 logger = logging.getLogger("silx.image.bilinear") 
 
 
+def _get_num_threads(num_threads):
+    """Return the number of threads to use, at least 1
+
+    :param num_threads: Requested number of threads or None for all CPUs
+    """
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    return max(1, num_threads)
+
+
+ctypedef fused data_t:
+    unsigned short
+    int
+    float
+    double
+
+# Codes of the buffer types used without conversion
+cdef enum:
+    UINT16 = 0
+    INT32 = 1
+    FLOAT32 = 2
+    FLOAT64 = 3
+
+# Methods used by BilinearImage.c_refine
+cdef enum:
+    REFINE_NONE = 0
+    REFINE_TAYLOR = 1
+    REFINE_SINGULAR = 2
+    REFINE_FAILED = 3
+
+_DTYPE_CODES = {numpy.dtype(numpy.uint16): UINT16,
+                numpy.dtype(numpy.intc): INT32,
+                numpy.dtype(numpy.float32): FLOAT32,
+                numpy.dtype(numpy.float64): FLOAT64}
+
+
+def _as_supported(data):
+    """Return data as a C-contiguous array of a type in _DTYPE_CODES
+
+    Data is copied only if needed, other types are converted to float32.
+    """
+    data = numpy.asarray(data)
+    if data.dtype in _DTYPE_CODES:
+        return numpy.ascontiguousarray(data)
+    return numpy.ascontiguousarray(data, dtype=numpy.float32)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline float _interpolate(const data_t *data,
+                               size_t width, size_t height,
+                               float x, float y) nogil:
+    """Bilinear interpolation of data at column x and row y.
+
+    Values are read as float so that the result does not depend on the type
+    of the buffer.
+
+    :param data: Pointer to the first pixel of a C-contiguous image
+    """
+    cdef:
+        float d0 = min(max(y, 0.0), (height - 1.0))
+        float d1 = min(max(x, 0.0), (width - 1.0))
+        int i0, i1, j0, j1
+        float x0, x1, y0, y1, res
+
+    x0 = floor(d0)
+    x1 = ceil(d0)
+    y0 = floor(d1)
+    y1 = ceil(d1)
+    i0 = < int > x0
+    i1 = < int > x1
+    j0 = < int > y0
+    j1 = < int > y1
+    if (i0 == i1) and (j0 == j1):
+        res = <float> data[i0 * width + j0]
+    elif i0 == i1:
+        res = (<float> data[i0 * width + j0] * (y1 - d1)) + (<float> data[i0 * width + j1] * (d1 - y0))
+    elif j0 == j1:
+        res = (<float> data[i0 * width + j0] * (x1 - d0)) + (<float> data[i1 * width + j0] * (d0 - x0))
+    else:
+        res = (<float> data[i0 * width + j0] * (x1 - d0) * (y1 - d1))  \
+            + (<float> data[i1 * width + j0] * (d0 - x0) * (y1 - d1))  \
+            + (<float> data[i0 * width + j1] * (x1 - d0) * (d1 - y0))  \
+            + (<float> data[i1 * width + j1] * (d0 - x0) * (d1 - y0))
+    return res
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _extrema(const data_t[:, ::1] data, float *mini, float *maxi) nogil:
+    """Single pass computation of the minimum and maximum of data.
+
+    Both are NaN if data contains NaN.
+    """
+    cdef:
+        Py_ssize_t i, j
+        data_t value, lower, upper
+    lower = upper = data[0, 0]
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            value = data[i, j]
+            if value != value:
+                mini[0] = maxi[0] = <float> value
+                return
+            if value < lower:
+                lower = value
+            elif value > upper:
+                upper = value
+    mini[0] = <float> lower
+    maxi[0] = <float> upper
+
+
+@cython.cdivision(True)
+cdef int _line_geometry(float src_row, float src_col,
+                        float dst_row, float dst_col,
+                        int linewidth, int n_points, float[::1] geometry):
+    """Compute the sampling of a scan line as done by
+    :meth:`BilinearImage.profile_line`.
+
+    :param int n_points: Number of points of the profile,
+        if <= 0, the default number of points is used
+    :param geometry: Filled with (start row, start column, step row,
+        step column, row width, column width)
+    :return: The number of points of the profile
+    """
+    cdef:
+        float d_row, d_col, length, row_width, col_width
+        int lengt
+    d_row = dst_row - src_row
+    d_col = dst_col - src_col
+    if (d_row == 0) and (d_col == 0):
+        geometry[0] = src_row
+        geometry[1] = src_col
+        geometry[2] = geometry[3] = geometry[4] = geometry[5] = 0
+        return n_points if n_points > 0 else 1
+
+    # Offsets to deal with linewidth
+    length = sqrt(d_row * d_row + d_col * d_col)
+    row_width = d_col / length
+    col_width = - d_row / length
+
+    lengt = <int> ceil(length + 1)
+    if n_points > 0:
+        lengt = n_points
+    if lengt > 1:
+        d_row /= <float> (lengt -1)
+        d_col /= <float> (lengt -1)
+    else:
+        d_row = d_col = 0
+
+    # Offset position to the center of the bottom pixels of the profile
+    src_row -= row_width * (linewidth - 1) / 2.
+    src_col -= col_width * (linewidth - 1) / 2.
+    geometry[0] = src_row
+    geometry[1] = src_col
+    geometry[2] = d_row
+    geometry[3] = d_col
+    geometry[4] = row_width
+    geometry[5] = col_width
+    return lengt
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _profile_lines(const data_t[:, :, ::1] stack,
+                         const float[:, ::1] geometry,
+                         int linewidth, float[:, :, ::1] result,
+                         int num_threads) nogil:
+    """Compute the profiles of all the lines in all the frames of stack.
+
+    One (frame, line) profile is computed per iteration of the parallel loop.
+    """
+    cdef:
+        Py_ssize_t n_lines = geometry.shape[0]
+        Py_ssize_t n_points = result.shape[2]
+        Py_ssize_t task, frame, line
+        size_t height = stack.shape[1]
+        size_t width = stack.shape[2]
+        int i, j, cnt
+        float sum, row, col, new_row, new_col
+    if height == 0 or width == 0:
+        return
+    for task in prange(stack.shape[0] * n_lines, schedule="guided",
+                       num_threads=num_threads):
+        frame = task // n_lines
+        line = task % n_lines
+        for i in range(n_points):
+            sum = 0
+            cnt = 0
+
+            row = geometry[line, 0] + i * geometry[line, 2]
+            col = geometry[line, 1] + i * geometry[line, 3]
+
+            for j in range(linewidth):
+                new_row = row + j * geometry[line, 4]
+                new_col = col + j * geometry[line, 5]
+                if ((new_col >= 0) and (new_col < width) and
+                        (new_row >= 0) and (new_row < height)):
+                    cnt = cnt + 1
+                    sum = sum + _interpolate(&stack[frame, 0, 0],
+                                             width, height, new_col, new_row)
+            if cnt:
+                result[frame, line, i] = sum / cnt
+
+
+def profile_lines(data, src_array, dst_array, int linewidth=1,
+                  n_points=None, num_threads=None):
+    """profile_lines(data, src_array, dst_array, linewidth=1, n_points=None, num_threads=None)
+
+    Return the intensity profiles of an image or a stack of images
+    along many scan lines.
+
+    Profiles are sampled as in :meth:`BilinearImage.profile_line`, except
+    that all of them have the same number of points.
+    They are computed in parallel, one profile per thread.
+
+    :param data: An image (2D) or a stack of images (3D, first dimension
+        is the frame)
+    :param src_array: The start point (row, column) of the scan lines
+    :type src_array: (n_lines, 2) or (2,) array of numeric scalar
+    :param dst_array: The end point of the scan lines, included in the
+        profiles
+    :type dst_array: Same shape as src_array
+    :param int linewidth: Width of the scanlines (unit image pixel).
+    :param int n_points: Number of points of the profiles
+        (default: the number of points of the longest profile given by
+        :meth:`BilinearImage.profile_line`).
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs). The result does not depend on the number of threads.
+    :return: The profiles as float32, of shape (n_lines, n_points) for an
+        image or (n_frames, n_lines, n_points) for a stack. The n_lines
+        dimension is dropped if src_array and dst_array are single points.
+    :raises ValueError: If the arguments do not have the expected shapes
+    """
+    cdef:
+        float[:, ::1] src, dst, geometry
+        float[:, :, ::1] result
+        Py_ssize_t line, n_lines
+        int c_n_points, lengt
+        int c_num_threads = _get_num_threads(num_threads)
+        const unsigned short[:, :, ::1] stack_u16
+        const int[:, :, ::1] stack_i32
+        const float[:, :, ::1] stack_f32
+        const double[:, :, ::1] stack_f64
+
+    data = _as_supported(data)
+    if data.ndim not in (2, 3):
+        raise ValueError("Expected an image (2D) or a stack of images (3D)")
+    src_array = numpy.asarray(src_array, dtype=numpy.float32)
+    dst_array = numpy.asarray(dst_array, dtype=numpy.float32)
+    if (src_array.shape != dst_array.shape or src_array.ndim not in (1, 2) or
+            src_array.shape[-1] != 2):
+        raise ValueError("src_array and dst_array must be (n_lines, 2) arrays")
+    src = numpy.ascontiguousarray(src_array.reshape(-1, 2))
+    dst = numpy.ascontiguousarray(dst_array.reshape(-1, 2))
+    n_lines = src.shape[0]
+
+    geometry = numpy.empty((n_lines, 6), dtype=numpy.float32)
+    if n_points is None:
+        c_n_points = 1
+        for line in range(n_lines):
+            lengt = _line_geometry(src[line, 0], src[line, 1],
+                                   dst[line, 0], dst[line, 1],
+                                   linewidth, 0, geometry[line])
+            c_n_points = max(c_n_points, lengt)
+    else:
+        c_n_points = n_points
+        if c_n_points < 1:
+            raise ValueError("n_points must be a positive integer")
+    for line in range(n_lines):
+        _line_geometry(src[line, 0], src[line, 1], dst[line, 0], dst[line, 1],
+                       linewidth, c_n_points, geometry[line])
+
+    stack = data.reshape((-1,) + data.shape[-2:])
+    result = numpy.zeros((stack.shape[0], n_lines, c_n_points),
+                         dtype=numpy.float32)
+    code = _DTYPE_CODES[stack.dtype]
+    if code == UINT16:
+        stack_u16 = stack
+        with nogil:
+            _profile_lines(stack_u16, geometry, linewidth, result, c_num_threads)
+    elif code == INT32:
+        stack_i32 = stack
+        with nogil:
+            _profile_lines(stack_i32, geometry, linewidth, result, c_num_threads)
+    elif code == FLOAT32:
+        stack_f32 = stack
+        with nogil:
+            _profile_lines(stack_f32, geometry, linewidth, result, c_num_threads)
+    else:
+        stack_f64 = stack
+        with nogil:
+            _profile_lines(stack_f64, geometry, linewidth, result, c_num_threads)
+
+    profiles = numpy.asarray(result)
+    if data.ndim == 2:
+        profiles = profiles[0]
+    if src_array.ndim == 1:
+        profiles = profiles[..., 0, :]
+    return profiles
+
+
 cdef class BilinearImage:
     """Bilinear interpolator for images ... or any data on a regular grid
+
+    Images of type uint16, int32, float32 and float64 are used in place
+    when C-contiguous; other types are converted to float32.
     """
     cdef:
-        readonly float[:, ::1] data
-        readonly float maxi, mini
+        readonly object data
         readonly size_t width, height
+        const unsigned short[:, ::1] data_u16
+        const int[:, ::1] data_i32
+        const float[:, ::1] data_f32
+        const double[:, ::1] data_f64
+        int dtype_code
+        bint has_extrema
+        float c_maxi, c_mini
 
     cpdef size_t coarse_local_maxi(self, size_t)
     cdef size_t c_local_maxi(self, size_t) nogil
+    cdef int c_refine(self, size_t, double *, double *) nogil
     cdef float c_funct(self, float, float) nogil
+    cdef float c_value(self, int, int) nogil
 
     def __cinit__(self, data not None):
         """ Constructor
 
         :param data: image as a 2D array    
         """
+        data = _as_supported(data)
         assert data.ndim == 2
         self.height = data.shape[0]
         self.width = data.shape[1]
-        self.maxi = data.max()
-        self.mini = data.min()
-        self.data = numpy.ascontiguousarray(data, dtype=numpy.float32)
-    
+        self.dtype_code = _DTYPE_CODES[data.dtype]
+        if self.dtype_code == UINT16:
+            self.data_u16 = data
+        elif self.dtype_code == INT32:
+            self.data_i32 = data
+        elif self.dtype_code == FLOAT32:
+            self.data_f32 = data
+        else:
+            self.data_f64 = data
+        self.data = data
+        self.has_extrema = False
+
     def __dealloc__(self):
         self.data = None
 
+    def _update_extrema(self):
+        """Compute the minimum and maximum of the image if not yet done"""
+        if self.has_extrema:
+            return
+        if self.width == 0 or self.height == 0:
+            raise ValueError("Empty image has no minimum nor maximum")
+        with nogil:
+            if self.dtype_code == UINT16:
+                _extrema(self.data_u16, &self.c_mini, &self.c_maxi)
+            elif self.dtype_code == INT32:
+                _extrema(self.data_i32, &self.c_mini, &self.c_maxi)
+            elif self.dtype_code == FLOAT32:
+                _extrema(self.data_f32, &self.c_mini, &self.c_maxi)
+            else:
+                _extrema(self.data_f64, &self.c_mini, &self.c_maxi)
+        self.has_extrema = True
+
+    @property
+    def maxi(self):
+        """Maximum value of the image (computed on first access)"""
+        self._update_extrema()
+        return self.c_maxi
+
+    @property
+    def mini(self):
+        """Minimum value of the image (computed on first access)"""
+        self._update_extrema()
+        return self.c_mini
+
     def __call__(self, coord):
         """Function f((y, x)) where f is a continuous function 
         made from the image and (y,x)=(row, column) is the pixel coordinates 
@@ -72,9 +425,9 @@ cdef class BilinearImage:
         :return: Interpolated signal from the image 
         """
         return self.c_funct(coord[1], coord[0])
-   
+
     @cython.boundscheck(False)
-    @cython.wraparound(False)            
+    @cython.wraparound(False)
     cdef float c_funct(self, float x, float y) nogil:
         """Function f(x, y) where f is a continuous function 
         made from the image.
@@ -85,33 +438,31 @@ cdef class BilinearImage:
 
         Cython only function due to NOGIL 
         """
-        cdef:
-            float d0 = min(max(y, 0.0), (self.height - 1.0))
-            float d1 = min(max(x, 0.0), (self.width - 1.0))
-            int i0, i1, j0, j1
-            float x0, x1, y0, y1, res
-            
-        x0 = floor(d0)
-        x1 = ceil(d0)
-        y0 = floor(d1)
-        y1 = ceil(d1)
-        i0 = < int > x0
-        i1 = < int > x1
-        j0 = < int > y0
-        j1 = < int > y1
-        if (i0 == i1) and (j0 == j1):
-            res = self.data[i0, j0]
-        elif i0 == i1:
-            res = (self.data[i0, j0] * (y1 - d1)) + (self.data[i0, j1] * (d1 - y0))
-        elif j0 == j1:
-            res = (self.data[i0, j0] * (x1 - d0)) + (self.data[i1, j0] * (d0 - x0))
+        if self.dtype_code == FLOAT32:
+            return _interpolate(&self.data_f32[0, 0], self.width, self.height, x, y)
+        elif self.dtype_code == UINT16:
+            return _interpolate(&self.data_u16[0, 0], self.width, self.height, x, y)
+        elif self.dtype_code == INT32:
+            return _interpolate(&self.data_i32[0, 0], self.width, self.height, x, y)
         else:
-            res = (self.data[i0, j0] * (x1 - d0) * (y1 - d1))  \
-                + (self.data[i1, j0] * (d0 - x0) * (y1 - d1))  \
-                + (self.data[i0, j1] * (x1 - d0) * (d1 - y0))  \
-                + (self.data[i1, j1] * (d0 - x0) * (d1 - y0))
-        return res
-    
+            return _interpolate(&self.data_f64[0, 0], self.width, self.height, x, y)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef float c_value(self, int row, int column) nogil:
+        """Value of the pixel at (row, column) as float
+
+        Cython only function due to NOGIL
+        """
+        if self.dtype_code == FLOAT32:
+            return self.data_f32[row, column]
+        elif self.dtype_code == UINT16:
+            return self.data_u16[row, column]
+        elif self.dtype_code == INT32:
+            return self.data_i32[row, column]
+        else:
+            return <float> self.data_f64[row, column]
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
     def opp_f(self, coord):
@@ -160,51 +511,116 @@ cdef class BilinearImage:
         :return: 2-tuple of float with the nearest local maximum
         """
         cdef:
-            int res, current0, current1
+            double row, column
+            int status
+        status = self.c_refine(self.c_local_maxi(round(coord[0]) * self.width + round(coord[1])),
+                               &row, &column)
+        if status == REFINE_SINGULAR:
+            logger.debug("Singular determinant, Hessian undefined")
+        elif status == REFINE_FAILED:
+            logger.debug("Failed to find root using second order expansion")
+        return (row, column)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def local_maxi_many(self, coords, num_threads=None):
+        """local_maxi_many(self, coords, num_threads=None)
+
+        Return the nearest local maximum of many starting points, with
+        sub-pixel refinement, see :meth:`local_maxi`.
+
+        The starting points are processed in parallel.
+
+        :param coords: (n, 2) array of starting points (row, column),
+            clipped to the image
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs)
+        :return: The (n, 2) float64 array of the refined positions
+            (row, column) and the (n,) float32 array of the interpolated
+            values at these positions
+        """
+        cdef:
+            Py_ssize_t[::1] start
+            double[:, ::1] positions
+            float[::1] values
+            Py_ssize_t i
+            int c_num_threads = _get_num_threads(num_threads)
+        coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+        if self.width == 0 or self.height == 0:
+            raise ValueError("Cannot search maxima in an empty image")
+        rows = numpy.clip(numpy.round(coords[:, 0]), 0, self.height - 1)
+        columns = numpy.clip(numpy.round(coords[:, 1]), 0, self.width - 1)
+        start = (rows * self.width + columns).astype(numpy.intp)
+        positions = numpy.empty((start.shape[0], 2), dtype=numpy.float64)
+        values = numpy.empty(start.shape[0], dtype=numpy.float32)
+        for i in prange(start.shape[0], nogil=True, schedule="guided",
+                        num_threads=c_num_threads):
+            self.c_refine(self.c_local_maxi(start[i]),
+                          &positions[i, 0], &positions[i, 1])
+            values[i] = self.c_funct(positions[i, 1], positions[i, 0])
+        return numpy.asarray(positions), numpy.asarray(values)
+
+    @cython.cdivision(True)
+    cdef int c_refine(self, size_t idx, double *row, double *column) nogil:
+        """Sub-pixel refinement of the position of a local maximum
+
+        :param idx: index of the local maximum (=row*width+column)
+        :param row: Where to store the refined row
+        :param column: Where to store the refined column
+        :return: REFINE_TAYLOR, REFINE_SINGULAR or REFINE_FAILED (the center
+            of mass is then used) or REFINE_NONE at the border of the image
+
+        This method is Cython only due to the NOGIL
+        """
+        cdef:
+            int current0, current1, status
             int i0, i1
             float tmp, sum0 = 0, sum1 = 0, sum = 0
             float a00, a01, a02, a10, a11, a12, a20, a21, a22
-            float d00, d11, d01, denom, delta0, delta1        
-        res = self.c_local_maxi(round(coord[0]) * self.width + round(coord[1]))
-
-        current0 = res // self.width
-        current1 = res % self.width
+            float d00, d11, d01, denom, delta0, delta1
+        current0 = idx // self.width
+        current1 = idx % self.width
+        row[0] = current0
+        column[0] = current1
         if (current0 > 0) and (current0 < self.height - 1) and (current1 > 0) and (current1 < self.width - 1):
             # Use second order polynomial Taylor expansion
-            a00 = self.data[current0 - 1, current1 - 1]
-            a01 = self.data[current0 - 1, current1    ]
-            a02 = self.data[current0 - 1, current1 + 1]
-            a10 = self.data[current0    , current1 - 1]
-            a11 = self.data[current0    , current1    ]
-            a12 = self.data[current0    , current1 + 1]
-            a20 = self.data[current0 + 1, current1 - 1]
-            a21 = self.data[current0 + 1, current1    ]
-            a22 = self.data[current0 + 1, current1 - 1]
+            a00 = self.c_value(current0 - 1, current1 - 1)
+            a01 = self.c_value(current0 - 1, current1    )
+            a02 = self.c_value(current0 - 1, current1 + 1)
+            a10 = self.c_value(current0    , current1 - 1)
+            a11 = self.c_value(current0    , current1    )
+            a12 = self.c_value(current0    , current1 + 1)
+            a20 = self.c_value(current0 + 1, current1 - 1)
+            a21 = self.c_value(current0 + 1, current1    )
+            a22 = self.c_value(current0 + 1, current1 - 1)
             d00 = a12 - 2.0 * a11 + a10
             d11 = a21 - 2.0 * a11 + a01
             d01 = (a00 - a02 - a20 + a22) / 4.0
             denom = 2.0 * (d00 * d11 - d01 * d01)
-            if abs(denom) < 1e-10:
-                logger.debug("Singular determinant, Hessian undefined")
+            if fabs(denom) < 1e-10:
+                status = REFINE_SINGULAR
             else:
                 delta0 = ((a12 - a10) * d01 + (a01 - a21) * d11) / denom
                 delta1 = ((a10 - a12) * d00 + (a21 - a01) * d01) / denom
-                if abs(delta0) <= 1.0 and abs(delta1) <= 1.0:
+                if fabs(delta0) <= 1.0 and fabs(delta1) <= 1.0:
                     # Result is OK if lower than 0.5.
-                    return (delta0 + float(current0), delta1 + float(current1))
+                    row[0] = delta0 + <double> current0
+                    column[0] = delta1 + <double> current1
+                    return REFINE_TAYLOR
                 else:
-                    logger.debug("Failed to find root using second order expansion")
+                    status = REFINE_FAILED
             # refinement of the position by a simple center of mass of the last valid region used
             for i0 in range(current0 - 1, current0 + 2):
                 for i1 in range(current1 - 1, current1 + 2):
-                    tmp = self.data[i0, i1]
+                    tmp = self.c_value(i0, i1)
                     sum0 += tmp * i0
                     sum1 += tmp * i1
                     sum += tmp
             if sum > 0:
-                return (sum0 / sum, sum1 / sum)
-                
-        return (float(current0), float(current1))
+                row[0] = sum0 / sum
+                column[0] = sum1 / sum
+            return status
+        return REFINE_NONE
 
     cpdef size_t coarse_local_maxi(self, size_t x):
         """coarse_local_maxi(self, idx)
@@ -234,7 +650,7 @@ cdef class BilinearImage:
             int i0, i1, start0, stop0, start1, stop1, new0, new1
             float tmp, value, old_value
 
-        value = self.data[current0, current1]
+        value = self.c_value(current0, current1)
         old_value = value - 1.0
         new0, new1 = current0, current1
 
@@ -246,7 +662,7 @@ cdef class BilinearImage:
             stop1 = min(self.width, current1 + 2)
             for i0 in range(start0, stop0):
                 for i1 in range(start1, stop1):
-                    tmp = self.data[i0, i1]
+                    tmp = self.c_value(i0, i1)
                     if tmp > value:
                         new0, new1 = i0, i1
                         value = tmp
@@ -254,31 +670,37 @@ cdef class BilinearImage:
         return self.width * current0 + current1
 
     @cython.boundscheck(False)
-    def map_coordinates(self, coordinates):
-        """map_coordinates(self, coordinates)
+    @cython.wraparound(False)
+    def map_coordinates(self, coordinates, num_threads=None):
+        """map_coordinates(self, coordinates, num_threads=None)
 
         Map coordinates of the array on the image
 
+        The result does not depend on the number of threads.
+
         :param coordinates: 2-tuple of array of the same size (row_array, column_array) 
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs)
         :return: array of values at given coordinates
         """
         cdef:
-            float[:] d0, d1, res
-            size_t size, i
+            float[::1] d0, d1, res
+            Py_ssize_t size, i
+            int c_num_threads = _get_num_threads(num_threads)
         shape = coordinates[0].shape
         size = coordinates[0].size
         d0 = numpy.ascontiguousarray(coordinates[0].ravel(), dtype=numpy.float32)
         d1 = numpy.ascontiguousarray(coordinates[1].ravel(), dtype=numpy.float32)
         assert size == d1.size
         res = numpy.empty(size, dtype=numpy.float32)
-        with nogil:
-            for i in range(size):
-                res[i] = self.c_funct(d1[i], d0[i])
+        for i in prange(size, nogil=True, schedule="static",
+                        num_threads=c_num_threads):
+            res[i] = self.c_funct(d1[i], d0[i])
         return numpy.asarray(res).reshape(shape)  
     
     @cython.boundscheck(False)
-    def profile_line(self, src, dst, int linewidth=1):
-        """profile_line(self, src, dst, linewidth=1)
+    def profile_line(self, src, dst, int linewidth=1, num_threads=None):
+        """profile_line(self, src, dst, linewidth=1, num_threads=None)
 
         Return the intensity profile of an image measured along a scan line.
 
@@ -289,6 +711,8 @@ cdef class BilinearImage:
             in contrast to standard numpy indexing.
         :type dst: 2-tuple of numeric scalar
         :param int linewidth: Width of the scanline (unit image pixel).
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs). The result does not depend on the number of threads.
         :return: The intensity profile along the scan line.
             The length of the profile is the ceil of the computed length
             of the scan line.
@@ -301,6 +725,7 @@ cdef class BilinearImage:
             float length, col_width, row_width, sum, row, col, new_row, new_col
             int lengt, i, j, cnt
             float[::1] result
+            int c_num_threads = _get_num_threads(num_threads)
         src_row, src_col = src
         dst_row, dst_col = dst
         if (src_row == dst_row) and (src_col == dst_col):
@@ -324,23 +749,455 @@ cdef class BilinearImage:
         src_row -= row_width * (linewidth - 1) / 2.
         src_col -= col_width * (linewidth - 1) / 2.
 
-        with nogil:
-            for i in range(lengt):
-                sum = 0
-                cnt = 0
-
-                row = src_row + i * d_row
-                col = src_col + i * d_col
-
-                for j in range(linewidth):
-                    new_row = row + j * row_width
-                    new_col = col + j * col_width
-                    if ((new_col >= 0) and (new_col < self.width) and
-                            (new_row >= 0) and (new_row < self.height)):
-                        cnt = cnt + 1
-                        sum = sum + self.c_funct(new_col, new_row)
-                if cnt:
-                    result[i] += sum / cnt
+        # Each point of the profile is computed independently
+        for i in prange(lengt, nogil=True, schedule="static",
+                        num_threads=c_num_threads):
+            sum = 0
+            cnt = 0
+
+            row = src_row + i * d_row
+            col = src_col + i * d_col
+
+            for j in range(linewidth):
+                new_row = row + j * row_width
+                new_col = col + j * col_width
+                if ((new_col >= 0) and (new_col < self.width) and
+                        (new_row >= 0) and (new_row < self.height)):
+                    cnt = cnt + 1
+                    sum = sum + self.c_funct(new_col, new_row)
+            if cnt:
+                result[i] = sum / cnt
 
         # Ensures the result is exported as numpy array and not memory view.
         return numpy.asarray(result)
+
+    def profile_lines(self, src_array, dst_array, int linewidth=1,
+                      n_points=None, num_threads=None):
+        """profile_lines(self, src_array, dst_array, linewidth=1, n_points=None, num_threads=None)
+
+        Return the intensity profiles of the image along many scan lines.
+
+        See :func:`profile_lines` for the description of the arguments.
+
+        :return: The profiles as a (n_lines, n_points) float32 array
+        """
+        return profile_lines(self.data, src_array, dst_array, linewidth,
+                             n_points, num_threads)
+
+
+def track_local_maxi(stack, coords, num_threads=None):
+    """track_local_maxi(stack, coords, num_threads=None)
+
+    Follow local maxima through a stack of images.
+
+    In each frame, the local maxima are searched with
+    :meth:`BilinearImage.local_maxi_many` starting from their position in
+    the previous frame.
+
+    :param stack: Stack of images (3D, first dimension is the frame)
+    :param coords: (n, 2) array of the starting points (row, column)
+        in the first frame
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: The (n_frames, n, 2) float64 array of the positions
+        (row, column) and the (n_frames, n) float32 array of the values
+        of the maxima in each frame
+    :raises ValueError: If stack is not 3D
+    """
+    stack = _as_supported(stack)
+    if stack.ndim != 3:
+        raise ValueError("Expected a stack of images (3D)")
+    coords = numpy.asarray(coords, dtype=numpy.float64).reshape(-1, 2)
+    positions = numpy.empty((stack.shape[0],) + coords.shape, numpy.float64)
+    values = numpy.empty(positions.shape[:2], numpy.float32)
+    for frame in range(stack.shape[0]):
+        coords, values[frame] = BilinearImage(stack[frame]).local_maxi_many(
+            coords, num_threads)
+        positions[frame] = coords
+    return positions, values
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _remap(const data_t[:, ::1] stack, const int[:, ::1] indices,
+                 const float[:, ::1] weights, float[:, ::1] output,
+                 int num_threads) nogil:
+    """Apply the remapping tables to all the frames of stack.
+
+    :param stack: Flattened frames, one per row
+    :param output: Flattened remapped frames, one per row
+    """
+    cdef:
+        Py_ssize_t n_pixels = indices.shape[0]
+        Py_ssize_t task, frame, i
+        const data_t *frame_data
+    for task in prange(stack.shape[0] * n_pixels, schedule="static",
+                       num_threads=num_threads):
+        frame = task // n_pixels
+        i = task % n_pixels
+        frame_data = &stack[frame, 0]
+        output[frame, i] = (weights[i, 0] * frame_data[indices[i, 0]] +
+                            weights[i, 1] * frame_data[indices[i, 1]] +
+                            weights[i, 2] * frame_data[indices[i, 2]] +
+                            weights[i, 3] * frame_data[indices[i, 3]])
+
+
+cdef class Remapper:
+    """Precomputed bilinear interpolation of images at fixed coordinates
+
+    The 4 source pixels and their weights are computed once per output
+    pixel, so that applying the same geometric transformation to many
+    frames is a single weighted sum per output pixel.
+    Coordinates outside the image are clipped to its border, as in
+    :meth:`BilinearImage.map_coordinates`.
+    Output pixels with non-finite coordinates are set to 0.
+
+    :param shape: Shape (height, width) of the images to remap
+    :param coordinates: 2-tuple of array of the same shape
+        (row_array, column_array) of the output pixels in the images
+    """
+    cdef:
+        readonly tuple shape, output_shape
+        readonly object indices, weights
+
+    def __init__(self, shape, coordinates):
+        height, width = shape
+        if height < 1 or width < 1:
+            raise ValueError("Images to remap must not be empty")
+        if height * width > numpy.iinfo(numpy.int32).max:
+            raise ValueError("Images to remap are too large")
+        rows = numpy.asarray(coordinates[0], dtype=numpy.float32)
+        columns = numpy.asarray(coordinates[1], dtype=numpy.float32)
+        if rows.shape != columns.shape:
+            raise ValueError("Row and column coordinates must have the same shape")
+        self.shape = (int(height), int(width))
+        self.output_shape = rows.shape
+
+        rows = rows.ravel()
+        columns = columns.ravel()
+        invalid = numpy.logical_not(numpy.logical_and(numpy.isfinite(rows),
+                                                      numpy.isfinite(columns)))
+        d0 = numpy.clip(numpy.where(invalid, 0, rows), 0, height - 1)
+        d1 = numpy.clip(numpy.where(invalid, 0, columns), 0, width - 1)
+        i0 = numpy.floor(d0)
+        j0 = numpy.floor(d1)
+        f0 = d0 - i0
+        f1 = d1 - j0
+        i0 = i0.astype(numpy.int32)
+        j0 = j0.astype(numpy.int32)
+        i1 = numpy.minimum(i0 + 1, height - 1)
+        j1 = numpy.minimum(j0 + 1, width - 1)
+
+        indices = numpy.empty((d0.size, 4), dtype=numpy.int32)
+        indices[:, 0] = i0 * width + j0
+        indices[:, 1] = i1 * width + j0
+        indices[:, 2] = i0 * width + j1
+        indices[:, 3] = i1 * width + j1
+        weights = numpy.empty((d0.size, 4), dtype=numpy.float32)
+        weights[:, 0] = (1 - f0) * (1 - f1)
+        weights[:, 1] = f0 * (1 - f1)
+        weights[:, 2] = (1 - f0) * f1
+        weights[:, 3] = f0 * f1
+        weights[invalid] = 0
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def load(cls, filename):
+        """load(filename)
+
+        Load remapping tables saved with :meth:`save`
+
+        :param str filename: Name of the .npz file
+        :return: A :class:`Remapper`
+        :raises ValueError: If the tables are not consistent
+        """
+        cdef Remapper remapper = cls.__new__(cls)
+        with numpy.load(filename) as tables:
+            remapper.shape = tuple(int(i) for i in tables["shape"])
+            remapper.output_shape = tuple(int(i) for i in tables["output_shape"])
+            remapper.indices = numpy.ascontiguousarray(tables["indices"],
+                                                       dtype=numpy.int32)
+            remapper.weights = numpy.ascontiguousarray(tables["weights"],
+                                                       dtype=numpy.float32)
+        indices = remapper.indices
+        if (len(remapper.shape) != 2 or
+                indices.ndim != 2 or indices.shape[1] != 4 or
+                indices.shape != remapper.weights.shape or
+                indices.shape[0] != numpy.prod(remapper.output_shape)):
+            raise ValueError("Inconsistent remapping tables in %s" % filename)
+        # indices are used without bound checking by apply
+        if indices.size and (indices.min() < 0 or indices.max() >=
+                             remapper.shape[0] * remapper.shape[1]):
+            raise ValueError("Remapping indices out of the images in %s" %
+                             filename)
+        return remapper
+
+    def save(self, filename):
+        """save(filename)
+
+        Save the remapping tables in a numpy .npz file
+
+        :param str filename: Name of the file
+        """
+        numpy.savez(filename, shape=self.shape, output_shape=self.output_shape,
+                    indices=self.indices, weights=self.weights)
+
+    def apply(self, data, output=None, num_threads=None):
+        """apply(data, output=None, num_threads=None)
+
+        Remap an image or a stack of images
+
+        :param data: An image (2D) or a stack of images (3D, first dimension
+            is the frame) of shape :attr:`shape`
+        :param output: Optional float32 C-contiguous array where to store
+            the result
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs). The result does not depend on the number of threads.
+        :return: The remapped data as float32, of shape :attr:`output_shape`
+            for an image or (n_frames,) + :attr:`output_shape` for a stack
+        :raises ValueError: If data or output do not have the expected shape
+        """
+        cdef:
+            float[:, ::1] c_output
+            const int[:, ::1] indices = self.indices
+            const float[:, ::1] weights = self.weights
+            int c_num_threads = _get_num_threads(num_threads)
+            const unsigned short[:, ::1] stack_u16
+            const int[:, ::1] stack_i32
+            const float[:, ::1] stack_f32
+            const double[:, ::1] stack_f64
+
+        data = _as_supported(data)
+        if data.ndim not in (2, 3) or data.shape[-2:] != self.shape:
+            raise ValueError("Expected images of shape %s" % (self.shape,))
+        out_shape = data.shape[:-2] + self.output_shape
+        if output is None:
+            output = numpy.empty(out_shape, dtype=numpy.float32)
+        elif (output.shape != out_shape or output.dtype != numpy.float32 or
+                not output.flags.c_contiguous):
+            raise ValueError("output must be a C-contiguous float32 array of "
+                             "shape %s" % (out_shape,))
+        stack = data.reshape(-1, self.shape[0] * self.shape[1])
+        c_output = output.reshape(stack.shape[0], indices.shape[0])
+        code = _DTYPE_CODES[stack.dtype]
+        if code == UINT16:
+            stack_u16 = stack
+            with nogil:
+                _remap(stack_u16, indices, weights, c_output,
+                       c_num_threads)
+        elif code == INT32:
+            stack_i32 = stack
+            with nogil:
+                _remap(stack_i32, indices, weights, c_output,
+                       c_num_threads)
+        elif code == FLOAT32:
+            stack_f32 = stack
+            with nogil:
+                _remap(stack_f32, indices, weights, c_output,
+                       c_num_threads)
+        else:
+            stack_f64 = stack
+            with nogil:
+                _remap(stack_f64, indices, weights, c_output,
+                       c_num_threads)
+        return output
+
+
+ctypedef fused out_t:
+    unsigned short
+    int
+    float
+    double
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _affine_transform(const data_t[:, :, ::1] stack,
+                            out_t[:, :, ::1] output,
+                            double m00, double m01, double m10, double m11,
+                            double offset0, double offset1,
+                            int order, double cval, int num_threads) nogil:
+    """Apply an affine transform to all the frames of stack.
+
+    The pixel (i, j) of an output frame is interpolated at
+    (m00 * i + m01 * j + offset0, m10 * i + m11 * j + offset1) in the
+    input frame.
+    """
+    cdef:
+        size_t height = stack.shape[1]
+        size_t width = stack.shape[2]
+        Py_ssize_t out_height = output.shape[1]
+        Py_ssize_t task, frame, i, j
+        const data_t *frame_data
+        double row, col, value
+    for task in prange(stack.shape[0] * out_height, schedule="static",
+                       num_threads=num_threads):
+        frame = task // out_height
+        i = task % out_height
+        frame_data = &stack[frame, 0, 0]
+        for j in range(output.shape[2]):
+            row = m00 * i + m01 * j + offset0
+            col = m10 * i + m11 * j + offset1
+            if not (-0.5 <= row and row < height - 0.5 and
+                    -0.5 <= col and col < width - 0.5):
+                value = cval
+            elif order == 0:
+                value = frame_data[<Py_ssize_t> floor(row + 0.5) * width +
+                                   <Py_ssize_t> floor(col + 0.5)]
+            else:
+                value = _interpolate(frame_data, width, height, col, row)
+
+            if out_t is float or out_t is double:
+                output[frame, i, j] = <out_t> value
+            elif out_t is int:
+                output[frame, i, j] = <int> floor(
+                    min(max(value, -2147483648.), 2147483647.) + 0.5)
+            else:
+                output[frame, i, j] = <unsigned short> floor(
+                    min(max(value, 0.), 65535.) + 0.5)
+
+
+def _transform(const data_t[:, :, ::1] stack, out_t[:, :, ::1] output,
+               matrix, offset, int order, double cval, int num_threads):
+    """Dispatch _affine_transform on the types of stack and output"""
+    cdef:
+        double m00 = matrix[0, 0], m01 = matrix[0, 1]
+        double m10 = matrix[1, 0], m11 = matrix[1, 1]
+        double offset0 = offset[0], offset1 = offset[1]
+    with nogil:
+        _affine_transform(stack, output, m00, m01, m10, m11,
+                          offset0, offset1, order, cval, num_threads)
+
+
+def affine_transform(data, matrix, offset=(0., 0.), output_shape=None,
+                     output=None, order=1, cval=0., dtype=None,
+                     num_threads=None):
+    """affine_transform(data, matrix, offset=(0., 0.), output_shape=None, output=None, order=1, cval=0., dtype=None, num_threads=None)
+
+    Apply an affine transform to an image or a stack of images.
+
+    The value of output pixel o = (row, col) is interpolated at position
+    ``matrix . o + offset`` of the input image, as in
+    ``scipy.ndimage.affine_transform``.
+    Positions outside the pixels of the input image, i.e., outside
+    [-0.5, height - 0.5[ x [-0.5, width - 0.5[, are set to cval.
+    Bilinear interpolation uses the kernel of :class:`BilinearImage`.
+
+    :param data: An image (2D) or a stack of images (3D, first dimension
+        is the frame). The same transform is applied to all frames,
+        in parallel.
+    :param matrix: 2x2 matrix of the transform from output to input
+        coordinates (row, col)
+    :param offset: (row, col) offset of the transform
+    :param output_shape: (height, width) of the output images
+        (default: the shape of the input images)
+    :param output: C-contiguous uint16, int32, float32 or float64 array
+        where to store the result, it defines output_shape and dtype
+    :param int order: 0 for nearest pixel, 1 for bilinear interpolation
+    :param float cval: Value of the pixels outside the input image
+    :param dtype: uint16, int32, float32 or float64 type of the result
+        (default: the type of data if supported, float32 otherwise).
+        Values are rounded and clipped for integer types.
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: The transformed image or stack
+    :raises ValueError: If the arguments are not consistent
+    """
+    data = _as_supported(data)
+    if data.ndim not in (2, 3):
+        raise ValueError("Expected an image (2D) or a stack of images (3D)")
+    if order not in (0, 1):
+        raise ValueError("Only order 0 (nearest) and 1 (bilinear) are supported")
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+    offset = numpy.asarray(offset, dtype=numpy.float64)
+    if matrix.shape != (2, 2) or offset.shape != (2,):
+        raise ValueError("matrix must be 2x2 and offset a (row, col) pair")
+
+    if output is None:
+        if output_shape is None:
+            output_shape = data.shape[-2:]
+        if dtype is None:
+            dtype = data.dtype
+        output = numpy.empty(data.shape[:-2] + tuple(output_shape),
+                             dtype=dtype)
+        if output.dtype not in _DTYPE_CODES:
+            raise ValueError("Unsupported output type %s" % output.dtype)
+    elif (output.ndim != data.ndim or output.shape[:-2] != data.shape[:-2] or
+            output.dtype not in _DTYPE_CODES or
+            not output.flags.c_contiguous):
+        raise ValueError("output must be a C-contiguous uint16, int32, "
+                         "float32 or float64 array with %d dimensions" %
+                         data.ndim)
+
+    stack = data.reshape((-1,) + data.shape[-2:])
+    if stack.shape[1] > 0 and stack.shape[2] > 0:
+        _transform(stack, output.reshape((-1,) + output.shape[-2:]),
+                   matrix, offset, order, cval, _get_num_threads(num_threads))
+    else:
+        output[...] = cval
+    return output
+
+
+def rotate(data, angle, center=None, order=1, cval=0., output=None,
+           dtype=None, num_threads=None):
+    """rotate(data, angle, center=None, order=1, cval=0., output=None, dtype=None, num_threads=None)
+
+    Rotate an image or a stack of images, keeping their shape.
+
+    See :func:`affine_transform` for the other arguments.
+
+    :param float angle: Rotation angle in degrees, counterclockwise when
+        displayed with row 0 at the top
+    :param center: (row, col) center of the rotation
+        (default: center of the image)
+    """
+    shape = numpy.shape(data)[-2:]
+    if center is None:
+        center = (shape[0] - 1) / 2., (shape[1] - 1) / 2.
+    angle = numpy.radians(angle)
+    cos_a, sin_a = numpy.cos(angle), numpy.sin(angle)
+    matrix = numpy.array(((cos_a, sin_a), (-sin_a, cos_a)))
+    center = numpy.asarray(center, dtype=numpy.float64)
+    offset = center - numpy.dot(matrix, center)
+    return affine_transform(data, matrix, offset, order=order, cval=cval,
+                            output=output, dtype=dtype,
+                            num_threads=num_threads)
+
+
+def zoom(data, factor, order=1, cval=0., output=None, dtype=None,
+         num_threads=None):
+    """zoom(data, factor, order=1, cval=0., output=None, dtype=None, num_threads=None)
+
+    Scale an image or a stack of images.
+
+    The output has round(factor * shape) pixels, the edges of the first
+    and last pixels of the input and output images are aligned.
+    See :func:`affine_transform` for the other arguments.
+
+    :param factor: Scaling factor, or (row factor, col factor)
+    """
+    shape = numpy.array(numpy.shape(data)[-2:])
+    factor = numpy.ones(2) * factor
+    output_shape = numpy.maximum(numpy.round(shape * factor), 1).astype(int)
+    scale = shape / output_shape.astype(numpy.float64)
+    return affine_transform(data, numpy.diag(scale), 0.5 * scale - 0.5,
+                            output_shape=tuple(output_shape), order=order,
+                            cval=cval, output=output, dtype=dtype,
+                            num_threads=num_threads)
+
+
+def shift(data, offset, order=1, cval=0., output=None, dtype=None,
+          num_threads=None):
+    """shift(data, offset, order=1, cval=0., output=None, dtype=None, num_threads=None)
+
+    Translate an image or a stack of images, keeping their shape.
+
+    See :func:`affine_transform` for the other arguments.
+
+    :param offset: (row, col) translation
+    """
+    return affine_transform(data, numpy.identity(2),
+                            - numpy.asarray(offset, dtype=numpy.float64),
+                            order=order, cval=cval, output=output,
+                            dtype=dtype, num_threads=num_threads)
@@ -0,0 +1,322 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides connected components analysis of images.
+
+- :func:`label` labels the connected components of a mask, using
+  union-find.
+- :func:`flood_fill` labels the pixels connected to seed points which
+  have a value close to the value of the seed ("magic wand" selection).
+
+Both return an int32 label image, where 0 is the background and component
+i is labelled i + 1, and a dictionary of per-component tables:
+
+- ``area``: number of pixels, (n,) array
+- ``bbox``: (row_min, row_max, col_min, col_max) with max excluded,
+  (n, 4) array
+- ``centroid``: mean (row, col) position of the pixels, (n, 2) array
+
+Connectivity is either 4 (pixels sharing an edge) or 8 (pixels sharing an
+edge or a corner).
+
+The whole module uses the (row, col) (i.e., (y, x))) convention
+for 2D coordinates.
+"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+cimport cython
+from libc.stdlib cimport malloc, realloc, free
+from libc.math cimport fabs
+import numpy
+
+
+ctypedef fused data_t:
+    unsigned char
+    unsigned short
+    int
+    float
+    double
+
+_SUPPORTED_TYPES = (numpy.uint8, numpy.uint16, numpy.intc,
+                    numpy.float32, numpy.float64)
+
+
+def _check_connectivity(connectivity):
+    if connectivity not in (4, 8):
+        raise ValueError("connectivity must be 4 or 8")
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline int _find(int *parent, int index) nogil:
+    """Return the root of index, halving the path on the way"""
+    while parent[index] != index:
+        parent[index] = parent[parent[index]]
+        index = parent[index]
+    return index
+
+
+cdef inline void _union(int *parent, int first, int second) nogil:
+    """Merge the trees of first and second, the root with the lowest index
+    becomes the root of both.
+    """
+    first = _find(parent, first)
+    second = _find(parent, second)
+    if first < second:
+        parent[second] = first
+    elif second < first:
+        parent[first] = second
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _label(const unsigned char[:, ::1] mask, int[:, ::1] labels,
+                int connectivity) nogil:
+    """Label the connected components of mask in labels
+
+    labels is used as the union-find forest (index of the parent pixel)
+    before being relabelled in place.
+
+    :return: The number of components
+    """
+    cdef:
+        int height = mask.shape[0], width = mask.shape[1]
+        int *parent = &labels[0, 0]
+        int row, col, index, count = 0
+
+    # Build the union-find forest, parent index is always lower than index
+    for row in range(height):
+        for col in range(width):
+            index = row * width + col
+            if not mask[row, col]:
+                parent[index] = -1
+                continue
+            parent[index] = index
+            if col > 0 and mask[row, col - 1]:
+                _union(parent, index, index - 1)
+            if row > 0:
+                if mask[row - 1, col]:
+                    _union(parent, index, index - width)
+                if connectivity == 8:
+                    if col > 0 and mask[row - 1, col - 1]:
+                        _union(parent, index, index - width - 1)
+                    if col < width - 1 and mask[row - 1, col + 1]:
+                        _union(parent, index, index - width + 1)
+
+    # Relabel in raster order: parents are processed before their children
+    for index in range(height * width):
+        if parent[index] == -1:
+            parent[index] = 0
+        elif parent[index] == index:
+            count += 1
+            parent[index] = count
+        else:
+            parent[index] = parent[parent[index]]
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int _flood_fill(const data_t[:, ::1] image, int[:, ::1] labels,
+                     int seed_row, int seed_col, double tolerance,
+                     int connectivity, int label) nogil:
+    """Set to label the pixels of labels connected to the seed, with a value
+    in [seed value - tolerance, seed value + tolerance] and not yet labelled.
+
+    :return: 0 on success, -1 if memory allocation failed
+    """
+    cdef:
+        int height = image.shape[0], width = image.shape[1]
+        Py_ssize_t size = 0, capacity = 1024
+        int *stack
+        int *new_stack
+        int row, col, new_row, new_col, drow, dcol
+        double reference = image[seed_row, seed_col]
+
+    if labels[seed_row, seed_col] != 0 or reference != reference:
+        return 0
+    stack = <int *> malloc(2 * capacity * sizeof(int))
+    if stack == NULL:
+        return -1
+    labels[seed_row, seed_col] = label
+    stack[0] = seed_row
+    stack[1] = seed_col
+    size = 1
+    while size > 0:
+        size -= 1
+        row = stack[2 * size]
+        col = stack[2 * size + 1]
+        for drow in range(-1, 2):
+            for dcol in range(-1, 2):
+                if (drow == 0 and dcol == 0) or (
+                        connectivity == 4 and drow != 0 and dcol != 0):
+                    continue
+                new_row = row + drow
+                new_col = col + dcol
+                if (new_row < 0 or new_row >= height or
+                        new_col < 0 or new_col >= width or
+                        labels[new_row, new_col] != 0 or
+                        not fabs(image[new_row, new_col] - reference) <= tolerance):
+                    continue
+                labels[new_row, new_col] = label
+                if size == capacity:
+                    capacity *= 2
+                    new_stack = <int *> realloc(stack,
+                                                2 * capacity * sizeof(int))
+                    if new_stack == NULL:
+                        free(stack)
+                        return -1
+                    stack = new_stack
+                stack[2 * size] = new_row
+                stack[2 * size + 1] = new_col
+                size += 1
+    free(stack)
+    return 0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _properties(int[:, ::1] labels, int count):
+    """Compute area, bounding box and centroid of the components
+
+    :param labels: Label image
+    :param int count: Number of components
+    :return: dict of tables, see module documentation
+    """
+    cdef:
+        long long[::1] area = numpy.zeros(count, dtype=numpy.int64)
+        int[:, ::1] bbox = numpy.zeros((count, 4), dtype=numpy.int32)
+        double[:, ::1] centroid = numpy.zeros((count, 2), dtype=numpy.float64)
+        int row, col, label
+
+    with nogil:
+        for row in range(labels.shape[0]):
+            for col in range(labels.shape[1]):
+                label = labels[row, col] - 1
+                if label < 0 or label >= count:
+                    continue
+                if area[label] == 0:
+                    bbox[label, 0] = row
+                    bbox[label, 2] = col
+                    bbox[label, 3] = col + 1
+                bbox[label, 1] = row + 1
+                bbox[label, 2] = min(bbox[label, 2], col)
+                bbox[label, 3] = max(bbox[label, 3], col + 1)
+                area[label] += 1
+                centroid[label, 0] += row
+                centroid[label, 1] += col
+
+    area_array = numpy.asarray(area)
+    centroid_array = numpy.asarray(centroid)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        centroid_array /= area_array[:, numpy.newaxis]
+    return {"area": area_array,
+            "bbox": numpy.asarray(bbox),
+            "centroid": centroid_array}
+
+
+def label(mask, connectivity=4):
+    """label(mask, connectivity=4)
+
+    Label the connected components of a mask.
+
+    Components are numbered in the order of their first pixel in C order.
+
+    :param mask: 2D array, non-zero pixels are the ones to label
+    :param int connectivity: 4 or 8
+    :return: The int32 label image and the dict of area, bbox and centroid
+        tables of the components
+    :raises ValueError: If mask is not 2D or connectivity is not supported
+    """
+    cdef:
+        unsigned char[:, ::1] c_mask
+        int[:, ::1] labels
+        int c_connectivity = connectivity
+        int count = 0
+
+    _check_connectivity(connectivity)
+    mask = numpy.asarray(mask)
+    if mask.ndim != 2:
+        raise ValueError("Expected a 2D mask")
+    if mask.size >= 2 ** 31:
+        raise ValueError("Mask is too large")
+    c_mask = numpy.ascontiguousarray(mask != 0, dtype=numpy.uint8)
+    labels = numpy.zeros(mask.shape, dtype=numpy.int32)
+    if mask.size > 0:
+        with nogil:
+            count = _label(c_mask, labels, c_connectivity)
+    return numpy.asarray(labels), _properties(labels, count)
+
+
+def _fill(const data_t[:, ::1] image, int[:, ::1] labels, seeds,
+          double tolerance, int connectivity):
+    """Flood fill of all the seeds, see :func:`flood_fill`"""
+    cdef int label, row, col, status = 0
+    for label, (row, col) in enumerate(seeds, 1):
+        if 0 <= row < image.shape[0] and 0 <= col < image.shape[1]:
+            with nogil:
+                status = _flood_fill(image, labels, row, col, tolerance,
+                                     connectivity, label)
+            if status != 0:
+                raise MemoryError("Cannot allocate flood fill stack")
+
+
+def flood_fill(image, seeds, tolerance=0., connectivity=4):
+    """flood_fill(image, seeds, tolerance=0., connectivity=4)
+
+    Label the pixels connected to seed points with a close value.
+
+    The component of a seed contains the pixels connected to it through
+    pixels whose value differs from the value of the seed by at most
+    tolerance. Seeds are processed in order, pixels belonging to the
+    component of a previous seed are not considered by the next ones.
+    Seeds outside the image or on NaN give empty components.
+
+    :param image: 2D array
+    :param seeds: (row, col) of the seed, or list of seeds
+    :param float tolerance: Maximum difference with the value of the seed
+    :param int connectivity: 4 or 8
+    :return: The int32 label image, where the component of seed i is
+        labelled i + 1, and the dict of area, bbox and centroid tables of
+        the components, one per seed
+    :raises ValueError: If image is not 2D or connectivity is not supported
+    """
+    _check_connectivity(connectivity)
+    image = numpy.asarray(image)
+    if image.ndim != 2:
+        raise ValueError("Expected a 2D image")
+    for dtype in _SUPPORTED_TYPES:
+        if image.dtype == dtype:
+            image = numpy.ascontiguousarray(image)
+            break
+    else:
+        image = numpy.ascontiguousarray(image, dtype=numpy.float64)
+    seeds = numpy.array(seeds, dtype=numpy.int64).reshape(-1, 2)
+
+    labels = numpy.zeros(image.shape, dtype=numpy.int32)
+    _fill(image, labels, seeds.tolist(), tolerance, connectivity)
+    return labels, _properties(labels, len(seeds))
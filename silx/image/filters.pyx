@@ -0,0 +1,594 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides order-statistics filters of images and stacks.
+
+- :func:`median_filter`, :func:`minimum_filter` and :func:`maximum_filter`
+  compute the median, minimum or maximum over a sliding window centered on
+  each pixel of an image, e.g., to remove hot pixels or to estimate a
+  background.
+- :func:`temporal_median` computes the median of each pixel along the
+  first axis of a stack of images.
+
+NaN and masked pixels are ignored: the result is computed from the valid
+pixels only and is NaN where there is none.
+The median of an even number of values is the mean of the 2 middle ones.
+Windows are truncated at the borders of the image.
+
+Results are float32, or float64 for float64 and 32 or 64 bits integer data.
+All filters are multi-threaded.
+
+The whole module uses the (row, col) (i.e., (y, x))) convention
+for 2D coordinates.
+"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+cimport cython
+from cython.parallel import prange
+from libc.math cimport NAN, isnan
+from libc.stdlib cimport malloc, free, qsort
+import multiprocessing
+import numpy
+
+
+ctypedef fused data_t:
+    unsigned char
+    unsigned short
+    int
+    long long
+    float
+    double
+
+ctypedef fused out_t:
+    float
+    double
+
+_SUPPORTED_TYPES = (numpy.uint8, numpy.uint16, numpy.int32, numpy.int64,
+                    numpy.float32, numpy.float64)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _select(double *values, Py_ssize_t count, Py_ssize_t k) nogil:
+    """Returns the k-th smallest value, partially sorting values in place
+    (Wirth's selection algorithm).
+
+    After the call, values[k:] are greater or equal to values[k].
+    """
+    cdef:
+        Py_ssize_t left = 0, right = count - 1, i, j
+        double pivot, tmp
+    while left < right:
+        pivot = values[k]
+        i = left
+        j = right
+        while True:
+            while values[i] < pivot:
+                i += 1
+            while pivot < values[j]:
+                j -= 1
+            if i <= j:
+                tmp = values[i]
+                values[i] = values[j]
+                values[j] = tmp
+                i += 1
+                j -= 1
+            if i > j:
+                break
+        if j < k:
+            left = i
+        if k < i:
+            right = j
+    return values[k]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double _median(double *values, Py_ssize_t count) nogil:
+    """Returns the median of values, NaN if count is 0"""
+    cdef:
+        Py_ssize_t i
+        double lower, upper
+    if count == 0:
+        return NAN
+    upper = _select(values, count, count // 2)
+    if count % 2 == 1:
+        return upper
+    # Even count: lower middle value is the maximum of values[:count // 2]
+    lower = values[0]
+    for i in range(1, count // 2):
+        if values[i] > lower:
+            lower = values[i]
+    return 0.5 * (lower + upper)
+
+
+cdef int _compare(const void *first, const void *second) nogil:
+    """Comparison of doubles for qsort"""
+    cdef double a = (<double *> first)[0], b = (<double *> second)[0]
+    return (a > b) - (a < b)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _sort(double *values, Py_ssize_t count) nogil:
+    """Sort values in place, insertion sort for short arrays"""
+    cdef:
+        Py_ssize_t i, j
+        double value
+    if count > 32:
+        qsort(values, count, sizeof(double), _compare)
+        return
+    for i in range(1, count):
+        value = values[i]
+        j = i
+        while j > 0 and values[j - 1] > value:
+            values[j] = values[j - 1]
+            j -= 1
+        values[j] = value
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _merge(double *window, Py_ssize_t count,
+                       double *values, Py_ssize_t nvalues,
+                       double *out) nogil:
+    """Merge sorted values into sorted window, result is stored in out
+
+    :return: The number of values in out
+    """
+    cdef Py_ssize_t i = 0, j = 0, k = 0
+    while i < count and j < nvalues:
+        if window[i] <= values[j]:
+            out[k] = window[i]
+            i += 1
+        else:
+            out[k] = values[j]
+            j += 1
+        k += 1
+    while i < count:
+        out[k] = window[i]
+        i += 1
+        k += 1
+    while j < nvalues:
+        out[k] = values[j]
+        j += 1
+        k += 1
+    return k
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _remove(double *window, Py_ssize_t count,
+                        double *values, Py_ssize_t nvalues) nogil:
+    """Remove sorted values from sorted window in place
+
+    :return: The number of values left in window
+    """
+    cdef Py_ssize_t i, j = 0, k = 0
+    for i in range(count):
+        if j < nvalues and window[i] == values[j]:
+            j += 1
+        else:
+            window[k] = window[i]
+            k += 1
+    return k
+
+
+cdef inline void _sort2(double *values, int i, int j) nogil:
+    """Sort values[i] and values[j] in place"""
+    cdef double a = values[i], b = values[j]
+    values[i] = a if a < b else b
+    values[j] = b if a < b else a
+
+
+cdef double _median9(double *values) nogil:
+    """Returns the median of 9 values with a sorting network of 19
+    comparisons (values are modified)
+    """
+    _sort2(values, 1, 2)
+    _sort2(values, 4, 5)
+    _sort2(values, 7, 8)
+    _sort2(values, 0, 1)
+    _sort2(values, 3, 4)
+    _sort2(values, 6, 7)
+    _sort2(values, 1, 2)
+    _sort2(values, 4, 5)
+    _sort2(values, 7, 8)
+    _sort2(values, 0, 3)
+    _sort2(values, 5, 8)
+    _sort2(values, 4, 7)
+    _sort2(values, 3, 6)
+    _sort2(values, 1, 4)
+    _sort2(values, 2, 5)
+    _sort2(values, 4, 7)
+    _sort2(values, 4, 2)
+    _sort2(values, 6, 4)
+    _sort2(values, 4, 2)
+    return values[4]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _median_row3x3(const data_t[:, :] data,
+                         const unsigned char[:, :] mask, bint has_mask,
+                         out_t[:, ::1] output, Py_ssize_t row) nogil:
+    """Median over a window of 3 x 3 pixels for one row of the output
+
+    The window is stored on the stack of this function to be private to
+    the calling thread.
+    """
+    cdef:
+        Py_ssize_t nrows = data.shape[0], ncols = data.shape[1]
+        Py_ssize_t col, i, j, count
+        double value
+        double values[9]
+
+    for col in range(ncols):
+        if (not has_mask and 0 < row < nrows - 1 and
+                0 < col < ncols - 1):
+            # Fast path: full window without mask
+            for i in range(3):
+                for j in range(3):
+                    values[3 * i + j] = data[row + i - 1, col + j - 1]
+            count = 9
+            if data_t is float or data_t is double:
+                for i in range(9):
+                    if isnan(values[i]):
+                        count = 0
+            if count == 9:
+                output[row, col] = <out_t> _median9(values)
+                continue
+
+        count = 0
+        for i in range(max(row - 1, 0), min(row + 2, nrows)):
+            for j in range(max(col - 1, 0), min(col + 2, ncols)):
+                if has_mask and mask[i, j]:
+                    continue
+                value = data[i, j]
+                if not isnan(value):
+                    values[count] = value
+                    count = count + 1
+        if count == 9:
+            output[row, col] = <out_t> _median9(values)
+        else:
+            output[row, col] = <out_t> _median(values, count)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _median_filter3x3(const data_t[:, :] data,
+                      const unsigned char[:, :] mask, bint has_mask,
+                      out_t[:, ::1] output, int num_threads):
+    """Median over a window of 3 x 3 pixels
+
+    Windows with 9 valid pixels use a sorting network.
+    """
+    cdef Py_ssize_t row
+
+    for row in prange(data.shape[0], nogil=True, schedule="static",
+                      num_threads=num_threads):
+        _median_row3x3(data, mask, has_mask, output, row)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _median_filter(const data_t[:, :] data, const unsigned char[:, :] mask,
+                   bint has_mask, out_t[:, ::1] output,
+                   int height, int width, int num_threads):
+    """Median over a window of height x width pixels
+
+    For each row of the output, the columns of the window are sorted once,
+    then the sorted window slides along the row by merging the incoming
+    column and removing the outgoing one, in linear time.
+    """
+    cdef:
+        Py_ssize_t nrows = data.shape[0], ncols = data.shape[1]
+        Py_ssize_t row, col, i, j, count, nvalid, n_failed = 0
+        Py_ssize_t row_start, row_stop, col_start, col_stop
+        Py_ssize_t window_start, window_stop
+        double value
+        double *columns
+        double *window
+        double *merged
+        double *swap
+        Py_ssize_t *counts
+
+    for row in prange(nrows, nogil=True, schedule="guided",
+                      num_threads=num_threads):
+        columns = <double *> malloc(height * ncols * sizeof(double))
+        counts = <Py_ssize_t *> malloc(ncols * sizeof(Py_ssize_t))
+        # Incoming column is merged before the outgoing one is removed
+        window = <double *> malloc(height * (width + 1) * sizeof(double))
+        merged = <double *> malloc(height * (width + 1) * sizeof(double))
+        if (columns == NULL or counts == NULL or window == NULL or
+                merged == NULL):
+            n_failed += 1
+        else:
+            # Sorted valid values of each column of the window
+            row_start = max(row - height // 2, 0)
+            row_stop = min(row - height // 2 + height, nrows)
+            for j in range(ncols):
+                nvalid = 0
+                for i in range(row_start, row_stop):
+                    if has_mask and mask[i, j]:
+                        continue
+                    value = data[i, j]
+                    if not isnan(value):
+                        columns[j * height + nvalid] = value
+                        nvalid = nvalid + 1
+                counts[j] = nvalid
+                _sort(&columns[j * height], nvalid)
+
+            count = 0
+            window_start = 0
+            window_stop = 0
+            for col in range(ncols):
+                col_start = max(col - width // 2, 0)
+                col_stop = min(col - width // 2 + width, ncols)
+                while window_stop < col_stop:
+                    count = _merge(window, count,
+                                   &columns[window_stop * height],
+                                   counts[window_stop], merged)
+                    swap = window
+                    window = merged
+                    merged = swap
+                    window_stop = window_stop + 1
+                while window_start < col_start:
+                    count = _remove(window, count,
+                                    &columns[window_start * height],
+                                    counts[window_start])
+                    window_start = window_start + 1
+
+                if count == 0:
+                    output[row, col] = <out_t> NAN
+                elif count % 2 == 1:
+                    output[row, col] = <out_t> window[count // 2]
+                else:
+                    output[row, col] = <out_t> (
+                        0.5 * (window[count // 2 - 1] + window[count // 2]))
+
+        free(merged)
+        free(window)
+        free(counts)
+        free(columns)
+    if n_failed:
+        raise MemoryError()
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _extremum_filter(const data_t[:, :] data, const unsigned char[:, :] mask,
+                     bint has_mask, out_t[:, ::1] output,
+                     int height, int width, bint is_max, int num_threads):
+    """Minimum or maximum over a window of height x width pixels
+
+    The filter is separable: the extremum is computed along rows, then
+    along columns of the intermediate result.
+    """
+    cdef:
+        double[:, ::1] tmp = numpy.empty((data.shape[0], data.shape[1]),
+                                         dtype=numpy.float64)
+        Py_ssize_t row, col, i, j, start, stop
+        double value, extremum
+
+    for row in prange(data.shape[0], nogil=True, schedule="static",
+                      num_threads=num_threads):
+        for col in range(data.shape[1]):
+            start = max(col - width // 2, 0)
+            stop = min(col - width // 2 + width, data.shape[1])
+            extremum = NAN
+            for j in range(start, stop):
+                if has_mask and mask[row, j]:
+                    continue
+                value = data[row, j]
+                if isnan(extremum) or (
+                        value > extremum if is_max else value < extremum):
+                    extremum = value
+            tmp[row, col] = extremum
+
+    for row in prange(data.shape[0], nogil=True, schedule="static",
+                      num_threads=num_threads):
+        start = max(row - height // 2, 0)
+        stop = min(row - height // 2 + height, data.shape[0])
+        for col in range(data.shape[1]):
+            extremum = NAN
+            for i in range(start, stop):
+                value = tmp[i, col]
+                if isnan(extremum) or (
+                        value > extremum if is_max else value < extremum):
+                    extremum = value
+            output[row, col] = <out_t> extremum
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _temporal_median(const data_t[:, :, :] stack,
+                     const unsigned char[:, :, :] mask, bint has_mask,
+                     out_t[:, ::1] output, int num_threads):
+    """Median along the first axis, processed row by row"""
+    cdef:
+        Py_ssize_t nframes = stack.shape[0], width = stack.shape[2]
+        Py_ssize_t row, col, frame, n_failed = 0
+        Py_ssize_t *counts
+        double *values
+        double value
+
+    for row in prange(stack.shape[1], nogil=True, schedule="static",
+                      num_threads=num_threads):
+        values = <double *> malloc(nframes * width * sizeof(double))
+        counts = <Py_ssize_t *> malloc(width * sizeof(Py_ssize_t))
+        if values == NULL or counts == NULL:
+            n_failed += 1
+        else:
+            for col in range(width):
+                counts[col] = 0
+            # Gather frame by frame to read contiguous memory
+            for frame in range(nframes):
+                for col in range(width):
+                    if has_mask and mask[frame, row, col]:
+                        continue
+                    value = stack[frame, row, col]
+                    if not isnan(value):
+                        values[col * nframes + counts[col]] = value
+                        counts[col] += 1
+            for col in range(width):
+                output[row, col] = <out_t> _median(&values[col * nframes],
+                                                   counts[col])
+        free(counts)
+        free(values)
+    if n_failed:
+        raise MemoryError()
+
+
+def _as_supported(data):
+    """Return data as an array with a type supported by the kernels"""
+    data = numpy.asarray(data)
+    if data.dtype == numpy.bool_:
+        return data.view(numpy.uint8)
+    for dtype in _SUPPORTED_TYPES:
+        if data.dtype == dtype and data.dtype.byteorder in ('=', '|'):
+            return data
+    if data.dtype.kind in 'biu' and data.dtype.itemsize <= 4:
+        return data.astype(numpy.int64)
+    if data.dtype.kind == 'f' and data.dtype.itemsize <= 4:
+        return data.astype(numpy.float32)
+    return data.astype(numpy.float64)
+
+
+def _prepare(data, mask, ndim, num_threads):
+    """Check and convert arguments of the filters
+
+    :return: data, mask, has_mask, output array, number of threads
+    """
+    data = _as_supported(data)
+    if data.ndim != ndim:
+        raise ValueError("Expected a %dD array" % ndim)
+    has_mask = mask is not None
+    if has_mask:
+        mask = numpy.asarray(mask).astype(numpy.bool_, copy=False)
+        try:
+            mask = numpy.broadcast_to(mask, data.shape)
+        except ValueError:
+            raise ValueError("mask shape does not match data shape")
+        mask = mask.view(numpy.uint8)
+    else:
+        mask = numpy.zeros((1,) * ndim, dtype=numpy.uint8)
+
+    if data.dtype == numpy.float64 or (data.dtype.kind in 'iu' and
+                                       data.dtype.itemsize >= 4):
+        dtype = numpy.float64
+    else:
+        dtype = numpy.float32
+    output = numpy.empty(data.shape[-2:], dtype=dtype)
+
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    return data, mask, has_mask, output, max(1, num_threads)
+
+
+def _window(size):
+    """Returns the (height, width) of a window"""
+    height, width = numpy.broadcast_to(numpy.asarray(size, dtype=int), (2,))
+    if height < 1 or width < 1:
+        raise ValueError("Window size must be positive")
+    return int(height), int(width)
+
+
+def median_filter(data, size=3, mask=None, num_threads=None):
+    """median_filter(data, size=3, mask=None, num_threads=None)
+
+    Median filter of an image.
+
+    :param data: 2D array
+    :param size: (height, width) or size of the window
+    :param mask: Optional array of the shape of data,
+        pixels where mask is not 0 are ignored
+    :param int num_threads: Number of threads to use
+        (default: the number of CPUs)
+    :return: 2D array of the shape of data
+    :raises ValueError: If data is not 2D, mask shape does not match or
+        size is not positive
+    """
+    height, width = _window(size)
+    data, mask, has_mask, output, num_threads = _prepare(
+        data, mask, 2, num_threads)
+    if (height, width) == (3, 3):
+        _median_filter3x3(data, mask, has_mask, output, num_threads)
+    else:
+        _median_filter(data, mask, has_mask, output, height, width,
+                       num_threads)
+    return output
+
+
+def minimum_filter(data, size=3, mask=None, num_threads=None):
+    """minimum_filter(data, size=3, mask=None, num_threads=None)
+
+    Minimum filter of an image.
+
+    See :func:`median_filter` for the parameters.
+    """
+    height, width = _window(size)
+    data, mask, has_mask, output, num_threads = _prepare(
+        data, mask, 2, num_threads)
+    _extremum_filter(data, mask, has_mask, output, height, width, False,
+                     num_threads)
+    return output
+
+
+def maximum_filter(data, size=3, mask=None, num_threads=None):
+    """maximum_filter(data, size=3, mask=None, num_threads=None)
+
+    Maximum filter of an image.
+
+    See :func:`median_filter` for the parameters.
+    """
+    height, width = _window(size)
+    data, mask, has_mask, output, num_threads = _prepare(
+        data, mask, 2, num_threads)
+    _extremum_filter(data, mask, has_mask, output, height, width, True,
+                     num_threads)
+    return output
+
+
+def temporal_median(stack, mask=None, num_threads=None):
+    """temporal_median(stack, mask=None, num_threads=None)
+
+    Median of each pixel along the first axis of a stack of images.
+
+    :param stack: 3D array of images
+    :param mask: Optional array broadcastable to the shape of stack
+        (e.g., one mask for all images), pixels where mask is not 0 are
+        ignored
+    :param int num_threads: Number of threads to use
+        (default: the number of CPUs)
+    :return: 2D array of the shape of the images
+    :raises ValueError: If stack is not 3D or mask shape does not match
+    """
+    stack, mask, has_mask, output, num_threads = _prepare(
+        stack, mask, 3, num_threads)
+    _temporal_median(stack, mask, has_mask, output, num_threads)
+    return output
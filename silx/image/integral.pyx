@@ -0,0 +1,422 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides integral images (summed-area tables).
+
+:class:`IntegralImage` computes, in one multi-threaded compiled pass,
+the tables of the cumulative sum and sum of squares of an image.
+The sum, mean and standard deviation over any rectangle of the image are
+then obtained in constant time, from 4 values of each table.
+
+Tables use 64-bit accumulators.
+Sums of integer images are accumulated in int64 and are exact as long as
+they fit in it.
+Sums of squares are only exact for 8 and 16-bit integer images, they are
+accumulated in float64 for wider integer types, whose squares may not fit
+in int64, as well as for floating point images.
+The standard deviation is computed from the difference of large sums of
+squares, so its absolute precision degrades with the size of the image
+for those types.
+
+Masked pixels and non-finite values are excluded from the statistics.
+In this case, a table of the number of valid pixels is also computed.
+
+Rectangles are given as (row_start, row_stop, col_start, col_stop),
+stop being excluded, and are clipped to the image.
+
+:func:`box_mean` and :func:`box_std` are sliding window filters built on
+integral images.
+
+The whole module uses the (row, col) (i.e., (y, x))) convention
+for 2D coordinates.
+"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+cimport cython
+from cython.parallel import prange
+from libc.math cimport isfinite
+import multiprocessing
+import numpy
+
+
+ctypedef fused data_t:
+    unsigned char
+    unsigned short
+    int
+    long long
+    float
+    double
+
+_SUPPORTED_TYPES = (numpy.uint8, numpy.uint16, numpy.int32, numpy.int64,
+                    numpy.float32, numpy.float64)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _integrate(const data_t[:, :] data,
+               const unsigned char[:, :] mask, bint has_mask,
+               long long[:, ::1] isums, long long[:, ::1] isquares,
+               double[:, ::1] fsums, double[:, ::1] fsquares,
+               bint exact_squares,
+               long long[:, ::1] counts, bint has_counts,
+               int num_threads):
+    """Fill the tables with the integral of data
+
+    Integer data are integrated in isums, floating point data in fsums.
+    Squares are integrated in isquares if exact_squares is True, which
+    requires integer data small enough for the sums of squares to fit in
+    int64, else in fsquares. Tables have one more row and column than data,
+    the first row and column being 0.
+
+    The first pass computes the cumulative sums along the rows in parallel
+    over rows, the second one along the columns in parallel over blocks of
+    columns so that memory is accessed row by row.
+    """
+    cdef:
+        Py_ssize_t height = data.shape[0], width = data.shape[1]
+        Py_ssize_t row, col, block, start, stop
+        Py_ssize_t block_size = 256
+        Py_ssize_t nblocks = (width + block_size - 1) // block_size
+        long long isum, isquare, count
+        double fsum, fsquare, value
+
+    for row in prange(height, nogil=True, schedule="static",
+                      num_threads=num_threads):
+        isum = 0
+        isquare = 0
+        fsum = 0.
+        fsquare = 0.
+        count = 0
+        for col in range(width):
+            if not (has_mask and mask[row, col]):
+                if data_t is float or data_t is double:
+                    value = data[row, col]
+                    if isfinite(value):
+                        fsum = fsum + value
+                        fsquare = fsquare + value * value
+                        count = count + 1
+                else:
+                    isum = isum + data[row, col]
+                    if exact_squares:
+                        isquare = isquare + (
+                            (<long long> data[row, col]) * data[row, col])
+                    else:
+                        value = data[row, col]
+                        fsquare = fsquare + value * value
+                    count = count + 1
+            if data_t is float or data_t is double:
+                fsums[row + 1, col + 1] = fsum
+            else:
+                isums[row + 1, col + 1] = isum
+            if exact_squares:
+                isquares[row + 1, col + 1] = isquare
+            else:
+                fsquares[row + 1, col + 1] = fsquare
+            if has_counts:
+                counts[row + 1, col + 1] = count
+
+    for block in prange(nblocks, nogil=True, schedule="static",
+                        num_threads=num_threads):
+        start = block * block_size + 1
+        stop = min(start + block_size, width + 1)
+        for row in range(2, height + 1):
+            for col in range(start, stop):
+                if data_t is float or data_t is double:
+                    fsums[row, col] += fsums[row - 1, col]
+                else:
+                    isums[row, col] += isums[row - 1, col]
+                if exact_squares:
+                    isquares[row, col] += isquares[row - 1, col]
+                else:
+                    fsquares[row, col] += fsquares[row - 1, col]
+                if has_counts:
+                    counts[row, col] += counts[row - 1, col]
+
+
+def _as_supported(data):
+    """Return data as an array with a type supported by the kernel"""
+    data = numpy.asarray(data)
+    if data.dtype == numpy.bool_:
+        return data.view(numpy.uint8)
+    for dtype in _SUPPORTED_TYPES:
+        if data.dtype == dtype and data.dtype.byteorder in ('=', '|'):
+            return data
+    if data.dtype.kind in 'biu' and data.dtype.itemsize <= 4:
+        return data.astype(numpy.int64)
+    if data.dtype.kind == 'f' and data.dtype.itemsize <= 4:
+        return data.astype(numpy.float32)
+    return data.astype(numpy.float64)
+
+
+def _get_num_threads(num_threads):
+    """Returns the number of threads to use"""
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    return max(1, num_threads)
+
+
+class IntegralImage(object):
+    """Summed-area tables of an image
+
+    :param data: 2D array of any numeric type
+    :param mask: Optional 2D array of the same shape as data,
+        the pixels where mask is not 0 are excluded
+    :param int num_threads: Number of threads to use to compute the tables
+        (default: the number of CPUs)
+    :raises ValueError: If data is not 2D or mask shape does not match
+    """
+
+    def __init__(self, data, mask=None, num_threads=None):
+        data = numpy.asarray(data)
+        # Squares of 8 and 16-bit integers can be summed exactly in int64
+        exact_squares = data.dtype.kind in 'biu' and data.dtype.itemsize <= 2
+        data = _as_supported(data)
+        if data.ndim != 2:
+            raise ValueError("Expected a 2D image")
+        self._shape = data.shape
+
+        has_mask = mask is not None
+        if has_mask:
+            mask = numpy.asarray(mask)
+            if mask.shape != data.shape:
+                raise ValueError("mask and data must have the same shape")
+            mask = mask.astype(numpy.bool_, copy=False).view(numpy.uint8)
+        else:
+            mask = numpy.zeros((1, 1), dtype=numpy.uint8)
+
+        table_shape = data.shape[0] + 1, data.shape[1] + 1
+        is_float = data.dtype.kind == 'f'
+        table_type = numpy.float64 if is_float else numpy.int64
+        self._sums = numpy.zeros(table_shape, dtype=table_type)
+        self._squares = numpy.zeros(
+            table_shape,
+            dtype=numpy.int64 if exact_squares else numpy.float64)
+
+        has_counts = has_mask or is_float
+        if has_counts:
+            counts = numpy.zeros(table_shape, dtype=numpy.int64)
+        else:
+            counts = numpy.zeros((1, 1), dtype=numpy.int64)
+
+        dummy_int = numpy.zeros((1, 1), dtype=numpy.int64)
+        dummy_float = numpy.zeros((1, 1), dtype=numpy.float64)
+        _integrate(data, mask, has_mask,
+                   dummy_int if is_float else self._sums,
+                   self._squares if exact_squares else dummy_int,
+                   self._sums if is_float else dummy_float,
+                   dummy_float if exact_squares else self._squares,
+                   exact_squares, counts, has_counts,
+                   _get_num_threads(num_threads))
+
+        # Only keep the table of counts if some pixels are excluded
+        if has_counts and counts[-1, -1] != data.size:
+            self._counts = counts
+        else:
+            self._counts = None
+
+    @property
+    def shape(self):
+        """Shape of the image"""
+        return self._shape
+
+    @property
+    def sums(self):
+        """Table of the cumulative sums, with a leading row and column of 0
+
+        ``sums[row, col]`` is the sum of ``data[:row, :col]``.
+        """
+        return self._sums
+
+    @property
+    def squares(self):
+        """Table of the cumulative sums of squares
+
+        int64 for 8 and 16-bit integer images, float64 otherwise.
+        See :attr:`sums`.
+        """
+        return self._squares
+
+    def _corners(self, rectangles):
+        """Returns clipped corners of rectangles
+
+        :return: 4 arrays: row_start, row_stop, col_start, col_stop
+        """
+        rectangles = numpy.array(rectangles, dtype=numpy.intp, ndmin=1)
+        if rectangles.shape[-1] != 4:
+            raise ValueError(
+                "Rectangles must be (row_start, row_stop, col_start, col_stop)")
+        height, width = self._shape
+        row_start = numpy.clip(rectangles[..., 0], 0, height)
+        row_stop = numpy.clip(rectangles[..., 1], row_start, height)
+        col_start = numpy.clip(rectangles[..., 2], 0, width)
+        col_stop = numpy.clip(rectangles[..., 3], col_start, width)
+        return row_start, row_stop, col_start, col_stop
+
+    @staticmethod
+    def _lookup(table, corners):
+        """Returns the sums of table over rectangles"""
+        row_start, row_stop, col_start, col_stop = corners
+        return (table[row_stop, col_stop] - table[row_start, col_stop] -
+                table[row_stop, col_start] + table[row_start, col_start])
+
+    def _count(self, corners):
+        """Returns the number of valid pixels in rectangles"""
+        if self._counts is not None:
+            return self._lookup(self._counts, corners)
+        row_start, row_stop, col_start, col_stop = corners
+        return (row_stop - row_start) * (col_stop - col_start)
+
+    def count(self, rectangles):
+        """Number of valid pixels in rectangles
+
+        :param rectangles: A rectangle
+            (row_start, row_stop, col_start, col_stop) or an array of
+            rectangles of shape (..., 4)
+        :return: The count or an array of counts of shape (...)
+        """
+        return self._count(self._corners(rectangles))
+
+    def sum(self, rectangles):
+        """Sum of the pixels in rectangles
+
+        :param rectangles: See :meth:`count`
+        :return: The sum or an array of sums (int64 for integer images)
+        """
+        return self._lookup(self._sums, self._corners(rectangles))
+
+    def mean(self, rectangles):
+        """Mean of the pixels in rectangles
+
+        :param rectangles: See :meth:`count`
+        :return: The mean or an array of means, NaN for empty rectangles
+        """
+        corners = self._corners(rectangles)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return (self._lookup(self._sums, corners) /
+                    numpy.asarray(self._count(corners), dtype=numpy.float64))
+
+    def std(self, rectangles):
+        """Standard deviation of the pixels in rectangles
+
+        :param rectangles: See :meth:`count`
+        :return: The standard deviation or an array of them,
+            NaN for empty rectangles
+        """
+        corners = self._corners(rectangles)
+        count = numpy.asarray(self._count(corners), dtype=numpy.float64)
+        total = self._lookup(self._sums, corners)
+        squares = self._lookup(self._squares, corners)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            variance = (squares - total * (total / count)) / count
+        return numpy.sqrt(numpy.maximum(variance, 0.))
+
+    def _windows(self, size):
+        """Returns the corners of the windows centered on each pixel
+
+        :param size: (height, width) or size of the window
+        """
+        size = numpy.broadcast_to(numpy.asarray(size, dtype=numpy.intp), (2,))
+        if numpy.any(size < 1):
+            raise ValueError("Window size must be positive")
+        height, width = self._shape
+        rows = numpy.arange(height) - size[0] // 2
+        cols = numpy.arange(width) - size[1] // 2
+        row_start = numpy.clip(rows, 0, height)[:, numpy.newaxis]
+        row_stop = numpy.clip(rows + size[0], 0, height)[:, numpy.newaxis]
+        col_start = numpy.clip(cols, 0, width)[numpy.newaxis, :]
+        col_stop = numpy.clip(cols + size[1], 0, width)[numpy.newaxis, :]
+        return row_start, row_stop, col_start, col_stop
+
+    def box_sum(self, size):
+        """Sum over a sliding window centered on each pixel
+
+        The window is truncated at the borders of the image.
+
+        :param size: (height, width) or size of the window
+        :return: 2D array of the shape of the image
+        """
+        return self._lookup(self._sums, self._windows(size))
+
+    def box_mean(self, size):
+        """Mean over a sliding window centered on each pixel
+
+        The window is truncated at the borders of the image,
+        NaN where the window has no valid pixel.
+
+        :param size: (height, width) or size of the window
+        :return: 2D float64 array of the shape of the image
+        """
+        corners = self._windows(size)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return (self._lookup(self._sums, corners) /
+                    numpy.asarray(self._count(corners), dtype=numpy.float64))
+
+    def box_std(self, size):
+        """Standard deviation over a sliding window centered on each pixel
+
+        See :meth:`box_mean`.
+
+        :param size: (height, width) or size of the window
+        :return: 2D float64 array of the shape of the image
+        """
+        corners = self._windows(size)
+        count = numpy.asarray(self._count(corners), dtype=numpy.float64)
+        total = self._lookup(self._sums, corners)
+        squares = self._lookup(self._squares, corners)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            variance = (squares - total * (total / count)) / count
+        return numpy.sqrt(numpy.maximum(variance, 0.))
+
+
+def box_mean(data, size, mask=None, num_threads=None):
+    """box_mean(data, size, mask=None, num_threads=None)
+
+    Mean filter of an image.
+
+    :param data: 2D array
+    :param size: (height, width) or size of the window
+    :param mask: Optional mask of excluded pixels, see :class:`IntegralImage`
+    :param int num_threads: Number of threads to use
+        (default: the number of CPUs)
+    :return: 2D float64 array of the shape of data
+    """
+    return IntegralImage(data, mask, num_threads).box_mean(size)
+
+
+def box_std(data, size, mask=None, num_threads=None):
+    """box_std(data, size, mask=None, num_threads=None)
+
+    Standard deviation filter of an image.
+
+    :param data: 2D array
+    :param size: (height, width) or size of the window
+    :param mask: Optional mask of excluded pixels, see :class:`IntegralImage`
+    :param int num_threads: Number of threads to use
+        (default: the number of CPUs)
+    :return: 2D float64 array of the shape of data
+    """
+    return IntegralImage(data, mask, num_threads).box_std(size)
@@ -0,0 +1,293 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides multi-resolution representations of images.
+
+- :func:`reduce2x` reduces an image by a factor 2 in both dimensions,
+  each pixel of the result being the mean, maximum, minimum or sum of a
+  block of 2x2 pixels.
+- :class:`ImagePyramid` provides the successive reductions of an image,
+  computed when first needed, and region queries at any level.
+
+Unlike strided subsampling, all pixels contribute to the reduced images:
+the maximum reduction keeps hot pixels visible at overview scale and the
+mean reduction avoids aliasing.
+
+Example, to display a region of a large image with at most 512x512 pixels:
+
+>>> pyramid = ImagePyramid(image, mode="max")
+>>> level, overview = pyramid.get_overview((0, 8000), (0, 8000), (512, 512))
+
+The whole module uses the (row, col) (i.e., (y, x))) convention
+for 2D coordinates.
+"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+cimport cython
+from cython.parallel import prange
+import multiprocessing
+import numpy
+
+
+ctypedef fused data_t:
+    unsigned char
+    unsigned short
+    int
+    float
+    double
+
+_SUPPORTED_TYPES = (numpy.uint8, numpy.uint16, numpy.intc,
+                    numpy.float32, numpy.float64)
+
+MODES = ("mean", "max", "min", "sum")
+"""Supported reduction modes"""
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _reduce_sum(const data_t[:, ::1] data, double[:, ::1] out,
+                      bint mean, int num_threads) nogil:
+    """Sum or mean of 2x2 blocks of data, incomplete blocks at the
+    borders only use the available pixels.
+    """
+    cdef:
+        Py_ssize_t height = data.shape[0], width = data.shape[1]
+        Py_ssize_t i, j, row, col
+        double total
+        int count
+    for i in prange(out.shape[0], schedule="static", num_threads=num_threads):
+        for j in range(out.shape[1]):
+            total = 0.
+            count = 0
+            for row in range(2 * i, min(2 * i + 2, height)):
+                for col in range(2 * j, min(2 * j + 2, width)):
+                    total = total + data[row, col]
+                    count = count + 1
+            if mean:
+                total = total / count
+            out[i, j] = total
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _reduce_extremum(const data_t[:, ::1] data, data_t[:, ::1] out,
+                           bint maximum, int num_threads) nogil:
+    """Maximum or minimum of 2x2 blocks of data, incomplete blocks at the
+    borders only use the available pixels.
+    """
+    cdef:
+        Py_ssize_t height = data.shape[0], width = data.shape[1]
+        Py_ssize_t i, j, row, col
+        data_t value, result
+    for i in prange(out.shape[0], schedule="static", num_threads=num_threads):
+        for j in range(out.shape[1]):
+            result = data[2 * i, 2 * j]
+            for row in range(2 * i, min(2 * i + 2, height)):
+                for col in range(2 * j, min(2 * j + 2, width)):
+                    value = data[row, col]
+                    if (value > result) if maximum else (value < result):
+                        result = value
+            out[i, j] = result
+
+
+def _reduce(const data_t[:, ::1] data, result, mode, int num_threads):
+    """Reduce a supported array into result, see :func:`reduce2x`"""
+    cdef:
+        double[:, ::1] sums
+        data_t[:, ::1] extrema
+        bint flag
+
+    if mode in ("mean", "sum"):
+        sums = result
+        flag = mode == "mean"
+        with nogil:
+            _reduce_sum(data, sums, flag, num_threads)
+    else:
+        extrema = result
+        flag = mode == "max"
+        with nogil:
+            _reduce_extremum(data, extrema, flag, num_threads)
+
+
+def reduce2x(data, mode="mean", num_threads=None):
+    """reduce2x(data, mode="mean", num_threads=None)
+
+    Reduce an image by a factor 2 in both dimensions.
+
+    Each pixel of the result is the mean, maximum, minimum or sum of a
+    block of 2x2 pixels of the image. For odd dimensions, the last blocks
+    only use the available pixels.
+
+    :param data: The image
+    :type data: 2D numpy.ndarray
+    :param str mode: The reduction: "mean", "max", "min" or "sum"
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: Array of shape ((height + 1) // 2, (width + 1) // 2).
+        For "max" and "min", it has the type of data if it is uint8,
+        uint16, int32, float32 or float64, float64 otherwise.
+        For "mean", it is float64 if data is float64, float32 otherwise.
+        For "sum", it is float64.
+    :raises ValueError: If data is not 2D or mode is not supported
+    """
+    data = numpy.asarray(data)
+    if data.ndim != 2:
+        raise ValueError("Expected a 2D image")
+    if mode not in MODES:
+        raise ValueError("Unsupported mode %s, use one of %s" % (mode, MODES))
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    num_threads = max(1, num_threads)
+
+    for dtype in _SUPPORTED_TYPES:
+        if data.dtype == dtype:
+            data = numpy.ascontiguousarray(data)
+            break
+    else:
+        data = numpy.ascontiguousarray(data, dtype=numpy.float64)
+
+    shape = (data.shape[0] + 1) // 2, (data.shape[1] + 1) // 2
+    if mode in ("mean", "sum"):
+        result = numpy.empty(shape, dtype=numpy.float64)
+    else:
+        result = numpy.empty(shape, dtype=data.dtype)
+    _reduce(data, result, mode, num_threads)
+    if mode == "mean" and data.dtype != numpy.float64:
+        result = result.astype(numpy.float32)
+    return result
+
+
+class ImagePyramid(object):
+    """Multi-resolution representation of an image.
+
+    Level 0 is the image, each level is the reduction of the previous one
+    by :func:`reduce2x`, up to a single pixel.
+    Levels are computed when first requested and kept.
+
+    :param data: The image
+    :type data: 2D numpy.ndarray
+    :param str mode: The reduction: "mean", "max", "min" or "sum"
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    """
+
+    def __init__(self, data, mode="mean", num_threads=None):
+        data = numpy.asarray(data)
+        if data.ndim != 2:
+            raise ValueError("Expected a 2D image")
+        if mode not in MODES:
+            raise ValueError("Unsupported mode %s, use one of %s" % (mode, MODES))
+        self._mode = mode
+        self._num_threads = num_threads
+        self._levels = [data]
+
+    @property
+    def mode(self):
+        """The reduction mode"""
+        return self._mode
+
+    @property
+    def nlevels(self):
+        """Number of levels, the last one being a single pixel"""
+        height, width = self._levels[0].shape
+        nlevels = 1
+        while height > 1 or width > 1:
+            height, width = (height + 1) // 2, (width + 1) // 2
+            nlevels += 1
+        return nlevels
+
+    def get_shape(self, level):
+        """Returns the shape of a level without computing it.
+
+        :param int level: The level, 0 for the image
+        :rtype: 2-tuple of int
+        """
+        self._check_level(level)
+        height, width = self._levels[0].shape
+        for _ in range(level):
+            height, width = (height + 1) // 2, (width + 1) // 2
+        return height, width
+
+    def _check_level(self, level):
+        if not 0 <= level < self.nlevels:
+            raise ValueError("level must be in [0, %d]" % (self.nlevels - 1))
+
+    def get_level(self, level):
+        """Returns a level of the pyramid, computing it if needed.
+
+        :param int level: The level, 0 for the image
+        :rtype: 2D numpy.ndarray
+        """
+        self._check_level(level)
+        while len(self._levels) <= level:
+            self._levels.append(reduce2x(self._levels[-1], self._mode,
+                                         self._num_threads))
+        return self._levels[level]
+
+    def get_region(self, level, rows, cols):
+        """Returns the part of a level covering a region of the image.
+
+        :param int level: The level, 0 for the image
+        :param rows: (start, stop) rows of the region in the image
+        :param cols: (start, stop) columns of the region in the image
+        :return: The pixels of the level covering the region,
+            a view of the level
+        :rtype: 2D numpy.ndarray
+        """
+        data = self.get_level(level)
+        scale = 2 ** level
+        row_start, row_stop = rows
+        col_start, col_stop = cols
+        return data[max(0, int(row_start) // scale):
+                    max(0, -(-int(row_stop) // scale)),
+                    max(0, int(col_start) // scale):
+                    max(0, -(-int(col_stop) // scale))]
+
+    def get_overview(self, rows, cols, max_shape):
+        """Returns a region of the image with a bounded number of pixels.
+
+        The finest level where the region fits in max_shape is used.
+
+        :param rows: (start, stop) rows of the region in the image
+        :param cols: (start, stop) columns of the region in the image
+        :param max_shape: Maximum (height, width) of the result
+        :return: The level used and the region at this level
+        :rtype: 2-tuple (int, 2D numpy.ndarray)
+        """
+        max_height, max_width = max_shape
+        height = max(0, int(rows[1]) - int(rows[0]))
+        width = max(0, int(cols[1]) - int(cols[0]))
+        level = 0
+        while ((height > max_height or width > max_width) and
+                level < self.nlevels - 1):
+            # Region can be shifted by up to one pixel at coarser levels
+            level += 1
+            scale = 2 ** level
+            height = -(-int(rows[1]) // scale) - int(rows[0]) // scale
+            width = -(-int(cols[1]) // scale) - int(cols[0]) // scale
+        return level, self.get_region(level, rows, cols)
@@ -24,7 +24,7 @@
 
 __authors__ = ["J. Kieffer"]
 __license__ = "MIT"
-__date__ = "09/05/2016"
+__date__ = "22/06/2016"
 
 from numpy.distutils.misc_util import Configuration
 
@@ -34,10 +34,37 @@ def configuration(parent_package='', top_path=None):
     config.add_subpackage('test')
     config.add_extension('bilinear',
                          sources=["bilinear.pyx"],
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
+    config.add_extension('components',
+                         sources=["components.pyx"],
                          language='c')
+    config.add_extension('filters',
+                         sources=["filters.pyx"],
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
+    config.add_extension('integral',
+                         sources=["integral.pyx"],
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
+    config.add_extension('pyramid',
+                         sources=["pyramid.pyx"],
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
+    config.add_extension('stats',
+                         sources=["stats.pyx"],
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
     config.add_extension('shapes',
                          sources=["shapes.pyx"],
-                         language='c')
+                         language='c',
+                         extra_compile_args=['-fopenmp'],
+                         extra_link_args=['-fopenmp'])
     return config
 
 
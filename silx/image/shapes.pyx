@@ -28,8 +28,15 @@
 - :func:`draw_line` function generates coordinates of a line in an image.
 - :func:`polygon_fill_mask` function generates a mask from a set of points
   defining a polygon.
+- :func:`polygons_to_labels` function generates a label image from many
+  polygons.
+- :func:`fill_ellipse`, :func:`fill_rectangle` and :func:`fill_polyline`
+  functions draw ellipses or annuli, rotated rectangles and thick polylines
+  in an existing mask, optionally with the fraction of each pixel covered
+  by the shape (anti-aliasing).
 
-The :class:`Polygon` class provides checking if a point is inside a polygon.
+The :class:`Polygon` class provides checking if a point, or many points,
+are inside a polygon.
 
 The whole module uses the (row, col) (i.e., (y, x))) convention
 for 2D coordinates.
@@ -37,13 +44,27 @@ for 2D coordinates.
 
 __authors__ = ["Jérôme Kieffer", "T. Vincent"]
 __license__ = "MIT"
-__date__ = "03/06/2016"
+__date__ = "22/06/2016"
 __status__ = "dev"
 
 
 cimport cython
+from cython.parallel import prange
+from libc.math cimport ceil, floor, fabs
+from libc.stdlib cimport calloc, free
+from libc.string cimport memset
+import multiprocessing
 import numpy
-from libc.math cimport ceil, fabs
+
+
+def _get_num_threads(num_threads):
+    """Return the number of threads to use, at least 1
+
+    :param num_threads: Requested number of threads or None for all CPUs
+    """
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    return max(1, num_threads)
 
 
 cdef class Polygon(object):
@@ -56,6 +77,18 @@ cdef class Polygon(object):
     cdef float[:,:] vertices
     cdef int nvert
 
+    # Edges bucketed by bands of rows, see _init_bands
+    cdef bint has_bands
+    cdef int nbands
+    cdef double band_origin, band_end, band_scale
+    cdef int[::1] band_offsets, band_edges
+
+    cdef int c_band(self, double) nogil
+    cdef bint c_is_inside_band(self, float, float) nogil
+    cdef void c_fill_row(self, int, int, int, unsigned char *) nogil
+    cdef int c_fill_label(self, int[:, ::1], int, int, int, int, int,
+                          int) nogil
+
     def __init__(self, vertices):
         self.vertices = numpy.ascontiguousarray(vertices, dtype=numpy.float32)
         self.nvert = self.vertices.shape[0]
@@ -71,6 +104,121 @@ cdef class Polygon(object):
         """
         return self.c_is_inside(row, col)
 
+    @cython.cdivision(True)
+    cdef int c_band(self, double row) nogil:
+        """Return the band of rows containing row (not clipped)"""
+        return <int> floor((row - self.band_origin) * self.band_scale)
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def _init_bands(self):
+        """Bucket the edges of the polygon in bands of rows.
+
+        The rows spanned by the polygon are split in as many bands as edges.
+        band_edges[band_offsets[i]:band_offsets[i+1]] are the indices of the
+        edges crossing band i, the edge index being the index of its end
+        vertex.
+        """
+        cdef int index, band, first, last, previous
+        cdef int[::1] counts
+        cdef double row_min, row_max
+
+        vertices = numpy.asarray(self.vertices)
+        row_min = vertices[:, 0].min()
+        row_max = vertices[:, 0].max()
+        self.nbands = self.nvert
+        self.band_origin = row_min
+        self.band_end = row_max
+        self.band_scale = self.nbands / (row_max - row_min) if row_max > row_min else 0
+
+        counts = numpy.zeros(self.nbands + 1, dtype=numpy.int32)
+        for step in range(2):
+            # count edges per band, then fill band_edges
+            previous = self.nvert - 1
+            for index in range(self.nvert):
+                first = self.c_band(min(self.vertices[previous, 0],
+                                        self.vertices[index, 0]))
+                last = self.c_band(max(self.vertices[previous, 0],
+                                       self.vertices[index, 0]))
+                for band in range(max(first, 0), min(last, self.nbands - 1) + 1):
+                    if step == 0:
+                        counts[band + 1] += 1
+                    else:
+                        self.band_edges[counts[band]] = index
+                        counts[band] += 1
+                previous = index
+            if step == 0:
+                self.band_offsets = numpy.cumsum(counts, dtype=numpy.int32)
+                self.band_edges = numpy.empty(self.band_offsets[self.nbands],
+                                              dtype=numpy.int32)
+                counts = numpy.array(self.band_offsets, dtype=numpy.int32)
+        self.has_bands = True
+
+    @cython.cdivision(True)
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef bint c_is_inside_band(self, float row, float col) nogil:
+        """Same as c_is_inside, only testing the edges of the band of row
+
+        _init_bands must have been called.
+        """
+        cdef int band, offset, index, previous, is_inside
+        cdef float pt1x, pt1y, pt2x, pt2y, xinters
+        is_inside = 0
+
+        if not (self.band_origin <= row and row < self.band_end):
+            return 0
+        band = min(self.c_band(row), self.nbands - 1)
+        for offset in range(self.band_offsets[band],
+                            self.band_offsets[band + 1]):
+            index = self.band_edges[offset]
+            previous = index - 1 if index > 0 else self.nvert - 1
+            pt1x = self.vertices[previous, 1]
+            pt1y = self.vertices[previous, 0]
+            pt2x = self.vertices[index, 1]
+            pt2y = self.vertices[index, 0]
+
+            if (((pt1y <= row and row < pt2y) or
+                    (pt2y <= row and row < pt1y)) and
+                    # Extra (optional) condition to avoid some computation
+                    (col <= pt1x or col <= pt2x)):
+                xinters = (row - pt1y) * (pt2x - pt1x) / (pt2y - pt1y) + pt1x
+                is_inside ^= col < xinters
+        return is_inside
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def is_inside_many(self, points, num_threads=None):
+        """is_inside_many(self, points, num_threads=None)
+
+        Check if many points are inside or outside the polygon
+
+        Only the edges crossing the row of each point are tested, using a
+        table of edges per band of rows built on first use.
+
+        :param points: Coordinates (row, col) of the points
+        :type points: Nx2 array of floats
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs)
+        :return: Array of N booleans, True for the points inside the polygon
+        """
+        cdef float[:, ::1] c_points
+        cdef unsigned char[::1] result
+        cdef Py_ssize_t index
+        cdef int c_num_threads = _get_num_threads(num_threads)
+
+        c_points = numpy.ascontiguousarray(points,
+                                           dtype=numpy.float32).reshape(-1, 2)
+        result = numpy.zeros(c_points.shape[0], dtype=numpy.uint8)
+        if self.nvert > 0:
+            if not self.has_bands:
+                self._init_bands()
+            for index in prange(c_points.shape[0], nogil=True,
+                                schedule="guided", num_threads=c_num_threads):
+                result[index] = self.c_is_inside_band(c_points[index, 0],
+                                                      c_points[index, 1])
+        return numpy.asarray(result).view(numpy.bool_)
+
     @cython.cdivision(True)
     @cython.wraparound(False)
     @cython.boundscheck(False)
@@ -105,79 +253,180 @@ cdef class Polygon(object):
     @cython.cdivision(True)
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    def make_mask(self, int height, int width):
-        """make_mask(self, height, width)
+    cdef void c_fill_row(self, int row, int col_start, int ncols,
+                         unsigned char *line) nogil:
+        """Set to 1 the pixels of a row of the mask inside the polygon
+
+        For each line of the image, mark intersection of all segments
+        in the line and then run a xor scan to fill inner parts.
+        Adapted from http://alienryderflex.com/polygon_fill/
+
+        :param int row: Row of the mask
+        :param int col_start: Column of the mask of the first element of line
+        :param int ncols: Number of elements of line
+        :param line: Zero-initialized part of the row to fill
+        """
+        cdef int col, index  # Loop indixes
+        cdef float pt1x, pt1y, pt2x, pt2y  # segment end points
+        cdef int col_min, col_max  # line subpart to update
+        cdef int xinters, is_inside, current
 
-        Create a mask array representing the filled polygon
+        pt1x = self.vertices[self.nvert-1, 1]
+        pt1y = self.vertices[self.nvert-1, 0]
+        col_min = ncols - 1
+        col_max = 0
+        is_inside = 0  # Init with whether first col is inside or not
+
+        for index in range(self.nvert):
+            pt2x = self.vertices[index, 1]
+            pt2y = self.vertices[index, 0]
+
+            if ((pt1y <= row and row < pt2y) or
+                    (pt2y <= row and row < pt1y)):
+                # Intersection casted to int so that ]x, x+1] => x
+                xinters = (<int>ceil(pt1x + (row - pt1y) *
+                           (pt2x - pt1x) / (pt2y - pt1y))) - 1 - col_start
+
+                # Update column range to patch
+                if xinters < col_min:
+                    col_min = xinters
+                if xinters > col_max:
+                    col_max = xinters
+
+                if xinters < 0:
+                    # Add an intersection to init value of xor scan
+                    is_inside ^= 1
+                elif xinters < ncols:
+                    # Mark intersection in line
+                    line[xinters] ^= 1
+                # else: do not consider intersection on the right
+
+            pt1x, pt1y = pt2x, pt2y
+
+        if col_min < col_max:
+            # Clip column range to line
+            if col_min < 0:
+                col_min = 0
+            if col_max > ncols - 1:
+                col_max = ncols - 1
+
+            # xor exclusive scan
+            for col in range(col_min, col_max + 1):
+                current = line[col]
+                line[col] = is_inside
+                is_inside = current ^ is_inside
+
+    def bounding_box(self, int height, int width):
+        """bounding_box(self, height, width)
+
+        Return the part of a mask which can be inside the polygon
 
         :param int height: Height of the mask array
         :param int width: Width of the mask array
-        :return: 2D array (height, width)
+        :return: (row_min, row_max, col_min, col_max) with max excluded,
+            the box is empty if row_min >= row_max or col_min >= col_max
         """
-        cdef unsigned char[:, :] mask = numpy.zeros((height, width),
-                                                    dtype=numpy.uint8)
-        cdef int row_min, row_max, col_min, col_max  # mask subpart to update
-        cdef int row, col, index  # Loop indixes
-        cdef float pt1x, pt1y, pt2x, pt2y  # segment end points
-        cdef int xinters, is_inside, current
+        if self.nvert == 0:
+            return 0, 0, 0, 0
+        vertices = numpy.asarray(self.vertices)
+        row_min = max(int(vertices[:, 0].min()), 0)
+        row_max = min(int(vertices[:, 0].max()) + 1, height)
+        col_min = max(int(floor(vertices[:, 1].min())) - 1, 0)
+        col_max = min(int(ceil(vertices[:, 1].max())) + 1, width)
+        return row_min, row_max, col_min, col_max
 
-        row_min = max(int(min(self.vertices[:, 0])), 0)
-        row_max = min(int(max(self.vertices[:, 0])) + 1, height)
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def make_mask(self, int height, int width, num_threads=None):
+        """make_mask(self, height, width, num_threads=None)
 
-        # Can be replaced by prange(row_min, row_max, nogil=True)
-        with nogil:
-            for row in range(row_min, row_max):
-                # For each line of the image, mark intersection of all segments
-                # in the line and then run a xor scan to fill inner parts
-                # Adapted from http://alienryderflex.com/polygon_fill/
-                pt1x = self.vertices[self.nvert-1, 1]
-                pt1y = self.vertices[self.nvert-1, 0]
-                col_min = width - 1
-                col_max = 0
-                is_inside = 0  # Init with whether first col is inside or not
-
-                for index in range(self.nvert):
-                    pt2x = self.vertices[index, 1]
-                    pt2y = self.vertices[index, 0]
-
-                    if ((pt1y <= row and row < pt2y) or
-                            (pt2y <= row and row < pt1y)):
-                        # Intersection casted to int so that ]x, x+1] => x
-                        xinters = (<int>ceil(pt1x + (row - pt1y) *
-                                   (pt2x - pt1x) / (pt2y - pt1y))) - 1
-
-                        # Update column range to patch
-                        if xinters < col_min:
-                            col_min = xinters
-                        if xinters > col_max:
-                            col_max = xinters
-
-                        if xinters < 0:
-                            # Add an intersection to init value of xor scan
-                            is_inside ^= 1
-                        elif xinters < width:
-                            # Mark intersection in mask
-                            mask[row, xinters] ^= 1
-                        # else: do not consider intersection on the right
-
-                    pt1x, pt1y = pt2x, pt2y
-
-                if col_min < col_max:
-                    # Clip column range to mask
-                    if col_min < 0:
-                        col_min = 0
-                    if col_max > width - 1:
-                        col_max = width - 1
-
-                    # xor exclusive scan
-                    for col in range(col_min, col_max + 1):
-                        current = mask[row, col]
-                        mask[row, col] = is_inside
-                        is_inside = current ^ is_inside
+        Create a mask array representing the filled polygon
+
+        :param int height: Height of the mask array
+        :param int width: Width of the mask array
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs)
+        :return: 2D array (height, width)
+        """
+        cdef unsigned char[:, ::1] mask = numpy.zeros((height, width),
+                                                      dtype=numpy.uint8)
+        cdef int row, row_min, row_max
+        cdef int c_num_threads = _get_num_threads(num_threads)
+
+        row_min, row_max, _, _ = self.bounding_box(height, width)
+        if width > 0:
+            # Rows are independent
+            for row in prange(row_min, row_max, nogil=True,
+                              schedule="guided", num_threads=c_num_threads):
+                self.c_fill_row(row, 0, width, &mask[row, 0])
 
         # Ensures the result is exported as numpy array and not memory view.
         return numpy.asarray(mask)
 
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    def make_cropped_mask(self, int height, int width, num_threads=None):
+        """make_cropped_mask(self, height, width, num_threads=None)
+
+        Create a mask array representing the filled polygon, restricted to
+        its bounding box, see :meth:`bounding_box`.
+
+        This avoids allocating a full size mask for small polygons:
+        ``mask[row:row + cropped.shape[0], col:col + cropped.shape[1]]``
+        is ``cropped``, the rest of the mask is 0.
+
+        :param int height: Height of the mask array
+        :param int width: Width of the mask array
+        :param int num_threads: Number of threads to use (default: the number
+            of CPUs)
+        :return: The 2D array of the part of the mask and the (row, col)
+            position of its first element in the mask
+        """
+        cdef unsigned char[:, ::1] mask
+        cdef int row, row_min, row_max, col_min, col_max
+        cdef int c_num_threads = _get_num_threads(num_threads)
+
+        row_min, row_max, col_min, col_max = self.bounding_box(height, width)
+        row_max = max(row_min, row_max)
+        col_max = max(col_min, col_max)
+        mask = numpy.zeros((row_max - row_min, col_max - col_min),
+                           dtype=numpy.uint8)
+        if col_max > col_min:
+            for row in prange(row_min, row_max, nogil=True,
+                              schedule="guided", num_threads=c_num_threads):
+                self.c_fill_row(row, col_min, col_max - col_min,
+                                &mask[row - row_min, 0])
+        return numpy.asarray(mask), (row_min, col_min)
+
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef int c_fill_label(self, int[:, ::1] labels, int label,
+                          int row_min, int row_max,
+                          int col_min, int col_max,
+                          int num_threads) nogil:
+        """Set the pixels of labels inside the polygon to label
+
+        Only the given box of labels is processed.
+
+        :return: The number of rows skipped because their buffer could not
+            be allocated
+        """
+        cdef int row, col, ncols = col_max - col_min, n_failed = 0
+        cdef unsigned char *line
+
+        for row in prange(row_min, row_max, schedule="guided",
+                          num_threads=num_threads):
+            line = <unsigned char *> calloc(ncols, sizeof(unsigned char))
+            if line == NULL:
+                n_failed += 1
+            else:
+                self.c_fill_row(row, col_min, ncols, line)
+                for col in range(ncols):
+                    if line[col]:
+                        labels[row, col_min + col] = label
+                free(line)
+        return n_failed
+
 
 def polygon_fill_mask(vertices, shape):
     """polygon_fill_mask(vertices, shape)
@@ -194,6 +443,47 @@ def polygon_fill_mask(vertices, shape):
     return Polygon(vertices).make_mask(shape[0], shape[1])
 
 
+def polygons_to_labels(list_of_vertices, shape, num_threads=None):
+    """polygons_to_labels(list_of_vertices, shape, num_threads=None)
+
+    Return a label image of many polygons.
+
+    Pixels inside the i-th polygon are set to i + 1, others to 0.
+    Where polygons overlap, the last one wins.
+    Only the bounding box of each polygon is processed.
+
+    :param list_of_vertices: The vertices (row, column) of each polygon
+    :type list_of_vertices: List of numpy.ndarray like container of
+        dimension Nx2
+    :param shape: size of the label image as (height, width)
+    :type shape: 2-tuple of int
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: Label image
+    :rtype: numpy.ndarray of int32 of dimension shape
+    """
+    cdef int[:, ::1] labels
+    cdef Polygon polygon
+    cdef int label, row_min, row_max, col_min, col_max, n_failed = 0
+    cdef int c_num_threads = _get_num_threads(num_threads)
+
+    height, width = shape
+    labels = numpy.zeros((height, width), dtype=numpy.int32)
+    for label, vertices in enumerate(list_of_vertices, 1):
+        polygon = Polygon(vertices)
+        row_min, row_max, col_min, col_max = polygon.bounding_box(height,
+                                                                  width)
+        if row_max > row_min and col_max > col_min:
+            with nogil:
+                n_failed = polygon.c_fill_label(labels, label,
+                                                row_min, row_max,
+                                                col_min, col_max,
+                                                c_num_threads)
+            if n_failed:
+                raise MemoryError()
+    return numpy.asarray(labels)
+
+
 @cython.wraparound(False)
 @cython.boundscheck(False)
 def draw_line(int row0, int col0, int row1, int col1, int width=1):
@@ -303,3 +593,359 @@ def circle_fill(int crow, int ccol, float radius):
     rows, cols = numpy.where(coords.reshape(1, len_coords) +
                              coords.reshape(len_coords, 1) < radius ** 2)
     return rows + crow - i_radius, cols + ccol - i_radius
+
+
+# Rasterization of shapes made of primitives into an existing mask
+
+ctypedef fused mask_t:
+    unsigned char
+    int
+    float
+    double
+
+cdef enum:
+    ELLIPSE = 0
+    RECTANGLE = 1
+    SEGMENT = 2
+
+# Number of sub-pixels per dimension used to estimate the coverage
+cdef int SUPERSAMPLING = 8
+
+
+@cython.cdivision(True)
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef bint _is_inside_primitive(int kind, const double[:, ::1] params,
+                               Py_ssize_t index,
+                               double row, double col) nogil:
+    """Check if (row, col) is inside a primitive, see _rasterize for params
+    """
+    cdef double drow, dcol, u, v, t
+    drow = row - params[index, 0]
+    dcol = col - params[index, 1]
+    if kind == SEGMENT:
+        t = (drow * params[index, 2] + dcol * params[index, 3]) * params[index, 4]
+        t = min(max(t, 0.), 1.)
+        drow -= t * params[index, 2]
+        dcol -= t * params[index, 3]
+        return drow * drow + dcol * dcol <= params[index, 5]
+
+    # Coordinates in the frame of the ellipse or rectangle
+    u = drow * params[index, 2] + dcol * params[index, 3]
+    v = - drow * params[index, 3] + dcol * params[index, 2]
+    if kind == RECTANGLE:
+        return fabs(u) <= params[index, 4] and fabs(v) <= params[index, 5]
+
+    u *= params[index, 4]
+    v *= params[index, 5]
+    if u * u + v * v > 1.:
+        return 0
+    if params[index, 6] == 0:
+        return 1
+    u *= params[index, 6]
+    v *= params[index, 7]
+    return u * u + v * v >= 1.
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef bint _is_inside(int kind, const double[:, ::1] params,
+                     const int[:, ::1] boxes, const int *candidates,
+                     int ncandidates, double row, double col) nogil:
+    """Check if (row, col) is inside any of the candidate primitives"""
+    cdef int i, index
+    for i in range(ncandidates):
+        index = candidates[i]
+        if (boxes[index, 2] - 1 <= col and col <= boxes[index, 3] and
+                _is_inside_primitive(kind, params, index, row, col)):
+            return 1
+    return 0
+
+
+@cython.cdivision(True)
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef int _rasterize(mask_t[:, ::1] mask, int kind,
+                    const double[:, ::1] params, const int[:, ::1] boxes,
+                    double value, bint antialias, bint shortcut,
+                    int num_threads) nogil:
+    """Write value in mask where pixels are inside any of the primitives
+
+    Parameters of the primitives (one row of params per primitive):
+
+    - ELLIPSE: center row, center col, cos(angle), sin(angle),
+      1 / radius row, 1 / radius col, radius row / inner radius row,
+      radius col / inner radius col (0 for no inner ellipse)
+    - RECTANGLE: center row, center col, cos(angle), sin(angle),
+      half height, half width
+    - SEGMENT: start row, start col, row step, col step,
+      1 / squared length (0 for a point), squared half width
+
+    :param boxes: (row_min, row_max, col_min, col_max) pixels to process
+        for each primitive, clipped to the mask, max excluded
+    :param bint antialias: If True, write the maximum of the previous value
+        and value times the fraction of the pixel covered by the primitives
+    :param bint shortcut: If True, pixels with corners and center all
+        inside (or all outside) are considered fully covered (or not covered)
+    :return: The number of rows skipped because their buffer could not be
+        allocated
+    """
+    cdef int nprims = boxes.shape[0]
+    cdef int row_min = mask.shape[0], row_max = 0
+    cdef int col_min = mask.shape[1], col_max = 0
+    cdef int row, col, index, ncandidates, count, i, j, n_failed = 0
+    cdef int *candidates
+    cdef double coverage, offset, step = 1. / SUPERSAMPLING
+
+    for index in range(nprims):
+        row_min = min(row_min, boxes[index, 0])
+        row_max = max(row_max, boxes[index, 1])
+        col_min = min(col_min, boxes[index, 2])
+        col_max = max(col_max, boxes[index, 3])
+
+    for row in prange(row_min, row_max, schedule="guided",
+                      num_threads=num_threads):
+        # Primitives which can cover the row
+        candidates = <int *> calloc(nprims, sizeof(int))
+        if candidates == NULL:
+            n_failed += 1
+        else:
+            ncandidates = 0
+            for index in range(nprims):
+                if boxes[index, 0] <= row and row < boxes[index, 1]:
+                    candidates[ncandidates] = index
+                    ncandidates = ncandidates + 1
+
+            if ncandidates > 0:
+                for col in range(col_min, col_max):
+                    if not antialias:
+                        if _is_inside(kind, params, boxes, candidates,
+                                      ncandidates, row, col):
+                            mask[row, col] = <mask_t> value
+                        continue
+
+                    count = -1
+                    if shortcut:
+                        # corners and center of the pixel
+                        count = _is_inside(kind, params, boxes, candidates,
+                                           ncandidates, row, col)
+                        for i in range(2):
+                            for j in range(2):
+                                count = count + _is_inside(
+                                    kind, params, boxes, candidates,
+                                    ncandidates,
+                                    row - 0.5 + i, col - 0.5 + j)
+                    if count == 0 or count == 5:
+                        coverage = count / 5.
+                    else:
+                        count = 0
+                        offset = (step - 1.) / 2.
+                        for i in range(SUPERSAMPLING):
+                            for j in range(SUPERSAMPLING):
+                                count = count + _is_inside(
+                                    kind, params, boxes, candidates,
+                                    ncandidates,
+                                    row + offset + i * step,
+                                    col + offset + j * step)
+                        coverage = count * step * step
+                    if coverage > 0 and mask[row, col] < value * coverage:
+                        mask[row, col] = <mask_t> (value * coverage)
+            free(candidates)
+    return n_failed
+
+
+def _fill_primitives(mask, int kind, params, extents, double min_size,
+                     double value, bint antialias, num_threads):
+    """Rasterize primitives in mask
+
+    :param mask: C-contiguous 2D array of uint8, bool, int32, float32 or
+        float64
+    :param params: Parameters of the primitives, see _rasterize
+    :param extents: (row_min, row_max, col_min, col_max) coordinates
+        extent of each primitive
+    :param float min_size: Size of the smallest detail of the shape
+    :return: mask
+    """
+    cdef int[:, ::1] boxes
+    cdef double[:, ::1] c_params
+    cdef int c_num_threads = _get_num_threads(num_threads)
+    cdef bint shortcut = min_size >= 2.
+    cdef int n_failed = 0
+    cdef unsigned char[:, ::1] mask_u8
+    cdef int[:, ::1] mask_i32
+    cdef float[:, ::1] mask_f32
+    cdef double[:, ::1] mask_f64
+
+    if not isinstance(mask, numpy.ndarray) or mask.ndim != 2:
+        raise ValueError("mask must be a 2D numpy.ndarray")
+    if not mask.flags.c_contiguous:
+        raise ValueError("mask must be C-contiguous")
+    if antialias and mask.dtype not in (numpy.float32, numpy.float64):
+        raise ValueError("Anti-aliasing requires a float32 or float64 mask")
+
+    height, width = mask.shape
+    # Pixel (row, col) covers [row - 0.5, row + 0.5] x [col - 0.5, col + 0.5]
+    extents = numpy.asarray(extents, dtype=numpy.float64).reshape(-1, 4)
+    extents = numpy.clip(numpy.round(extents), -1, max(height, width) + 1)
+    boxes = numpy.ascontiguousarray(numpy.transpose((
+        numpy.clip(extents[:, 0], 0, height),
+        numpy.clip(extents[:, 1] + 1, 0, height),
+        numpy.clip(extents[:, 2], 0, width),
+        numpy.clip(extents[:, 3] + 1, 0, width))), dtype=numpy.int32)
+    c_params = numpy.ascontiguousarray(params, dtype=numpy.float64).reshape(
+        boxes.shape[0], -1)
+
+    if mask.dtype in (numpy.uint8, numpy.bool_):
+        mask_u8 = mask.view(numpy.uint8)
+        with nogil:
+            n_failed = _rasterize(mask_u8, kind, c_params, boxes, value,
+                                  antialias, shortcut, c_num_threads)
+    elif mask.dtype == numpy.intc:
+        mask_i32 = mask
+        with nogil:
+            n_failed = _rasterize(mask_i32, kind, c_params, boxes, value,
+                                  antialias, shortcut, c_num_threads)
+    elif mask.dtype == numpy.float32:
+        mask_f32 = mask
+        with nogil:
+            n_failed = _rasterize(mask_f32, kind, c_params, boxes, value,
+                                  antialias, shortcut, c_num_threads)
+    elif mask.dtype == numpy.float64:
+        mask_f64 = mask
+        with nogil:
+            n_failed = _rasterize(mask_f64, kind, c_params, boxes, value,
+                                  antialias, shortcut, c_num_threads)
+    else:
+        raise ValueError("Unsupported mask type %s" % mask.dtype)
+    if n_failed:
+        raise MemoryError()
+    return mask
+
+
+def fill_ellipse(mask, center, radii, angle=0., inner_radii=None, value=1,
+                 antialias=False, num_threads=None):
+    """fill_ellipse(mask, center, radii, angle=0., inner_radii=None, value=1, antialias=False, num_threads=None)
+
+    Draw a filled ellipse, or an elliptic annulus, in a mask.
+
+    Pixel (row, col) is the square of side 1 centered on (row, col).
+
+    :param numpy.ndarray mask: C-contiguous 2D array of uint8, bool, int32,
+        float32 or float64, modified in place
+    :param center: Center (row, col) of the ellipse
+    :param radii: Radii (along rows, along cols) of the ellipse, before
+        rotation
+    :param float angle: Rotation of the ellipse in radians, from the row
+        axis towards the column axis
+    :param inner_radii: Radii of the inner ellipse of an annulus, or None
+    :param value: Value to set in the mask for pixels inside the ellipse
+    :param bool antialias: If True, the mask (float32 or float64) is set to
+        the maximum of its value and value times the fraction of the pixel
+        inside the ellipse
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: mask
+    """
+    crow, ccol = center
+    radius_row, radius_col = numpy.abs(radii)
+    cos_a, sin_a = numpy.cos(angle), numpy.sin(angle)
+    if radius_row == 0 or radius_col == 0:
+        return mask
+    if inner_radii is None:
+        inner_ratios = 0., 0.
+        min_size = 2 * min(radius_row, radius_col)
+    else:
+        inner_row, inner_col = numpy.abs(inner_radii)
+        if inner_row == 0 or inner_col == 0:
+            inner_ratios = 0., 0.
+        else:
+            inner_ratios = radius_row / inner_row, radius_col / inner_col
+        min_size = min(radius_row - inner_row, radius_col - inner_col)
+    params = (crow, ccol, cos_a, sin_a, 1. / radius_row, 1. / radius_col,
+              inner_ratios[0], inner_ratios[1])
+    half_rows = numpy.hypot(radius_row * cos_a, radius_col * sin_a)
+    half_cols = numpy.hypot(radius_row * sin_a, radius_col * cos_a)
+    extents = (crow - half_rows, crow + half_rows,
+               ccol - half_cols, ccol + half_cols)
+    return _fill_primitives(mask, ELLIPSE, params, extents, min_size,
+                            value, antialias, num_threads)
+
+
+def fill_rectangle(mask, center, size, angle=0., value=1,
+                   antialias=False, num_threads=None):
+    """fill_rectangle(mask, center, size, angle=0., value=1, antialias=False, num_threads=None)
+
+    Draw a filled rotated rectangle in a mask.
+
+    Pixel (row, col) is the square of side 1 centered on (row, col).
+
+    :param numpy.ndarray mask: C-contiguous 2D array of uint8, bool, int32,
+        float32 or float64, modified in place
+    :param center: Center (row, col) of the rectangle
+    :param size: (height, width) of the rectangle, before rotation
+    :param float angle: Rotation of the rectangle in radians, from the row
+        axis towards the column axis
+    :param value: Value to set in the mask for pixels inside the rectangle
+    :param bool antialias: If True, the mask (float32 or float64) is set to
+        the maximum of its value and value times the fraction of the pixel
+        inside the rectangle
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: mask
+    """
+    crow, ccol = center
+    half_height, half_width = numpy.abs(size) / 2.
+    cos_a, sin_a = numpy.cos(angle), numpy.sin(angle)
+    params = (crow, ccol, cos_a, sin_a, half_height, half_width)
+    half_rows = half_height * abs(cos_a) + half_width * abs(sin_a)
+    half_cols = half_height * abs(sin_a) + half_width * abs(cos_a)
+    extents = (crow - half_rows, crow + half_rows,
+               ccol - half_cols, ccol + half_cols)
+    return _fill_primitives(mask, RECTANGLE, params, extents,
+                            2 * min(half_height, half_width),
+                            value, antialias, num_threads)
+
+
+def fill_polyline(mask, vertices, width=1., closed=False, value=1,
+                  antialias=False, num_threads=None):
+    """fill_polyline(mask, vertices, width=1., closed=False, value=1, antialias=False, num_threads=None)
+
+    Draw a thick polyline with round joins and caps in a mask.
+
+    Pixel (row, col) is the square of side 1 centered on (row, col).
+
+    :param numpy.ndarray mask: C-contiguous 2D array of uint8, bool, int32,
+        float32 or float64, modified in place
+    :param vertices: Points (row, col) of the polyline
+    :type vertices: Nx2 array of floats
+    :param float width: Thickness of the line
+    :param bool closed: If True, the last vertex is connected to the first one
+    :param value: Value to set in the mask for pixels inside the line
+    :param bool antialias: If True, the mask (float32 or float64) is set to
+        the maximum of its value and value times the fraction of the pixel
+        inside the line
+    :param int num_threads: Number of threads to use (default: the number
+        of CPUs)
+    :return: mask
+    """
+    vertices = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 2)
+    if len(vertices) == 0:
+        return mask
+    half_width = abs(width) / 2.
+    if closed and len(vertices) > 2:
+        vertices = numpy.concatenate((vertices, vertices[:1]))
+    start = vertices[:-1] if len(vertices) > 1 else vertices
+    steps = vertices[1:] - start if len(vertices) > 1 else numpy.zeros((1, 2))
+    length2 = (steps ** 2).sum(axis=1)
+    params = numpy.empty((len(start), 6), dtype=numpy.float64)
+    params[:, :2] = start
+    params[:, 2:4] = steps
+    params[:, 4] = numpy.where(length2 > 0, 1. / numpy.where(length2 > 0, length2, 1), 0)
+    params[:, 5] = half_width ** 2
+    ends = start + steps
+    extents = numpy.transpose((numpy.minimum(start[:, 0], ends[:, 0]) - half_width,
+                               numpy.maximum(start[:, 0], ends[:, 0]) + half_width,
+                               numpy.minimum(start[:, 1], ends[:, 1]) - half_width,
+                               numpy.maximum(start[:, 1], ends[:, 1]) + half_width))
+    return _fill_primitives(mask, SEGMENT, params, extents, 2 * half_width,
+                            value, antialias, num_threads)
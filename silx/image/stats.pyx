@@ -0,0 +1,257 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides image statistics computed in a single pass.
+
+:func:`statistics` returns, in one multi-threaded pass over the data,
+all the statistics needed to autoscale a colormap (linear or log) or to
+display a summary of an image:
+
+- ``min``, ``max``: extrema of the finite values
+- ``min_positive``: smallest strictly positive finite value
+- ``sum``, ``mean``, ``variance``: of the finite values
+- ``nan_count``: number of NaN values
+- ``finite_count``: number of finite values
+
+Infinite values are neither counted as finite nor used in the statistics.
+Extrema and sums are computed in float64.
+
+The whole module uses the (row, col) (i.e., (y, x))) convention
+for 2D coordinates.
+"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+cimport cython
+from cython.parallel import prange
+from libc.math cimport INFINITY, isfinite
+import multiprocessing
+import numpy
+
+
+ctypedef fused data_t:
+    signed char
+    unsigned char
+    short
+    unsigned short
+    int
+    unsigned int
+    long long
+    unsigned long long
+    float
+    double
+
+_SUPPORTED_TYPES = (numpy.int8, numpy.uint8, numpy.int16, numpy.uint16,
+                    numpy.int32, numpy.uint32, numpy.int64, numpy.uint64,
+                    numpy.float32, numpy.float64)
+
+# Indices in the per-row results
+DEF MIN = 0
+DEF MAX = 1
+DEF MIN_POSITIVE = 2
+DEF SUM = 3
+DEF M2 = 4
+DEF FINITE = 0
+DEF NAN = 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _row_statistics(const data_t[:, :] data,
+                          const unsigned char[:, :] mask, bint has_mask,
+                          Py_ssize_t row,
+                          double *result, long long *counts) nogil:
+    """Compute the statistics of one row of data
+
+    The sum of squared differences to the mean of the row (M2) is computed
+    in a second pass over the row, which is still in cache.
+    """
+    cdef:
+        Py_ssize_t col
+        double value, mean, diff
+        double mini = INFINITY, maxi = -INFINITY, min_positive = INFINITY
+        double total = 0., m2 = 0.
+        long long finite = 0, nan = 0
+
+    for col in range(data.shape[1]):
+        if has_mask and mask[row, col]:
+            continue
+        value = <double> data[row, col]
+        if data_t is float or data_t is double:
+            if value != value:
+                nan += 1
+                continue
+            if not isfinite(value):
+                continue
+        finite += 1
+        total += value
+        if value < mini:
+            mini = value
+        if value > maxi:
+            maxi = value
+        if 0. < value < min_positive:
+            min_positive = value
+
+    if finite > 0:
+        mean = total / finite
+        for col in range(data.shape[1]):
+            if has_mask and mask[row, col]:
+                continue
+            value = <double> data[row, col]
+            if data_t is float or data_t is double:
+                if not isfinite(value):
+                    continue
+            diff = value - mean
+            m2 += diff * diff
+
+    result[MIN] = mini
+    result[MAX] = maxi
+    result[MIN_POSITIVE] = min_positive
+    result[SUM] = total
+    result[M2] = m2
+    counts[FINITE] = finite
+    counts[NAN] = nan
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _statistics(const data_t[:, :] data, const unsigned char[:, :] mask,
+                bint has_mask, int num_threads):
+    """Compute per-row statistics in parallel
+
+    :return: (rows, 5) float64 array of min, max, min positive, sum and M2
+        and (rows, 2) int64 array of finite and NaN counts
+    """
+    cdef:
+        double[:, ::1] results = numpy.empty((data.shape[0], 5),
+                                             dtype=numpy.float64)
+        long long[:, ::1] counts = numpy.empty((data.shape[0], 2),
+                                               dtype=numpy.int64)
+        Py_ssize_t row
+
+    for row in prange(data.shape[0], nogil=True, schedule="guided",
+                      num_threads=num_threads):
+        _row_statistics(data, mask, has_mask, row,
+                        &results[row, 0], &counts[row, 0])
+    return numpy.asarray(results), numpy.asarray(counts)
+
+
+def _as_supported(data):
+    """Return data as an array with a type supported by the kernel"""
+    data = numpy.asarray(data)
+    if data.dtype == numpy.bool_:
+        return data.view(numpy.uint8)
+    for dtype in _SUPPORTED_TYPES:
+        if data.dtype == dtype:
+            if data.dtype.byteorder not in ('=', '|'):
+                return data.astype(data.dtype.newbyteorder('='))
+            return data
+    if data.dtype.kind == 'f' and data.dtype.itemsize < 4:
+        return data.astype(numpy.float32)
+    return data.astype(numpy.float64)
+
+
+def statistics(data, mask=None, rows=None, cols=None, num_threads=None):
+    """statistics(data, mask=None, rows=None, cols=None, num_threads=None)
+
+    Compute the statistics of an image in a single pass.
+
+    Strided arrays (e.g., slices) are processed without copy.
+
+    :param data: Array of any numeric type, arrays with more than 2
+        dimensions are processed as a 2D array of their last dimension
+    :param mask: Optional array of the same shape as data, the statistics
+        ignore the elements where mask is not 0
+    :param rows: Optional (start, stop) range of rows to process
+        (only for 2D data)
+    :param cols: Optional (start, stop) range of columns to process
+        (only for 2D data)
+    :param int num_threads: Number of threads to use
+        (default: the number of CPUs)
+    :return: dict of min, max, min_positive, sum, mean, variance,
+        nan_count and finite_count, see module documentation.
+        min, max and min_positive are None when there is no such value,
+        mean and variance are NaN when there is no finite value.
+    :raises ValueError: If the mask shape does not match or if a
+        sub-rectangle is requested on data which is not 2D
+    """
+    data = _as_supported(data)
+    if mask is not None:
+        mask = numpy.asarray(mask)
+        if mask.shape != data.shape:
+            raise ValueError("mask and data must have the same shape")
+        mask = mask.astype(numpy.bool_, copy=False).view(numpy.uint8)
+
+    if rows is not None or cols is not None:
+        if data.ndim != 2:
+            raise ValueError("Sub-rectangle is only supported for 2D data")
+        rows = slice(*rows) if rows is not None else slice(None)
+        cols = slice(*cols) if cols is not None else slice(None)
+        data = data[rows, cols]
+        if mask is not None:
+            mask = mask[rows, cols]
+
+    if data.ndim != 2:
+        shape = (-1, data.shape[-1]) if data.ndim > 2 else (1, -1)
+        if data.size == 0:
+            shape = (0, 0)
+        data = data.reshape(shape)
+        if mask is not None:
+            mask = mask.reshape(shape)
+
+    has_mask = mask is not None
+    if not has_mask:
+        mask = numpy.zeros((1, 1), dtype=numpy.uint8)
+
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    results, counts = _statistics(data, mask, has_mask, max(1, num_threads))
+
+    finite_count = int(counts[:, FINITE].sum())
+    stats = {"min": None, "max": None, "min_positive": None,
+             "sum": float(results[:, SUM].sum()),
+             "mean": float('nan'), "variance": float('nan'),
+             "nan_count": int(counts[:, NAN].sum()),
+             "finite_count": finite_count}
+    if finite_count > 0:
+        stats["min"] = float(results[:, MIN].min())
+        stats["max"] = float(results[:, MAX].max())
+        min_positive = results[:, MIN_POSITIVE].min()
+        if numpy.isfinite(min_positive):
+            stats["min_positive"] = float(min_positive)
+
+        # Combine the rows (Chan et al. parallel variance)
+        row_counts = counts[:, FINITE]
+        valid = row_counts > 0
+        row_counts = row_counts[valid]
+        row_means = results[valid, SUM] / row_counts
+        mean = stats["sum"] / finite_count
+        m2 = numpy.sum(results[valid, M2] +
+                       row_counts * (row_means - mean) ** 2)
+        stats["mean"] = mean
+        stats["variance"] = float(m2 / finite_count)
+    return stats
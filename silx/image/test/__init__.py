@@ -28,12 +28,22 @@ __date__ = "09/05/2016"
 
 import unittest
 from . import test_bilinear
+from . import test_components
+from . import test_filters
+from . import test_integral
+from . import test_pyramid
 from . import test_shapes
+from . import test_stats
 
 
 def suite():
     """Test suite for module silx.image.test"""
     test_suite = unittest.TestSuite()
     test_suite.addTest(test_bilinear.suite())
+    test_suite.addTest(test_components.suite())
+    test_suite.addTest(test_filters.suite())
+    test_suite.addTest(test_integral.suite())
+    test_suite.addTest(test_pyramid.suite())
     test_suite.addTest(test_shapes.suite())
+    test_suite.addTest(test_stats.suite())
     return test_suite
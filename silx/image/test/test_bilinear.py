@@ -24,13 +24,17 @@
 
 __authors__ = ["J. Kieffer"]
 __license__ = "MIT"
-__date__ = "09/05/2016"
+__date__ = "22/06/2016"
 
 import unittest
 import numpy
 import logging
 logger = logging.getLogger("test_bilinear")
-from ..bilinear import BilinearImage
+import os
+import shutil
+import tempfile
+from ..bilinear import BilinearImage, Remapper, profile_lines, track_local_maxi
+from .. import bilinear
 
 
 class TestBilinear(unittest.TestCase):
@@ -131,6 +135,257 @@ class TestBilinear(unittest.TestCase):
         self.assertLess(abs(res_ver - expected_profile).max(), 1e-5,
                         "correct vertical profile")
 
+    def test_threads(self):
+        """test that the result does not depend on the number of threads"""
+        N = 200
+        img = numpy.random.random((N, N + 10))
+        b = BilinearImage(img)
+        coords = (numpy.random.random((N, N)) * N * 1.2 - 5,
+                  numpy.random.random((N, N)) * N * 1.2 - 5)
+        ref = b.map_coordinates(coords, num_threads=1)
+        self.assertEqual(ref.shape, (N, N))
+        for num_threads in (2, 4, None):
+            res = b.map_coordinates(coords, num_threads=num_threads)
+            self.assertTrue(numpy.array_equal(ref, res))
+
+        ref = b.profile_line((10, 3), (150.5, 190), linewidth=5, num_threads=1)
+        for num_threads in (2, 4, None):
+            res = b.profile_line((10, 3), (150.5, 190), linewidth=5,
+                                 num_threads=num_threads)
+            self.assertTrue(numpy.array_equal(ref, res))
+
+    def test_dtypes(self):
+        """test that supported types are used in place with the same result"""
+        N = 50
+        ref_img = numpy.random.randint(0, 60000, size=(N, N + 3))
+        ref = BilinearImage(ref_img.astype(numpy.float32))
+        coords = (numpy.random.random(1000) * (N + 2) - 1,
+                  numpy.random.random(1000) * (N + 5) - 1)
+        expected = ref.map_coordinates(coords)
+        for dtype in (numpy.uint16, numpy.int32, numpy.float32, numpy.float64):
+            img = ref_img.astype(dtype)
+            b = BilinearImage(img)
+            self.assertTrue(numpy.may_share_memory(b.data, img),
+                            "%s image is not copied" % dtype)
+            self.assertTrue(numpy.array_equal(b.map_coordinates(coords),
+                                              expected))
+            self.assertEqual(b.local_maxi((10, 10)), ref.local_maxi((10, 10)))
+            self.assertEqual(b.maxi, ref_img.max())
+            self.assertEqual(b.mini, ref_img.min())
+
+        # Other types are converted
+        b = BilinearImage(ref_img.astype(numpy.int8))
+        self.assertEqual(b.data.dtype, numpy.float32)
+        b = BilinearImage(ref_img.astype(numpy.float64)[:, ::2])
+        self.assertEqual(b.data.dtype, numpy.float64)
+        self.assertEqual(b.height, N)
+        self.assertEqual(b.width, (N + 4) // 2)
+
+    def test_profile_lines(self):
+        N = 100
+        img = numpy.random.random((N, N + 20)).astype(numpy.float32)
+        b = BilinearImage(img)
+        src = numpy.array([(0, 0), (N // 2, 0), (10.5, 90), (20, 20)])
+        dst = numpy.array([(N - 1, N - 1), (N // 2, N - 1), (80, 3.2), (20, 20)])
+        res = b.profile_lines(src, dst, linewidth=3)
+        self.assertEqual(res.shape, (4, numpy.ceil(numpy.sqrt(2) * N)))
+        ref = b.profile_line(src[0], dst[0], linewidth=3)
+        self.assertTrue(numpy.array_equal(res[0], ref))
+        for line in range(3):
+            ref = b.profile_line(src[line], dst[line], linewidth=3)
+            res = b.profile_lines(src[line], dst[line], linewidth=3)
+            self.assertTrue(numpy.array_equal(res, ref))
+        res = b.profile_lines(src, dst, linewidth=3)
+        self.assertTrue(numpy.allclose(res[3], b((20, 20))))
+
+        res = b.profile_lines(src, dst, n_points=10)
+        self.assertEqual(res.shape, (4, 10))
+        self.assertAlmostEqual(res[1, 0], img[N // 2, 0])
+        self.assertAlmostEqual(res[1, -1], img[N // 2, N - 1])
+
+        # stack of images
+        stack = numpy.random.random((5, N, N + 20))
+        res = profile_lines(stack, (0, 0), (N - 1, 50), linewidth=2,
+                            n_points=64)
+        self.assertEqual(res.shape, (5, 64))
+        for frame in range(5):
+            ref = BilinearImage(stack[frame]).profile_lines(
+                [(0, 0)], [(N - 1, 50)], linewidth=2, n_points=64)
+            self.assertTrue(numpy.array_equal(res[frame], ref[0]))
+        res = profile_lines(stack, src, dst)
+        self.assertEqual(res.shape, (5, 4, numpy.ceil(numpy.sqrt(2) * N)))
+
+        self.assertRaises(ValueError, profile_lines, stack, src, dst[:2])
+
+    def test_local_maxi_many(self):
+        """test the batched maximum search against local_maxi"""
+        a = numpy.arange(100) - 40.5
+        b = numpy.arange(100) - 60.5
+        ga = numpy.exp(-a * a / 4000)
+        gb = numpy.exp(-b * b / 6000)
+        gg = numpy.outer(ga, gb) + numpy.random.random((100, 100)) * 0.01
+        b = BilinearImage(gg)
+        coords = numpy.random.randint(0, 100, size=(self.N, 2))
+        positions, values = b.local_maxi_many(coords)
+        self.assertEqual(positions.shape, (self.N, 2))
+        self.assertEqual(values.shape, (self.N,))
+        for i in range(self.N):
+            self.assertEqual(tuple(positions[i]), b.local_maxi(coords[i]))
+            self.assertEqual(values[i], b(positions[i]))
+
+    def test_track_local_maxi(self):
+        """test the tracking of moving peaks in a stack"""
+        y, x = numpy.ogrid[:100, :100]
+        stack = numpy.zeros((10, 100, 100))
+        for frame in range(10):
+            for row, column in ((20, 20), (60, 70)):
+                row += frame
+                column -= 0.5 * frame
+                stack[frame] += numpy.exp(-((y - row) ** 2 + (x - column) ** 2) / 20.)
+        positions, values = track_local_maxi(stack, [(22, 18), (58, 71)])
+        self.assertEqual(positions.shape, (10, 2, 2))
+        self.assertEqual(values.shape, (10, 2))
+        for frame in range(10):
+            expected = [(20 + frame, 20 - 0.5 * frame),
+                        (60 + frame, 70 - 0.5 * frame)]
+            self.assertTrue(numpy.allclose(positions[frame], expected,
+                                           atol=0.25))
+
+
+class TestRemapper(unittest.TestCase):
+    """Test the precomputed remapping against map_coordinates"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        N = 64
+        self.shape = (N, N + 10)
+        radius, angle = numpy.ogrid[0:N:0.7, 0:2 * numpy.pi:0.05]
+        self.coordinates = (N / 2 + radius * numpy.sin(angle),
+                            N / 2 + radius * numpy.cos(angle))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_apply(self):
+        remapper = Remapper(self.shape, self.coordinates)
+        self.assertEqual(remapper.output_shape, self.coordinates[0].shape)
+        stack = numpy.random.randint(0, 1000, (3,) + self.shape)
+        for dtype in (numpy.uint16, numpy.int32, numpy.float32, numpy.float64):
+            data = stack.astype(dtype)
+            result = remapper.apply(data)
+            self.assertEqual(result.shape, (3,) + remapper.output_shape)
+            for frame in range(3):
+                expected = BilinearImage(data[frame]).map_coordinates(
+                    self.coordinates)
+                self.assertTrue(numpy.allclose(result[frame], expected,
+                                               rtol=1e-5, atol=1e-3))
+                self.assertTrue(numpy.array_equal(
+                    remapper.apply(data[frame], num_threads=1),
+                    result[frame]))
+
+        output = numpy.zeros(remapper.output_shape, dtype=numpy.float32)
+        result = remapper.apply(stack[0], output=output)
+        self.assertIs(result, output)
+        self.assertRaises(ValueError, remapper.apply, stack[:, :-1])
+        self.assertRaises(ValueError, remapper.apply, stack, output)
+
+    def test_non_finite(self):
+        rows = numpy.array([[10.5, numpy.nan], [numpy.inf, 3.]])
+        columns = numpy.array([[-numpy.inf, 2.], [4., numpy.nan]])
+        remapper = Remapper(self.shape, (rows, columns))
+        self.assertTrue(numpy.all(remapper.indices >= 0))
+        self.assertTrue(numpy.all(
+            remapper.indices < self.shape[0] * self.shape[1]))
+        data = numpy.random.random(self.shape) + 1
+        result = remapper.apply(data)
+        self.assertTrue(numpy.array_equal(result, numpy.zeros((2, 2))))
+
+    def test_save(self):
+        remapper = Remapper(self.shape, self.coordinates)
+        filename = os.path.join(self.tmpdir, "remap.npz")
+        remapper.save(filename)
+        loaded = Remapper.load(filename)
+        self.assertEqual(loaded.shape, remapper.shape)
+        self.assertEqual(loaded.output_shape, remapper.output_shape)
+        data = numpy.random.random(self.shape)
+        self.assertTrue(numpy.array_equal(loaded.apply(data),
+                                          remapper.apply(data)))
+
+        for value in (-1, self.shape[0] * self.shape[1]):
+            indices = remapper.indices.copy()
+            indices[5, 2] = value
+            numpy.savez(filename, shape=remapper.shape,
+                        output_shape=remapper.output_shape,
+                        indices=indices, weights=remapper.weights)
+            self.assertRaises(ValueError, Remapper.load, filename)
+        numpy.savez(filename, shape=remapper.shape,
+                    output_shape=remapper.output_shape,
+                    indices=remapper.indices[:, :2],
+                    weights=remapper.weights[:, :2])
+        self.assertRaises(ValueError, Remapper.load, filename)
+
+
+class TestTransforms(unittest.TestCase):
+    """Test affine transforms"""
+
+    def test_affine_transform(self):
+        img = numpy.random.random((40, 50)).astype(numpy.float32)
+        matrix = numpy.array([[0.9, 0.2], [-0.1, 1.1]])
+        offset = (3., -2.)
+        result = bilinear.affine_transform(img, matrix, offset,
+                                           output_shape=(30, 45))
+        self.assertEqual(result.shape, (30, 45))
+        self.assertEqual(result.dtype, numpy.float32)
+        rows, cols = numpy.mgrid[0:30, 0:45]
+        pos_rows = 0.9 * rows + 0.2 * cols + 3.
+        pos_cols = -0.1 * rows + 1.1 * cols - 2.
+        expected = BilinearImage(img).map_coordinates((pos_rows, pos_cols))
+        outside = ((pos_rows < -0.5) | (pos_rows >= 39.5) |
+                   (pos_cols < -0.5) | (pos_cols >= 49.5))
+        expected[outside] = -1
+        result = bilinear.affine_transform(img, matrix, offset,
+                                           output_shape=(30, 45), cval=-1)
+        self.assertTrue(numpy.allclose(result, expected, atol=1e-5))
+
+        result = bilinear.affine_transform(img, matrix, offset, order=0,
+                                           output_shape=(30, 45))
+        expected = img[numpy.clip(numpy.floor(pos_rows + 0.5), 0, 39).astype(int),
+                       numpy.clip(numpy.floor(pos_cols + 0.5), 0, 49).astype(int)]
+        expected[outside] = 0
+        self.assertTrue(numpy.array_equal(result, expected))
+
+    def test_simple_transforms(self):
+        img = numpy.arange(12, dtype=numpy.float64).reshape(3, 4)
+        self.assertTrue(numpy.allclose(bilinear.rotate(img[:, :3], 90),
+                                       numpy.rot90(img[:, :3])))
+        self.assertTrue(numpy.array_equal(
+            bilinear.zoom(img, 2, order=0),
+            numpy.repeat(numpy.repeat(img, 2, axis=0), 2, axis=1)))
+        self.assertEqual(bilinear.zoom(img, (0.5, 1.5)).shape, (2, 6))
+        shifted = bilinear.shift(img, (1, -2), cval=-1)
+        self.assertTrue(numpy.array_equal(shifted[1:, :2], img[:-1, 2:]))
+        self.assertTrue(numpy.all(shifted[0] == -1))
+        self.assertTrue(numpy.all(shifted[:, 2:] == -1))
+
+    def test_stack_and_output(self):
+        stack = numpy.random.randint(0, 1000, (4, 30, 40)).astype(numpy.uint16)
+        result = bilinear.rotate(stack, 30, dtype=numpy.float64)
+        self.assertEqual(result.shape, stack.shape)
+        self.assertEqual(result.dtype, numpy.float64)
+        for frame in range(4):
+            self.assertTrue(numpy.array_equal(
+                result[frame],
+                bilinear.rotate(stack[frame], 30, dtype=numpy.float64,
+                                num_threads=1)))
+
+        output = numpy.zeros(stack.shape, dtype=numpy.uint16)
+        self.assertIs(bilinear.rotate(stack, 30, output=output), output)
+        self.assertTrue(numpy.array_equal(output, numpy.floor(result + 0.5)))
+
+        self.assertRaises(ValueError, bilinear.rotate, stack, 30,
+                          output=numpy.zeros(stack.shape, numpy.int8))
+        self.assertRaises(ValueError, bilinear.rotate, stack, 30, order=3)
+
 
 def suite():
     testsuite = unittest.TestSuite()
@@ -139,4 +394,15 @@ def suite():
     testsuite.addTest(TestBilinear("test_map"))
     testsuite.addTest(TestBilinear("test_profile_grad"))
     testsuite.addTest(TestBilinear("test_profile_gaus"))
+    testsuite.addTest(TestBilinear("test_threads"))
+    testsuite.addTest(TestBilinear("test_dtypes"))
+    testsuite.addTest(TestBilinear("test_profile_lines"))
+    testsuite.addTest(TestBilinear("test_local_maxi_many"))
+    testsuite.addTest(TestBilinear("test_track_local_maxi"))
+    testsuite.addTest(TestRemapper("test_apply"))
+    testsuite.addTest(TestRemapper("test_non_finite"))
+    testsuite.addTest(TestTransforms("test_affine_transform"))
+    testsuite.addTest(TestTransforms("test_simple_transforms"))
+    testsuite.addTest(TestTransforms("test_stack_and_output"))
+    testsuite.addTest(TestRemapper("test_save"))
     return testsuite
@@ -0,0 +1,149 @@
+# coding: utf-8
+# /*##########################################################################
+#
+# Copyright (c) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Tests for connected components"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+import unittest
+import numpy
+
+from silx.image import components
+
+
+class TestLabel(unittest.TestCase):
+    """Test label"""
+
+    MASK = numpy.array(((1, 1, 0, 0, 1),
+                        (0, 1, 0, 1, 1),
+                        (1, 0, 0, 0, 0),
+                        (1, 1, 0, 1, 0)))
+
+    def test_connectivity4(self):
+        labels, properties = components.label(self.MASK, connectivity=4)
+        self.assertEqual(labels.dtype, numpy.int32)
+        self.assertTrue(numpy.all(labels == ((1, 1, 0, 0, 2),
+                                             (0, 1, 0, 2, 2),
+                                             (3, 0, 0, 0, 0),
+                                             (3, 3, 0, 4, 0))))
+        self.assertEqual(properties["area"].tolist(), [3, 3, 3, 1])
+        self.assertEqual(properties["bbox"].tolist(),
+                         [[0, 2, 0, 2], [0, 2, 3, 5], [2, 4, 0, 2],
+                          [3, 4, 3, 4]])
+        self.assertTrue(numpy.allclose(properties["centroid"][0],
+                                       (1. / 3., 2. / 3.)))
+
+    def test_connectivity8(self):
+        labels, properties = components.label(self.MASK, connectivity=8)
+        self.assertEqual(labels.max(), 3)
+        self.assertEqual(properties["area"].tolist(), [6, 3, 1])
+        self.assertEqual(properties["bbox"][0].tolist(), [0, 4, 0, 2])
+        self.assertTrue(numpy.allclose(properties["centroid"][0], (1.5, 0.5)))
+
+    def test_random(self):
+        """Check consistency of labels and tables on a random mask"""
+        mask = numpy.random.random((200, 300)) > 0.5
+        labels, properties = components.label(mask, connectivity=4)
+        self.assertTrue(numpy.all((labels > 0) == mask))
+        count = labels.max()
+        self.assertEqual(len(properties["area"]), count)
+        self.assertEqual(properties["area"].sum(), mask.sum())
+        self.assertTrue(numpy.all(
+            properties["area"] == numpy.bincount(labels.ravel())[1:]))
+        # No 4-neighbours with different non-zero labels
+        for first, second in ((labels[:, 1:], labels[:, :-1]),
+                              (labels[1:], labels[:-1])):
+            touching = numpy.logical_and(first > 0, second > 0)
+            self.assertTrue(numpy.all(first[touching] == second[touching]))
+
+    def test_empty(self):
+        labels, properties = components.label(numpy.zeros((3, 4)))
+        self.assertEqual(labels.max(), 0)
+        self.assertEqual(len(properties["area"]), 0)
+        self.assertEqual(properties["bbox"].shape, (0, 4))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            components.label(self.MASK, connectivity=6)
+        with self.assertRaises(ValueError):
+            components.label(numpy.ones(10))
+
+
+class TestFloodFill(unittest.TestCase):
+    """Test flood_fill"""
+
+    IMAGE = numpy.array(((1., 1.2, 5., 5.),
+                         (1., 3., 5., 1.),
+                         (0.9, 1., 1., 1.)))
+
+    def test_tolerance(self):
+        labels, properties = components.flood_fill(
+            self.IMAGE, (0, 0), tolerance=0.25)
+        self.assertTrue(numpy.all(labels == ((1, 1, 0, 0),
+                                             (1, 0, 0, 1),
+                                             (1, 1, 1, 1))))
+        self.assertEqual(properties["area"].tolist(), [8])
+        self.assertEqual(properties["bbox"].tolist(), [[0, 3, 0, 4]])
+
+        labels, properties = components.flood_fill(
+            self.IMAGE, (0, 0), tolerance=0.)
+        self.assertEqual(properties["area"].tolist(), [2])
+
+    def test_seeds(self):
+        labels, properties = components.flood_fill(
+            self.IMAGE, [(0, 0), (0, 2), (2, 3), (10, 10)], tolerance=0.25)
+        self.assertEqual(properties["area"].tolist(), [8, 3, 0, 0])
+        self.assertTrue(numpy.all(numpy.isnan(properties["centroid"][2])))
+        self.assertEqual(numpy.count_nonzero(labels == 2), 3)
+
+    def test_connectivity8(self):
+        image = numpy.eye(4, dtype=numpy.uint16)
+        labels, properties = components.flood_fill(image, (0, 0),
+                                                   connectivity=4)
+        self.assertEqual(properties["area"].tolist(), [1])
+        labels, properties = components.flood_fill(image, (0, 0),
+                                                   connectivity=8)
+        self.assertEqual(properties["area"].tolist(), [4])
+        self.assertTrue(numpy.allclose(properties["centroid"], (1.5, 1.5)))
+
+    def test_large(self):
+        """Fill a large image to exercise the stack growth"""
+        image = numpy.zeros((500, 600), dtype=numpy.int64)
+        image[100:200, 100:300] = 10
+        labels, properties = components.flood_fill(image, (0, 0))
+        self.assertEqual(properties["area"][0], 500 * 600 - 100 * 200)
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    for testClass in (TestLabel, TestFloodFill):
+        test_suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(testClass))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,168 @@
+# coding: utf-8
+# /*##########################################################################
+#
+# Copyright (c) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Tests for order-statistics filters"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+import unittest
+import warnings
+import numpy
+
+from silx.testutils import ParametricTestCase
+from silx.image import filters
+
+
+def _reference(data, size, function):
+    """Filter data with function applied on each truncated window"""
+    height, width = numpy.broadcast_to(size, (2,))
+    result = numpy.empty(data.shape, dtype=numpy.float64)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for row in range(data.shape[0]):
+            for col in range(data.shape[1]):
+                window = data[max(row - height // 2, 0):row - height // 2 + height,
+                              max(col - width // 2, 0):col - width // 2 + width]
+                result[row, col] = function(window)
+    return result
+
+
+class TestFilters(ParametricTestCase):
+    """Test spatial filters against numpy"""
+
+    FUNCTIONS = ((filters.median_filter, numpy.nanmedian),
+                 (filters.minimum_filter, numpy.nanmin),
+                 (filters.maximum_filter, numpy.nanmax))
+
+    def test_sizes(self):
+        data = numpy.random.randint(0, 20, (30, 41))
+        for size in (1, 2, 3, 4, (3, 5), (6, 1), 50):
+            for function, reference in self.FUNCTIONS:
+                with self.subTest(size=size, function=function.__name__):
+                    result = function(data, size, num_threads=2)
+                    self.assertTrue(numpy.array_equal(
+                        result, _reference(data, size, reference)))
+
+    def test_dtypes(self):
+        data = numpy.random.randint(0, 200, (20, 25))
+        for dtype, expected in ((numpy.uint8, numpy.float32),
+                                (numpy.uint16, numpy.float32),
+                                (numpy.int32, numpy.float64),
+                                (numpy.int64, numpy.float64),
+                                (numpy.float32, numpy.float32),
+                                (numpy.float64, numpy.float64),
+                                (numpy.int8, numpy.float64)):
+            with self.subTest(dtype=dtype):
+                image = data.astype(dtype)
+                result = filters.median_filter(image, 3)
+                self.assertEqual(result.dtype, expected)
+                self.assertTrue(numpy.array_equal(
+                    result, _reference(image, 3, numpy.median)))
+
+    def test_nan_mask(self):
+        data = numpy.random.random((30, 40))
+        data[numpy.random.random(data.shape) > 0.8] = numpy.nan
+        data[10:13, 10:13] = numpy.nan
+        mask = numpy.random.random(data.shape) > 0.8
+        masked = data.copy()
+        masked[mask] = numpy.nan
+        for size in (3, 5):
+            for function, reference in self.FUNCTIONS:
+                with self.subTest(size=size, function=function.__name__):
+                    result = function(data, size, mask=mask)
+                    self.assertTrue(numpy.allclose(
+                        result, _reference(masked, size, reference),
+                        equal_nan=True))
+        self.assertTrue(numpy.isnan(filters.median_filter(data, 3)[11, 11]))
+
+    def test_threads(self):
+        data = numpy.random.random((2000, 2000)).astype(numpy.float32)
+        expected = filters.median_filter(data, 3, num_threads=1)
+        for num_threads in (2, 4, 8):
+            with self.subTest(num_threads=num_threads):
+                result = filters.median_filter(data, 3,
+                                               num_threads=num_threads)
+                self.assertTrue(numpy.array_equal(result, expected))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            filters.median_filter(numpy.ones(10))
+        with self.assertRaises(ValueError):
+            filters.median_filter(numpy.ones((3, 3)), 0)
+        with self.assertRaises(ValueError):
+            filters.median_filter(numpy.ones((3, 3)), mask=numpy.ones(4))
+
+
+class TestTemporalMedian(unittest.TestCase):
+    """Test temporal_median against numpy"""
+
+    def test_median(self):
+        for nframes in (1, 6, 7):
+            stack = numpy.random.randint(0, 1000, (nframes, 20, 30))
+            result = filters.temporal_median(stack.astype(numpy.uint16),
+                                             num_threads=2)
+            self.assertEqual(result.dtype, numpy.float32)
+            self.assertTrue(numpy.array_equal(result,
+                                              numpy.median(stack, axis=0)))
+
+    def test_nan_mask(self):
+        stack = numpy.random.random((9, 20, 30))
+        stack[numpy.random.random(stack.shape) > 0.8] = numpy.nan
+        stack[:, 2, 3] = numpy.nan
+        mask = numpy.random.random(stack.shape) > 0.8
+        masked = stack.copy()
+        masked[mask] = numpy.nan
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.assertTrue(numpy.allclose(
+                filters.temporal_median(stack, mask=mask),
+                numpy.nanmedian(masked, axis=0), equal_nan=True))
+
+            # One mask for all frames
+            masked = stack.copy()
+            masked[:, mask[0]] = numpy.nan
+            self.assertTrue(numpy.allclose(
+                filters.temporal_median(stack, mask=mask[0]),
+                numpy.nanmedian(masked, axis=0), equal_nan=True))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            filters.temporal_median(numpy.ones((3, 3)))
+        with self.assertRaises(ValueError):
+            filters.temporal_median(numpy.ones((2, 3, 3)),
+                                    mask=numpy.ones((2, 3)))
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    for testClass in (TestFilters, TestTemporalMedian):
+        test_suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(testClass))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
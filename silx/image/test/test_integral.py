@@ -0,0 +1,148 @@
+# coding: utf-8
+# /*##########################################################################
+#
+# Copyright (c) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Tests for integral images"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+import unittest
+import numpy
+
+from silx.testutils import ParametricTestCase
+from silx.image import integral
+
+
+class TestIntegralImage(ParametricTestCase):
+    """Test IntegralImage against numpy"""
+
+    RECTANGLES = ((0, 40, 0, 70), (5, 17, 3, 60), (39, 40, 69, 70),
+                  (-5, 3, 60, 100))
+
+    def test_dtypes(self):
+        data = numpy.random.randint(0, 1000, (40, 70))
+        for dtype in (numpy.bool_, numpy.uint8, numpy.uint16, numpy.int32,
+                      numpy.int64, numpy.float32, numpy.float64):
+            with self.subTest(dtype=dtype):
+                image = data.astype(dtype)
+                table = integral.IntegralImage(image, num_threads=2)
+                self.assertEqual(table.sums.shape, (41, 71))
+                if image.dtype.kind in 'bui':
+                    self.assertEqual(table.sums.dtype, numpy.int64)
+                for rectangle in self.RECTANGLES:
+                    row_start, row_stop, col_start, col_stop = rectangle
+                    values = image[max(row_start, 0):row_stop,
+                                   max(col_start, 0):col_stop]
+                    values = values.astype(numpy.float64)
+                    self.assertEqual(table.count(rectangle), values.size)
+                    self.assertEqual(table.sum(rectangle), values.sum())
+                    self.assertTrue(numpy.isclose(table.mean(rectangle),
+                                                  values.mean()))
+                    self.assertTrue(numpy.isclose(table.std(rectangle),
+                                                  values.std(), atol=1e-6))
+
+    def test_large_integers(self):
+        data = numpy.random.randint(0, 2**31 - 1, (100, 100))
+        for dtype in (numpy.int32, numpy.uint32, numpy.int64):
+            with self.subTest(dtype=dtype):
+                image = data.astype(dtype)
+                table = integral.IntegralImage(image)
+                self.assertEqual(table.squares.dtype, numpy.float64)
+                self.assertEqual(table.sum((0, 100, 0, 100)), image.sum())
+                values = image.astype(numpy.float64)
+                self.assertTrue(numpy.isclose(table.std((0, 100, 0, 100)),
+                                              values.std()))
+                std = integral.box_std(image, 3)
+                self.assertTrue(numpy.isclose(std[50, 50],
+                                              values[49:52, 49:52].std()))
+        table = integral.IntegralImage(data.astype(numpy.uint16))
+        self.assertEqual(table.squares.dtype, numpy.int64)
+
+    def test_many_rectangles(self):
+        data = numpy.random.random((40, 70))
+        table = integral.IntegralImage(data)
+        rectangles = numpy.array(self.RECTANGLES * 2).reshape(2, -1, 4)
+        sums = table.sum(rectangles)
+        self.assertEqual(sums.shape, (2, len(self.RECTANGLES)))
+        for rectangle, result in zip(self.RECTANGLES, sums[1]):
+            self.assertEqual(result, table.sum(rectangle))
+        self.assertTrue(numpy.isnan(table.mean((10, 10, 0, 5))))
+
+    def test_mask_nan(self):
+        data = numpy.random.random((40, 70))
+        mask = numpy.random.random((40, 70)) > 0.7
+        data[3, 4] = numpy.nan
+        data[20, 30] = numpy.inf
+        valid = numpy.logical_and(~mask, numpy.isfinite(data))
+        table = integral.IntegralImage(data, mask=mask)
+        for rectangle in self.RECTANGLES:
+            row_start, row_stop, col_start, col_stop = rectangle
+            window = (slice(max(row_start, 0), row_stop),
+                      slice(max(col_start, 0), col_stop))
+            values = data[window][valid[window]]
+            self.assertEqual(table.count(rectangle), values.size)
+            self.assertTrue(numpy.isclose(table.sum(rectangle), values.sum()))
+            if values.size > 0:
+                self.assertTrue(numpy.isclose(
+                    table.std(rectangle), values.std(), atol=1e-6))
+            else:
+                self.assertTrue(numpy.isnan(table.std(rectangle)))
+
+    def test_box_filters(self):
+        data = numpy.random.random((30, 20))
+        for size in (1, 3, (5, 2)):
+            with self.subTest(size=size):
+                height, width = numpy.broadcast_to(size, (2,))
+                mean = integral.box_mean(data, size)
+                std = integral.box_std(data, size)
+                self.assertEqual(mean.shape, data.shape)
+                for row, col in ((0, 0), (10, 5), (29, 19)):
+                    row_start = max(row - height // 2, 0)
+                    col_start = max(col - width // 2, 0)
+                    window = data[row_start:row - height // 2 + height,
+                                  col_start:col - width // 2 + width]
+                    self.assertTrue(numpy.isclose(mean[row, col],
+                                                  window.mean()))
+                    self.assertTrue(numpy.isclose(std[row, col],
+                                                  window.std(), atol=1e-6))
+        with self.assertRaises(ValueError):
+            integral.box_mean(data, 0)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            integral.IntegralImage(numpy.ones(10))
+        with self.assertRaises(ValueError):
+            integral.IntegralImage(numpy.ones((3, 3)), mask=numpy.ones(3))
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestIntegralImage))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,114 @@
+# coding: utf-8
+# /*##########################################################################
+#
+# Copyright (c) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""Tests for image pyramid"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+import unittest
+import numpy
+
+from silx.testutils import ParametricTestCase
+from silx.image import pyramid
+
+
+class TestReduce2x(ParametricTestCase):
+    """Test reduce2x against numpy"""
+
+    def test_modes(self):
+        """Test all modes and types with even and odd shapes"""
+        functions = {"mean": numpy.mean, "max": numpy.max,
+                     "min": numpy.min, "sum": numpy.sum}
+        for shape in ((6, 8), (5, 7), (1, 1), (1, 9)):
+            data = numpy.random.randint(0, 200, shape)
+            for dtype in (numpy.uint8, numpy.uint16, numpy.int32,
+                          numpy.int64, numpy.float32, numpy.float64):
+                for mode, function in functions.items():
+                    with self.subTest(shape=shape, dtype=dtype, mode=mode):
+                        image = data.astype(dtype)
+                        result = pyramid.reduce2x(image, mode, num_threads=2)
+                        height, width = (shape[0] + 1) // 2, (shape[1] + 1) // 2
+                        self.assertEqual(result.shape, (height, width))
+                        expected = numpy.array(
+                            [[function(image[2 * i:2 * i + 2, 2 * j:2 * j + 2])
+                              for j in range(width)] for i in range(height)])
+                        self.assertTrue(numpy.allclose(result, expected))
+                        if mode in ("max", "min") and dtype != numpy.int64:
+                            self.assertEqual(result.dtype, dtype)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, pyramid.reduce2x, numpy.ones(5))
+        self.assertRaises(ValueError, pyramid.reduce2x, numpy.ones((5, 5)),
+                          "median")
+
+
+class TestImagePyramid(unittest.TestCase):
+    """Test ImagePyramid"""
+
+    def test_levels(self):
+        image = numpy.random.random((100, 301))
+        image[57, 201] = 10
+        pyr = pyramid.ImagePyramid(image, mode="max")
+        self.assertEqual(pyr.nlevels, 10)
+        self.assertEqual(pyr.get_shape(2), (25, 76))
+        self.assertEqual(pyr.get_shape(9), (1, 1))
+        self.assertIs(pyr.get_level(0), image)
+        for level in range(pyr.nlevels):
+            data = pyr.get_level(level)
+            self.assertEqual(data.shape, pyr.get_shape(level))
+            # The hot pixel is kept at all levels
+            self.assertEqual(data.max(), 10)
+            self.assertEqual(data[57 // 2 ** level, 201 // 2 ** level], 10)
+        self.assertRaises(ValueError, pyr.get_level, 10)
+
+    def test_region(self):
+        image = numpy.arange(256 * 512, dtype=numpy.float64).reshape(256, 512)
+        pyr = pyramid.ImagePyramid(image)
+        region = pyr.get_region(0, (10, 20), (30, 50))
+        self.assertTrue(numpy.array_equal(region, image[10:20, 30:50]))
+        region = pyr.get_region(2, (10, 20), (30, 50))
+        self.assertEqual(region.shape, (3, 6))
+        self.assertEqual(region[0, 0], image[8:12, 28:32].mean())
+
+        level, region = pyr.get_overview((0, 256), (100, 500), (64, 64))
+        self.assertEqual(level, 3)
+        self.assertLessEqual(region.shape[0], 64)
+        self.assertLessEqual(region.shape[1], 64)
+        level, region = pyr.get_overview((0, 10), (0, 10), (64, 64))
+        self.assertEqual(level, 0)
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    for testClass in (TestReduce2x, TestImagePyramid):
+        test_suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(testClass))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
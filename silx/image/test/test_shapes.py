@@ -27,7 +27,7 @@
 
 __authors__ = ["T. Vincent"]
 __license__ = "MIT"
-__date__ = "31/05/2016"
+__date__ = "22/06/2016"
 
 
 import logging
@@ -152,6 +152,66 @@ class TestPolygonFill(ParametricTestCase):
                     _logger.debug('ref:\n%s', str(ref_mask))
                 self.assertTrue(is_equal)
 
+    def test_random_polygons(self):
+        """Test threads, cropped masks and labels on random polygons"""
+        shape = 50, 60
+        polygons = [numpy.random.random((nvert, 2)) * (60, 70) - 5
+                    for nvert in (3, 5, 8, 20)]
+        labels = shapes.polygons_to_labels(polygons, shape)
+        self.assertEqual(labels.shape, shape)
+        self.assertEqual(labels.dtype, numpy.int32)
+        ref_labels = numpy.zeros(shape, dtype=numpy.int32)
+
+        for index, vertices in enumerate(polygons):
+            with self.subTest(nvert=len(vertices)):
+                polygon = shapes.Polygon(vertices)
+                ref_mask = polygon.make_mask(*shape, num_threads=1)
+                for num_threads in (2, 4, None):
+                    mask = polygon.make_mask(*shape, num_threads=num_threads)
+                    self.assertTrue(numpy.array_equal(ref_mask, mask))
+
+                cropped, (row, col) = polygon.make_cropped_mask(*shape)
+                mask = numpy.zeros(shape, dtype=numpy.uint8)
+                mask[row:row + cropped.shape[0],
+                     col:col + cropped.shape[1]] = cropped
+                self.assertTrue(numpy.array_equal(ref_mask, mask))
+                ref_labels[ref_mask != 0] = index + 1
+
+        self.assertTrue(numpy.array_equal(labels, ref_labels))
+
+    def test_cropped_mask(self):
+        """Test cropped mask of a small and of an outside polygon"""
+        polygon = shapes.Polygon([(10, 10), (10, 15.5), (13, 15.5), (13, 10)])
+        cropped, offset = polygon.make_cropped_mask(1000, 2000)
+        self.assertLessEqual(cropped.size, 5 * 9)
+        self.assertEqual(cropped.sum(), 3 * 6)
+
+        polygon = shapes.Polygon([(-10, -10), (-5, -10), (-5, -5)])
+        cropped, offset = polygon.make_cropped_mask(10, 20)
+        self.assertEqual(cropped.size, 0)
+
+    def test_is_inside_many(self):
+        """Test is_inside_many against is_inside"""
+        angles = numpy.linspace(0, 2 * numpy.pi, 200, endpoint=False)
+        radius = 20 + 10 * numpy.random.random(200)
+        star = numpy.transpose((30 + radius * numpy.sin(angles),
+                                40 + radius * numpy.cos(angles)))
+        tests = {
+            'star': star,
+            'eight': [(0, 0), (5, 5), (5, 0), (0, 5)],
+            'flat': [(1, 1), (1, 5), (1, 3)],
+            'random': numpy.random.random((10, 2)) * 60,
+        }
+        points = numpy.random.random((2000, 2)) * 80 - 10
+        points[:100] = numpy.round(points[:100])
+        for test_name, vertices in tests.items():
+            with self.subTest(msg=test_name):
+                polygon = shapes.Polygon(vertices)
+                result = polygon.is_inside_many(points)
+                self.assertEqual(result.dtype, numpy.bool_)
+                expected = [polygon.is_inside(row, col) for row, col in points]
+                self.assertTrue(numpy.array_equal(result, expected))
+
 
 class TestDrawLine(ParametricTestCase):
     """basic draw line test"""
@@ -322,9 +382,110 @@ class TestCircleFill(ParametricTestCase):
                 self.assertTrue(is_equal)
 
 
+class TestFillShapes(ParametricTestCase):
+    """Test ellipse, rectangle and polyline rasterization"""
+
+    def setUp(self):
+        self.rows, self.cols = numpy.mgrid[0:100, 0:120]
+
+    def test_ellipse(self):
+        """Test ellipses and annuli against pixel centers"""
+        angle = 0.3
+        u = (self.rows - 50.2) * numpy.cos(angle) + (self.cols - 60.7) * numpy.sin(angle)
+        v = -(self.rows - 50.2) * numpy.sin(angle) + (self.cols - 60.7) * numpy.cos(angle)
+        ellipse = (u / 30.) ** 2 + (v / 45.) ** 2 <= 1
+        hole = (u / 10.) ** 2 + (v / 20.) ** 2 < 1
+        for dtype in (numpy.uint8, numpy.bool_, numpy.int32, numpy.float32):
+            with self.subTest(dtype=dtype):
+                mask = numpy.zeros(self.rows.shape, dtype=dtype)
+                result = shapes.fill_ellipse(mask, (50.2, 60.7), (30, 45), angle)
+                self.assertIs(result, mask)
+                self.assertTrue(numpy.array_equal(mask != 0, ellipse))
+
+                mask = numpy.zeros(self.rows.shape, dtype=dtype)
+                shapes.fill_ellipse(mask, (50.2, 60.7), (30, 45), angle,
+                                    inner_radii=(10, 20), value=2)
+                self.assertTrue(numpy.array_equal(mask != 0, ellipse & ~hole))
+
+        mask = numpy.zeros(self.rows.shape, dtype=numpy.float64)
+        shapes.fill_ellipse(mask, (50.2, 60.7), (30, 45), angle,
+                            inner_radii=(10, 20), antialias=True)
+        self.assertAlmostEqual(mask.sum(), numpy.pi * (30 * 45 - 10 * 20),
+                               delta=1.)
+        self.assertTrue(numpy.all(mask[ellipse & ~hole] > 0))
+        self.assertTrue(numpy.all(mask <= 1))
+
+    def test_rectangle(self):
+        """Test rotated rectangles against pixel centers"""
+        angle = -0.6
+        u = (self.rows - 40) * numpy.cos(angle) + (self.cols - 50) * numpy.sin(angle)
+        v = -(self.rows - 40) * numpy.sin(angle) + (self.cols - 50) * numpy.cos(angle)
+        ref = (abs(u) <= 15) & (abs(v) <= 25.5)
+        mask = numpy.zeros(self.rows.shape, dtype=numpy.uint8)
+        shapes.fill_rectangle(mask, (40, 50), (30, 51), angle)
+        self.assertTrue(numpy.array_equal(mask != 0, ref))
+
+        mask = numpy.zeros(self.rows.shape, dtype=numpy.float32)
+        shapes.fill_rectangle(mask, (40, 50), (30, 51), angle, value=2.,
+                              antialias=True)
+        self.assertAlmostEqual(mask.sum(), 2 * 30 * 51, delta=1.)
+
+        # Axis aligned rectangle on pixel edges
+        mask = numpy.zeros((10, 10), dtype=numpy.float64)
+        shapes.fill_rectangle(mask, (4.5, 5), (4, 3), antialias=True)
+        ref = numpy.zeros((10, 10))
+        ref[3:7, 4:7] = 1
+        self.assertTrue(numpy.array_equal(mask, ref))
+
+    def test_polyline(self):
+        """Test thick polylines"""
+        vertices = [(10, 10), (80, 30.5), (20, 100)]
+        for width in (0.5, 1, 4.2):
+            with self.subTest(width=width):
+                mask = numpy.zeros(self.rows.shape, dtype=numpy.float64)
+                shapes.fill_polyline(mask, vertices, width, antialias=True)
+                length = (numpy.hypot(70, 20.5) + numpy.hypot(60, 69.5))
+                self.assertAlmostEqual(mask.sum(), length * width,
+                                       delta=0.02 * length * width + width ** 2)
+
+                binary = numpy.zeros(self.rows.shape, dtype=numpy.uint8)
+                shapes.fill_polyline(binary, vertices, width)
+                self.assertTrue(numpy.all(mask[binary != 0] > 0))
+
+        # Closed polyline is the outline of the polygon
+        mask = numpy.zeros(self.rows.shape, dtype=numpy.uint8)
+        shapes.fill_polyline(mask, vertices, 3, closed=True, value=5)
+        self.assertEqual(mask[11, 11:14].tolist(), [5, 5, 5])
+        self.assertEqual(mask[16, 57], 5)
+        self.assertEqual(mask.max(), 5)
+
+    def test_threads(self):
+        """Test that the result does not depend on the number of threads"""
+        ref = numpy.zeros(self.rows.shape, dtype=numpy.float64)
+        shapes.fill_polyline(ref, [(10, 10), (80, 30.5), (20, 100)], 3,
+                             antialias=True, num_threads=1)
+        for num_threads in (2, 4, None):
+            mask = numpy.zeros(self.rows.shape, dtype=numpy.float64)
+            shapes.fill_polyline(mask, [(10, 10), (80, 30.5), (20, 100)], 3,
+                                 antialias=True, num_threads=num_threads)
+            self.assertTrue(numpy.array_equal(ref, mask))
+
+    def test_errors(self):
+        """Test unsupported masks"""
+        mask = numpy.zeros((10, 10), dtype=numpy.uint8)
+        self.assertRaises(ValueError, shapes.fill_ellipse, mask, (5, 5),
+                          (2, 3), antialias=True)
+        self.assertRaises(ValueError, shapes.fill_rectangle,
+                          numpy.zeros((10, 10), dtype=numpy.int64), (5, 5),
+                          (2, 3))
+        self.assertRaises(ValueError, shapes.fill_polyline,
+                          numpy.zeros((10, 10))[:, ::2], [(5, 5)], 3)
+
+
 def suite():
     test_suite = unittest.TestSuite()
-    for testClass in (TestPolygonFill, TestDrawLine, TestCircleFill):
+    for testClass in (TestPolygonFill, TestDrawLine, TestCircleFill,
+                      TestFillShapes):
         test_suite.addTest(
             unittest.defaultTestLoader.loadTestsFromTestCase(testClass))
     return test_suite
@@ -0,0 +1,112 @@
+# coding: utf-8
+# /*##########################################################################
+#
+# Copyright (c) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Tests for image statistics"""
+
+__authors__ = ["T. Vincent"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+
+import unittest
+import numpy
+
+from silx.testutils import ParametricTestCase
+from silx.image.stats import statistics
+
+
+class TestStatistics(ParametricTestCase):
+    """Test statistics against numpy"""
+
+    def assertStatistics(self, stats, values, nan_count=0):
+        """Compare stats with the one computed by numpy on values"""
+        values = numpy.asarray(values, dtype=numpy.float64)
+        finite = values[numpy.isfinite(values)]
+        self.assertEqual(stats["finite_count"], finite.size)
+        self.assertEqual(stats["nan_count"], nan_count)
+        self.assertEqual(stats["min"], finite.min())
+        self.assertEqual(stats["max"], finite.max())
+        self.assertEqual(stats["min_positive"], finite[finite > 0].min())
+        self.assertTrue(numpy.isclose(stats["sum"], finite.sum()))
+        self.assertTrue(numpy.isclose(stats["mean"], finite.mean()))
+        self.assertTrue(numpy.isclose(stats["variance"], finite.var()))
+
+    def test_dtypes(self):
+        data = numpy.random.randint(0, 100, (50, 70))
+        for dtype in (numpy.bool_, numpy.int8, numpy.uint8, numpy.int16,
+                      numpy.uint16, numpy.int32, numpy.uint32, numpy.int64,
+                      numpy.uint64, numpy.float16, numpy.float32,
+                      numpy.float64, '>f8'):
+            with self.subTest(dtype=dtype):
+                image = data.astype(dtype)
+                self.assertStatistics(statistics(image, num_threads=2), image)
+
+    def test_nan_inf(self):
+        data = numpy.random.random((40, 30)) - 0.5
+        data[1, 2] = numpy.nan
+        data[3, 4] = numpy.nan
+        data[5, 6] = numpy.inf
+        self.assertStatistics(statistics(data), data, nan_count=2)
+
+    def test_mask(self):
+        data = numpy.random.random((40, 30))
+        mask = numpy.random.random((40, 30)) > 0.5
+        self.assertStatistics(statistics(data, mask=mask), data[~mask])
+
+    def test_sub_rectangle(self):
+        data = numpy.random.random((40, 30))
+        mask = numpy.random.random((40, 30)) > 0.5
+        stats = statistics(data, rows=(5, 20), cols=(3, 10))
+        self.assertStatistics(stats, data[5:20, 3:10])
+        stats = statistics(data, mask=mask, cols=(3, 10))
+        self.assertStatistics(stats, data[:, 3:10][~mask[:, 3:10]])
+        self.assertStatistics(statistics(data[::3, 1::2]), data[::3, 1::2])
+
+    def test_dimensions(self):
+        data = numpy.random.random((3, 4, 5))
+        self.assertStatistics(statistics(data), data)
+        self.assertStatistics(statistics(data[0, 0]), data[0, 0])
+        with self.assertRaises(ValueError):
+            statistics(data, rows=(0, 1))
+
+    def test_empty(self):
+        for data in (numpy.zeros((0, 4)), numpy.array([numpy.nan])):
+            with self.subTest(data=data):
+                stats = statistics(data)
+                self.assertIsNone(stats["min"])
+                self.assertIsNone(stats["max"])
+                self.assertIsNone(stats["min_positive"])
+                self.assertTrue(numpy.isnan(stats["mean"]))
+                self.assertEqual(stats["finite_count"], 0)
+        self.assertIsNone(statistics(-numpy.ones(5))["min_positive"])
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestStatistics))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
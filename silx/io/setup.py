@@ -46,6 +46,13 @@ if SPECFILE_USE_GNU_SOURCE is None:
 else:
     SPECFILE_USE_GNU_SOURCE = int(SPECFILE_USE_GNU_SOURCE)
 
+# Memory mapped files are parsed in place instead of being read in buffers
+SPECFILE_USE_MMAP = os.getenv("SPECFILE_USE_MMAP")
+if SPECFILE_USE_MMAP is None:
+    SPECFILE_USE_MMAP = int(sys.platform != "win32")
+else:
+    SPECFILE_USE_MMAP = int(SPECFILE_USE_MMAP)
+
 if sys.platform == "win32":
     define_macros = [('WIN32',None)]
 elif os.name.lower().startswith('posix'):
@@ -58,6 +65,9 @@ elif os.name.lower().startswith('posix'):
 else:
     define_macros = []
 
+if SPECFILE_USE_MMAP:
+    define_macros.append(('SPECFILE_USE_MMAP', 1))
+
 def configuration(parent_package='', top_path=None):
     config = Configuration('io', parent_package, top_path)
     config.add_subpackage('test')
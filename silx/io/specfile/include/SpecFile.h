@@ -132,6 +132,9 @@ typedef struct _SpecFile{
   long           *data_info;
   SfCursor        cursor;
   short           updating;
+  char           *map;
+  long            mapsize;
+  char           *idxname;
 } SpecFile;
 
 typedef struct _SpecFileOut{
@@ -165,6 +168,8 @@ typedef struct _SpecScan {
  * init
  */
 DllExport extern    SpecFile  *SfOpen        ( char *name, int *error );
+DllExport extern    SpecFile  *SfOpenWithIndex ( char *name, char *idxname,
+                                                 int *error );
 DllExport extern    short      SfUpdate      ( SpecFile *sf,int *error );
 DllExport extern    int        SfClose       ( SpecFile *sf );
 
@@ -239,6 +244,13 @@ DllExport extern  long  SfDataCol       ( SpecFile *sf, long index, long col,
                                              double **data_col, int *error );
 DllExport extern  long  SfDataColByName ( SpecFile *sf, long index,
                                   char *label, double **data_col, int *error );
+DllExport extern  long  SfDataShape     ( SpecFile *sf, long index,
+                                             long *columns, int *error );
+DllExport extern  long  SfDataToBuffer  ( SpecFile *sf, long index,
+                    double *buffer, long rows, long columns, int *error );
+DllExport extern  long  SfDataColumnsToBuffer ( SpecFile *sf, long index,
+                    long *columns, long ncolumns, double *buffer, long rows,
+                    int *error );
 
   /*
    * MCA functions
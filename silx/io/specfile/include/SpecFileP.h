@@ -59,6 +59,14 @@
 #define   SF_TEMPERATURE     'X'
 #define   SF_MCA_DATA        '@'
 
+/*
+ * True if ptr points into the memory mapped file, in which case
+ * it must not be freed.
+ */
+#define   SF_MAPPED(sf,ptr)  ((sf)->map != (char *)NULL && \
+                              (ptr) >= (sf)->map &&        \
+                              (ptr) <  (sf)->map + (sf)->mapsize)
+
 /*
  * Library internal functions
  */
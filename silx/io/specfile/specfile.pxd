@@ -37,6 +37,7 @@ ctypedef _SpecFile SpecFileHandle
 cdef extern from "SpecFileCython.h":
     # sfinit
     SpecFileHandle* SfOpen(char*, int*)
+    SpecFileHandle* SfOpenWithIndex(char*, char*, int*)
     int SfClose(SpecFileHandle*)
     char* SfError(int)
     
@@ -51,6 +52,9 @@ cdef extern from "SpecFileCython.h":
     int SfData(SpecFileHandle*, long, double***, long**, int*)
     long SfDataLine(SpecFileHandle*, long, long, double**, int*)
     long SfDataColByName(SpecFileHandle*, long, char*, double**, int*)
+    long SfDataShape(SpecFileHandle*, long, long*, int*)
+    long SfDataToBuffer(SpecFileHandle*, long, double*, long, long, int*)
+    long SfDataColumnsToBuffer(SpecFileHandle*, long, long*, long, double*, long, int*)
     
     # sfheader
     #char* SfTitle(SpecFileHandle*, long, int*)
@@ -74,6 +74,17 @@ provided by :class:`Scan`::
     for mca_data in first_scan.mca:
         print(sum(mca_data))
 
+Opening a file requires reading it entirely to locate its scans. For large
+files, the positions of the scans can be saved in an index file, so that the
+next opening only reads the index file and the scans appended in the
+meantime::
+
+    # Index file in the user cache directory
+    sf = SpecFile("t.dat", index_file=True)
+
+    # Index file next to the data file
+    sf = SpecFile("t.dat", index_file="t.dat.sfidx")
+
 Classes
 =======
 
@@ -86,6 +97,7 @@ __authors__ = ["P. Knobel"]
 __license__ = "MIT"
 __date__ = "22/03/2016"
 
+import hashlib
 import os.path
 import logging
 import numpy
@@ -512,6 +524,20 @@ class Scan(object):
         """
         return self._specfile.data_column_by_name(self._index, label)
 
+    def data_columns(self, labels):
+        """data_columns(labels)
+
+        Returns several data columns, parsing only the requested columns
+
+        :param labels: Labels of data columns to retrieve, as defined on
+            the ``#L`` line of the scan header.
+        :type labels: list of str
+
+        :return: 2D array of doubles with one row per label
+        :rtype: numpy.ndarray
+        """
+        return self._specfile.data_columns(self._index, labels)
+
     def motor_position_by_name(self, name):
         """motor_position_by_name(name)
 
@@ -536,11 +562,49 @@ def _string_to_char_star(string_):
     return string_
 
 
+def _path_to_char_star(path):
+    """_path_to_char_star(path)
+
+    Convert a path to bytes encoded with the file system encoding"""
+    if sys.version.startswith("3"):
+        return os.fsencode(path)
+    if isinstance(path, unicode):
+        return path.encode(sys.getfilesystemencoding())
+    return path
+
+
+def _default_index_file(filename):
+    """Return the path of the index file of a SpecFile in the cache
+    directory ``$XDG_CACHE_HOME/silx/specfile`` (by default
+    ``~/.cache/silx/specfile``), which is created if needed.
+
+    :param str filename: Absolute path of the SpecFile
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME",
+                               os.path.join(os.path.expanduser("~"), ".cache"))
+    cache_dir = os.path.join(cache_dir, "silx", "specfile")
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # the index is then not saved
+            _logger.debug("Cannot create directory %s", cache_dir)
+    digest = hashlib.sha1(_path_to_char_star(filename)).hexdigest()
+    return os.path.join(cache_dir, digest + ".sfidx")
+
+
 cdef class SpecFile(object):
-    """``SpecFile(filename)``
+    """``SpecFile(filename, index_file=None)``
 
     :param filename: Path of the SpecFile to read
     :type filename: string
+    :param index_file: Path of a file where the positions of the scans
+        are saved, to open the file again without reading it. It is
+        updated when scans are appended to the file, and rewritten when
+        the file was modified otherwise. ``True`` uses a file in the
+        user cache directory. ``None`` (default) or ``False`` not to use
+        an index file.
+    :type index_file: string or bool
 
     This class wraps the main data and header access functions of the C
     SpecFile library.
@@ -552,21 +616,31 @@ cdef class SpecFile(object):
         int __open_failed
     
    
-    def __cinit__(self, filename):
+    def __cinit__(self, filename, index_file=None):
         cdef int error = SF_ERR_NO_ERRORS
-        self.__open_failed = 0
+        # __dealloc__ must not close the file until it is opened
+        self.__open_failed = 1
 
-        if os.path.isfile(filename):
-            filename = _string_to_char_star(filename)
-            self.handle =  SfOpen(filename, &error)
-        else:
-            self.__open_failed = 1
+        if not os.path.isfile(filename):
             self._handle_error(SF_ERR_FILE_OPEN)
+        if index_file is None or index_file is False:
+            c_filename = _path_to_char_star(filename)
+            self.handle = SfOpen(c_filename, &error)
+        else:
+            # the index file is keyed on the absolute path
+            filename = os.path.abspath(filename)
+            if index_file is True:
+                index_file = _default_index_file(filename)
+            elif not isinstance(index_file, (bytes, unicode)):
+                raise TypeError("index_file must be a path or a bool")
+            c_filename = _path_to_char_star(filename)
+            c_index_file = _path_to_char_star(index_file)
+            self.handle = SfOpenWithIndex(c_filename, c_index_file, &error)
         if error:
-            self.__open_failed = 1
             self._handle_error(error)
+        self.__open_failed = 0
        
-    def __init__(self, filename):
+    def __init__(self, filename, index_file=None):
         self.filename = filename
         
     def __dealloc__(self):
@@ -792,36 +866,29 @@ cdef class SpecFile(object):
         :rtype: numpy.ndarray
         """
         cdef:
-            double** mydata
-            long* data_info
-            int i, j
+            numpy.ndarray[numpy.double_t, ndim=2, mode="c"] ret_array
             int error = SF_ERR_NO_ERRORS
-            long nlines, ncolumns, regular
+            long nlines, ncolumns = 0
 
-        sfdata_error = SfData(self.handle,
-                              scan_index + 1,
-                              &mydata,
-                              &data_info,
-                              &error)
+        # Get the shape, then parse directly into the array memory
+        nlines = SfDataShape(self.handle,
+                             scan_index + 1,
+                             &ncolumns,
+                             &error)
         self._handle_error(error)
-
-        if <long>data_info != 0:
-            nlines = data_info[0]
-            ncolumns = data_info[1]
-            regular = data_info[2]
-        else:
+        if nlines <= 0 or ncolumns <= 0:
             nlines = 0
             ncolumns = 0
-            regular = 0
-
-        cdef numpy.ndarray ret_array = numpy.empty((nlines, ncolumns),
-                                                   dtype=numpy.double)
-        for i in range(nlines):
-            for j in range(ncolumns):
-                ret_array[i, j] = mydata[i][j]
 
-        freeArrNZ(<void ***>&mydata, nlines)
-        free(data_info)
+        ret_array = numpy.empty((nlines, ncolumns), dtype=numpy.double)
+        if nlines > 0:
+            nlines = SfDataToBuffer(self.handle,
+                                    scan_index + 1,
+                                    &ret_array[0, 0],
+                                    nlines,
+                                    ncolumns,
+                                    &error)
+            self._handle_error(error)
         return ret_array
 
     def data_column_by_name(self, scan_index, label):
@@ -861,6 +928,65 @@ cdef class SpecFile(object):
         free(data_column)
         return ret_array
 
+    def data_columns(self, scan_index, labels):
+        """data_columns(scan_index, labels)
+
+        Returns several data columns for the specified scan index.
+
+        Only the values of the requested columns are converted, which is
+        much faster than reading the complete scan data when only a few
+        of many columns are needed.
+
+        :param scan_index: Unique scan index between ``0`` and
+            ``len(self)-1``.
+        :type scan_index: int
+        :param labels: Labels of data columns, as defined in the ``#L``
+            line of the scan header.
+        :type labels: list of str
+
+        :return: 2D array of doubles with one row per label
+        :rtype: numpy.ndarray
+        :raise KeyError: If a label is not found
+        """
+        cdef:
+            numpy.ndarray[numpy.double_t, ndim=2, mode="c"] ret_array
+            numpy.ndarray[long, ndim=1, mode="c"] columns
+            int error = SF_ERR_NO_ERRORS
+            long nlines, ncolumns = 0
+
+        all_labels = self.labels(scan_index)
+        indices = []
+        for label in labels:
+            if label not in all_labels:
+                raise KeyError("Column label %s not found in scan %d" %
+                               (label, scan_index))
+            indices.append(all_labels.index(label))
+        unique_indices, positions = numpy.unique(indices,
+                                                 return_inverse=True)
+        columns = numpy.ascontiguousarray(unique_indices, dtype=numpy.int_)
+
+        nlines = SfDataShape(self.handle,
+                             scan_index + 1,
+                             &ncolumns,
+                             &error)
+        self._handle_error(error)
+        nlines = max(nlines, 0)
+
+        ret_array = numpy.empty((len(columns), nlines), dtype=numpy.double)
+        if nlines > 0 and len(columns) > 0:
+            SfDataColumnsToBuffer(self.handle,
+                                  scan_index + 1,
+                                  &columns[0],
+                                  len(columns),
+                                  &ret_array[0, 0],
+                                  nlines,
+                                  &error)
+            self._handle_error(error)
+
+        if len(columns) == len(indices) and numpy.all(positions == numpy.arange(len(indices))):
+            return ret_array
+        return ret_array[positions]
+
     def scan_header(self, scan_index):
         """scan_header(scan_index)
 
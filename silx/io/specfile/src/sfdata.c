@@ -98,6 +98,20 @@ DllExport long SfDataCol      ( SpecFile *sf, long index, long col,
                                           double **data_col, int *error );
 DllExport long SfDataColByName( SpecFile *sf, long index,
                                   char *label, double **data_col, int *error );
+DllExport long SfDataShape    ( SpecFile *sf, long index,
+                                  long *columns, int *error );
+DllExport long SfDataToBuffer ( SpecFile *sf, long index, double *buffer,
+                                  long rows, long columns, int *error );
+DllExport long SfDataColumnsToBuffer( SpecFile *sf, long index,
+                                  long *columns, long ncolumns,
+                                  double *buffer, long rows, int *error );
+
+static long sfParseLine   ( char *ptr, char *end, double *values,
+                                  long maxvalues, long *select, long stride );
+static long sfParseData   ( char *from, char *to, double *buffer,
+                                  long maxrows, long *columns, long *select );
+static int  sfDataRange   ( SpecFile *sf, long index, char **from,
+                                  char **to, int *error );
 
 
 /*********************************************************************
@@ -470,6 +484,383 @@ if(0){
      return( 0 );
 }
 
+
+/*********************************************************************
+ *   Function:        long sfParseLine( ptr, end, values, maxvalues )
+ *
+ *   Description:    Splits a data line as SfData does: values are
+ *                   separated by spaces or tabs and only the characters
+ *                   of numbers are kept.
+ *                   Only the values of selected columns are converted.
+ *
+ *   Parameters:
+ *        Input :    (1) Start of the line
+ *                   (2) End of the line (newline character)
+ *                   (3) Array where to store values or NULL to only
+ *                       count them
+ *                   (4) Number of columns to consider for storage
+ *                   (5) For each of the maxvalues columns, the position
+ *                       where to store it in values (-1 to skip it),
+ *                       or NULL to store all columns in order
+ *                   (6) Distance between positions in values
+ *   Returns:
+ *            Number of values in the line
+ *
+ *********************************************************************/
+static long
+sfParseLine( char *ptr, char *end, double *values, long maxvalues,
+             long *select, long stride )
+{
+    char  strval[100];
+    int   i = 0;
+    long  cols = 0,
+          pos;
+
+    while (ptr < end && *ptr == ' ') ptr++;
+
+    for ( ; ptr < end; ptr++) {
+        if (*ptr == ' ' || *ptr == '\t') {
+            if (values != (double *)NULL && cols < maxvalues) {
+                pos = (select != (long *)NULL) ? select[cols] : cols;
+                if (pos >= 0) {
+                    strval[i] = '\0';
+                    values[pos * stride] = PyMcaAtof(strval);
+                }
+            }
+            cols++;
+            i = 0;
+            while (ptr + 1 < end && (*(ptr+1) == ' ' || *(ptr+1) == '\t'))
+                ptr++;
+        } else if (isnumber(*ptr) && i < 99) {
+            strval[i] = *ptr;
+            i++;
+        }
+    }
+    if (i != 0) {
+        if (values != (double *)NULL && cols < maxvalues) {
+            pos = (select != (long *)NULL) ? select[cols] : cols;
+            if (pos >= 0) {
+                strval[i] = '\0';
+                values[pos * stride] = PyMcaAtof(strval);
+            }
+        }
+        cols++;
+    }
+    return(cols);
+}
+
+
+/*********************************************************************
+ *   Function:        long sfParseData( from, to, buffer, maxrows, columns,
+ *                                     select )
+ *
+ *   Description:    Parses the data lines of a scan, skipping comments
+ *                   and MCA spectra. Lines with a number of values
+ *                   different from the first data line are ignored.
+ *
+ *   Parameters:
+ *        Input :    (1) Start of the data block
+ *                   (2) End of the data block
+ *                   (3) Contiguous array where to store data or NULL to
+ *                       only count lines and columns:
+ *                       maxrows x columns values if select is NULL,
+ *                       else one line of maxrows values per selected
+ *                       column
+ *                   (4) Number of lines of buffer. When only
+ *                       counting, number of lines after which to stop
+ *                       (0 to parse the whole block)
+ *                   (6) For each column, the line of buffer where to
+ *                       store it (-1 to skip it) or NULL
+ *        Output:
+ *                   (5) Number of columns (input if buffer is not NULL)
+ *   Returns:
+ *            Number of data lines
+ *
+ *********************************************************************/
+static long
+sfParseData( char *from, char *to, double *buffer, long maxrows,
+             long *columns, long *select )
+{
+    char *ptr = from,
+         *eol;
+    long  rows = 0,
+          cols,
+          ncols = (buffer != (double *)NULL) ? *columns : -1;
+
+    while (ptr < to) {
+        if ((buffer != (double *)NULL || maxrows > 0) && rows >= maxrows)
+            break;
+
+        /* the last line is only taken if it ends with \n */
+        eol = memchr(ptr, '\n', to - ptr);
+        if (eol == (char *)NULL)
+            break;
+
+        if (*ptr == '#') {
+            ptr = eol + 1;
+            continue;
+        }
+        if (*ptr == '@') {
+            /* MCA spectrum: newlines preceded by MCA_CONT are continued */
+            while (eol != (char *)NULL && *(eol-1) == MCA_CONT)
+                eol = memchr(eol + 1, '\n', to - eol - 1);
+            if (eol == (char *)NULL)
+                break;
+            ptr = eol + 1;
+            continue;
+        }
+
+        if (buffer != (double *)NULL && select != (long *)NULL) {
+            cols = sfParseLine(ptr, eol, buffer + rows, ncols,
+                               select, maxrows);
+        } else if (buffer != (double *)NULL) {
+            cols = sfParseLine(ptr, eol, buffer + rows * ncols, ncols,
+                               (long *)NULL, 1);
+        } else {
+            cols = sfParseLine(ptr, eol, (double *)NULL, 0,
+                               (long *)NULL, 1);
+            if (cols > 0 && ncols == -1)
+                ncols = cols;
+        }
+        if (cols > 0 && cols == ncols)
+            rows++;
+        ptr = eol + 1;
+    }
+
+    if (buffer == (double *)NULL)
+        *columns = (ncols == -1) ? 0 : ncols;
+    return(rows);
+}
+
+
+/*********************************************************************
+ *   Function:        int sfDataRange( sf, index, from, to, error )
+ *
+ *   Description:    Sets current scan and gets the limits of its data
+ *                   block in the scan buffer.
+ *
+ *   Returns:
+ *            (  1 ) => OK
+ *            (  0 ) => Scan without data
+ *            ( -1 ) => errors occured
+ *
+ *********************************************************************/
+static int
+sfDataRange( SpecFile *sf, long index, char **from, char **to, int *error )
+{
+    SpecScan *scan;
+    char     *ptr;
+
+    if (index <= 0) {
+        *error = SF_ERR_SCAN_NOT_FOUND;
+        return(-1);
+    }
+    if (sfSetCurrent(sf, index, error) == -1)
+        return(-1);
+
+    scan = (SpecScan *)sf->current->contents;
+    if (scan->data_offset == -1)
+        return(0);
+
+    *from = sf->scanbuffer + (scan->data_offset - scan->offset);
+    *to   = sf->scanbuffer + scan->size;
+    if (*to > sf->scanbuffer + sf->scansize) {
+        /* same limit as SfData */
+        ptr = sf->scanbuffer + sf->scansize - 32;
+        while (*ptr != '\n') ptr--;
+        *to = ptr;
+    }
+    return(1);
+}
+
+
+/*********************************************************************
+ *   Function:        long SfDataShape( sf, index, columns, error )
+ *
+ *   Description:    Gets the shape of the data of a scan, as returned
+ *                   by SfData, without converting values.
+ *
+ *   Parameters:
+ *        Input :    (1) File pointer
+ *                   (2) Index
+ *        Output:
+ *                   (3) Number of columns
+ *                   (4) error number
+ *   Returns:
+ *            Number of data lines,
+ *            ( -1 ) => errors occured
+ *   Possible errors:
+ *            SF_ERR_MEMORY_ALLOC
+ *            SF_ERR_FILE_READ
+ *            SF_ERR_SCAN_NOT_FOUND
+ *
+ *********************************************************************/
+DllExport long
+SfDataShape( SpecFile *sf, long index, long *columns, int *error )
+{
+    char *from = NULL,
+         *to   = NULL;
+    int   ret;
+
+    *columns = 0;
+    ret = sfDataRange(sf, index, &from, &to, error);
+    if (ret <= 0)
+        return(ret);
+
+    if (sf->data_info != (long *)NULL) {
+        *columns = sf->data_info[COL];
+        return(sf->data_info[ROW]);
+    }
+    return(sfParseData(from, to, (double *)NULL, 0, columns, (long *)NULL));
+}
+
+
+/*********************************************************************
+ *   Function:        long SfDataToBuffer( sf, index, buffer, rows,
+ *                                         columns, error )
+ *
+ *   Description:    Parses the data of a scan directly into a
+ *                   contiguous (C order) array provided by the caller.
+ *                   The shape of the array is given by SfDataShape.
+ *
+ *   Parameters:
+ *        Input :    (1) File pointer
+ *                   (2) Index
+ *                   (3) Array of rows x columns doubles
+ *                   (4) Number of lines of buffer. When only
+ *                       counting, number of lines after which to stop
+ *                       (0 to parse the whole block)
+ *                   (5) Number of columns of buffer
+ *        Output:
+ *                   (6) error number
+ *   Returns:
+ *            Number of data lines stored in buffer,
+ *            ( -1 ) => errors occured
+ *   Possible errors:
+ *            SF_ERR_MEMORY_ALLOC
+ *            SF_ERR_FILE_READ
+ *            SF_ERR_SCAN_NOT_FOUND
+ *            SF_ERR_COL_NOT_FOUND
+ *
+ *********************************************************************/
+DllExport long
+SfDataToBuffer( SpecFile *sf, long index, double *buffer, long rows,
+                long columns, int *error )
+{
+    char *from = NULL,
+         *to   = NULL;
+    long  i;
+    int   ret;
+
+    ret = sfDataRange(sf, index, &from, &to, error);
+    if (ret <= 0 || rows <= 0 || columns <= 0)
+        return(ret < 0 ? -1 : 0);
+
+    if (sf->data_info != (long *)NULL) {
+        if (sf->data_info[COL] != columns) {
+            *error = SF_ERR_COL_NOT_FOUND;
+            return(-1);
+        }
+        if (rows > sf->data_info[ROW])
+            rows = sf->data_info[ROW];
+        for (i = 0; i < rows; i++)
+            memcpy(buffer + i * columns, sf->data[i],
+                   sizeof(double) * columns);
+        return(rows);
+    }
+    return(sfParseData(from, to, buffer, rows, &columns, (long *)NULL));
+}
+
+
+/*********************************************************************
+ *   Function:        long SfDataColumnsToBuffer( sf, index, columns,
+ *                                  ncolumns, buffer, rows, error )
+ *
+ *   Description:    Parses only some columns of the data of a scan
+ *                   into a contiguous array provided by the caller.
+ *                   Lines are split as by SfData but only the values
+ *                   of the requested columns are converted.
+ *
+ *   Parameters:
+ *        Input :    (1) File pointer
+ *                   (2) Index
+ *                   (3) 0-based indices of the columns to read,
+ *                       without duplicates
+ *                   (4) Number of columns to read
+ *                   (5) Array of ncolumns x rows doubles, each column
+ *                       being stored contiguously
+ *                   (6) Number of lines of buffer, as given by
+ *                       SfDataShape
+ *        Output:
+ *                   (7) error number
+ *   Returns:
+ *            Number of data lines stored in buffer,
+ *            ( -1 ) => errors occured
+ *   Possible errors:
+ *            SF_ERR_MEMORY_ALLOC
+ *            SF_ERR_FILE_READ
+ *            SF_ERR_SCAN_NOT_FOUND
+ *            SF_ERR_COL_NOT_FOUND
+ *
+ *********************************************************************/
+DllExport long
+SfDataColumnsToBuffer( SpecFile *sf, long index, long *columns,
+                       long ncolumns, double *buffer, long rows,
+                       int *error )
+{
+    char *from = NULL,
+         *to   = NULL;
+    long *select;
+    long  ncols = 0,
+          i, j;
+    int   ret;
+
+    ret = sfDataRange(sf, index, &from, &to, error);
+    if (ret == -1)
+        return(-1);
+
+    /*
+     * The number of columns is the one of the first data line
+     */
+    if (sf->data_info != (long *)NULL) {
+        ncols = sf->data_info[COL];
+        if (rows > sf->data_info[ROW])
+            rows = sf->data_info[ROW];
+    } else if (ret > 0) {
+        sfParseData(from, to, (double *)NULL, 1, &ncols, (long *)NULL);
+    }
+
+    for (j = 0; j < ncolumns; j++) {
+        if (columns[j] < 0 || columns[j] >= ncols) {
+            *error = SF_ERR_COL_NOT_FOUND;
+            return(-1);
+        }
+    }
+    if (rows <= 0 || ncolumns <= 0)
+        return(0);
+
+    if (sf->data_info != (long *)NULL) {
+        for (j = 0; j < ncolumns; j++)
+            for (i = 0; i < rows; i++)
+                buffer[j * rows + i] = sf->data[i][columns[j]];
+        return(rows);
+    }
+
+    select = (long *) malloc(sizeof(long) * ncols);
+    if (select == (long *)NULL) {
+        *error = SF_ERR_MEMORY_ALLOC;
+        return(-1);
+    }
+    for (i = 0; i < ncols; i++)
+        select[i] = -1;
+    for (j = 0; j < ncolumns; j++)
+        select[columns[j]] = j;
+
+    rows = sfParseData(from, to, buffer, rows, &ncols, select);
+    free(select);
+    return(rows);
+}
+
 
 DllExport long
 SfDataCol ( SpecFile *sf, long index, long col, double **retdata, int *error )
@@ -594,15 +985,14 @@ SfDataColByName( SpecFile *sf, long index, char *label, double **retdata, int *e
 
       double *datacol;
 
-      long     *dinfo    = NULL;
-      double  **data     = NULL;
-
-      int      i,ret;
+      long     ret;
 
       char **labels = NULL;
 
       long  nb_lab,
-            idx;
+            idx,
+            nrows,
+            ncols;
 
       short tofree=0;
 
@@ -634,33 +1024,31 @@ SfDataColByName( SpecFile *sf, long index, char *label, double **retdata, int *e
           return(-1);
       }
 
-      ret = SfData(sf,index,&data,&dinfo,error);
+      if (tofree) freeArrNZ((void ***)&labels,nb_lab);
 
-      if (ret == -1) {
+      /*
+       * Only convert the values of the requested column
+       */
+      nrows = SfDataShape(sf,index,&ncols,error);
+      if (nrows == -1) {
          *retdata = (double *)NULL;
           return(-1);
       }
 
-      datacol = (double *) malloc( sizeof(double) * dinfo[ROW]);
+      datacol = (double *) malloc( sizeof(double) * (nrows > 0 ? nrows : 1));
       if (datacol == (double *)NULL) {
           *error  = SF_ERR_MEMORY_ALLOC;
-           if ( dinfo != (long *)NULL)
-              freeArrNZ((void ***)&data,dinfo[ROW]);
-           free(dinfo);
           *retdata = (double *)NULL;
            return(-1);
       }
 
-      for (i=0;i<dinfo[ROW];i++) {
-         datacol[i] = data[i][idx];
+      ret = SfDataColumnsToBuffer(sf,index,&idx,1,datacol,nrows,error);
+      if (ret == -1) {
+          free(datacol);
+          *retdata = (double *)NULL;
+           return(-1);
       }
 
-      ret = dinfo[ROW];
-
-      if ( dinfo != (long *)NULL)
-           freeArrNZ((void ***)&data,dinfo[ROW]);
-      free(dinfo);
-
      *retdata = datacol;
 
       return(ret);
@@ -107,6 +107,10 @@
 #include <unistd.h>
 #endif
 
+#ifdef SPECFILE_USE_MMAP
+#include <sys/mman.h>
+#endif
+
 #include <SpecFile.h>
 #include <SpecFileP.h>
 
@@ -118,29 +122,38 @@
 #define NEWLINE      1
 #define COMMENT      2
 
-#define SF_ISFX      ".sfI"
-
 #define SF_INIT      0
 #define SF_READY     1
 #define SF_MODIFIED  2
 
+/*
+ * Index file: magic, then little endian 64 bit integers
+ */
+#define SF_IDX_MAGIC    "SFINDEX\n"
+#define SF_IDX_VERSION  1
+#define SF_IDX_HEADER   6     /* version, size, mtime, checksum, path length, no. of scans */
+#define SF_IDX_CURSOR   11    /* fields of SfCursor */
+#define SF_IDX_SCAN     10    /* fields of SpecScan */
+#define SF_IDX_TAIL     4096  /* bytes at the end of the file used as checksum */
+
+#ifdef _WINDOWS
+#define SF_IDX_WRITEFLAG  O_CREAT | O_WRONLY | O_TRUNC | O_BINARY
+#else
+#define SF_IDX_WRITEFLAG  O_CREAT | O_WRONLY | O_TRUNC
+#endif
+
 /*
  * Function declaration
  */
 
 DllExport SpecFile * SfOpen   ( char *name,int *error);
 DllExport SpecFile * SfOpen2  ( int fd, char *name,int *error);
+DllExport SpecFile * SfOpenWithIndex ( char *name, char *idxname, int *error);
 DllExport int        SfClose  ( SpecFile *sf);
 DllExport short      SfUpdate ( SpecFile *sf, int *error);
 DllExport char     * SfError  ( int error);
 
 
-#ifdef linux
-char SF_SIGNATURE[] =  "Linux 2ruru Sf2.0";
-#else
-char SF_SIGNATURE[] =  "2ruru Sf2.0";
-#endif
-
 /*
  * Internal functions
  */
@@ -150,14 +163,25 @@ static void  sfNewLine     ( SpecFile *sf, SfCursor *cursor, char c0,char c1,int
 static void  sfHeaderLine  ( SpecFile *sf, SfCursor *cursor, char c,int *error);
 static void  sfNewBlock    ( SpecFile *sf, SfCursor *cursor, short how,int *error);
 static void  sfSaveScan    ( SpecFile *sf, SfCursor *cursor, int *error);
-static void  sfAssignScanNumbers (SpecFile *sf);
+static void  sfAssignScanNumbers (SpecFile *sf, ObjectList *from);
+static int   sfCompareScans ( const void *scan1, const void *scan2 );
 static void  sfReadFile    ( SpecFile *sf, SfCursor *cursor, int *error);
+static short sfReadBuffer  ( SpecFile *sf, SfCursor *cursor, short status,
+                             char *buffer, long size, int *error);
 static void  sfResumeRead  ( SpecFile *sf, SfCursor *cursor, int *error);
-#ifdef SPECFILE_USE_INDEX_FILE
-static short sfOpenIndex   ( SpecFile *sf, SfCursor *cursor, int *error);
-static short sfReadIndex   ( int sfi, SpecFile *sf, SfCursor *cursor, int *error);
+static void  sfMapFile     ( SpecFile *sf );
+static void  sfUnmapFile   ( SpecFile *sf );
+static SpecFile *sfOpenFd   ( int fd, char *name, char *idxname, int *error);
+static short sfReadIndex   ( SpecFile *sf, SfCursor *cursor, int *error);
+static short sfParseIndex  ( SpecFile *sf, SfCursor *cursor,
+                             unsigned char *buffer, long size, int *error);
 static void  sfWriteIndex  ( SpecFile *sf, SfCursor *cursor, int *error);
-#endif
+static int   sfTailHash    ( SpecFile *sf, long size, unsigned long *hash);
+static void  sfPutScan     ( unsigned char *buffer, SpecScan *scan );
+static void  sfGetScan     ( unsigned char *buffer, SpecScan *scan );
+static long long sfModTime ( struct stat *mystat );
+static void  sfPutLong     ( unsigned char *buffer, long long value );
+static long long sfGetLong ( unsigned char *buffer );
 
 /*
  * errors
@@ -247,10 +271,52 @@ SfOpen(char *name, int *error) {
 
 DllExport SpecFile *
 SfOpen2(int fd, char *name,int *error) {
+   return (sfOpenFd(fd, name, (char *)NULL, error));
+}
+
+
+/*********************************************************************
+ *   Function:          SpecFile *SfOpenWithIndex( name, idxname, error)
+ *
+ *   Description:       Opens connection to Spec data file.
+ *                      The index list is loaded from an index file
+ *                      when it is up to date, so that the file is not
+ *                      read. Scans appended to the file since the
+ *                      index was written are indexed and the index
+ *                      file is updated.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) Filename
+ *                      (2) Index filename
+ *              Output:
+ *                      (3) error number
+ *   Returns:
+ *                      SpecFile pointer.
+ *                      NULL if not successful.
+ *
+ *   Possible errors:
+ *                      SF_ERR_FILE_OPEN
+ *                      SF_ERR_MEMORY_ALLOC
+ *
+ *********************************************************************/
+
+DllExport SpecFile *
+SfOpenWithIndex(char *name, char *idxname, int *error) {
+
+   int         fd;
+   fd   = open(name,SF_OPENFLAG);
+   return (sfOpenFd(fd, name, idxname, error));
+}
+
+
+static SpecFile *
+sfOpenFd(int fd, char *name, char *idxname, int *error) {
    SpecFile   *sf;
    short       idxret;
    SfCursor      cursor;
    struct stat mystat;
+   ObjectList *last;
 
    if ( fd == -1 ) {
       *error = SF_ERR_FILE_OPEN;
@@ -291,6 +357,12 @@ SfOpen2(int fd, char *name,int *error) {
    sf->data            = (double **)NULL;
    sf->data_info       = (long *)NULL;
    sf->updating        = 0;
+   sf->map             = (char *)NULL;
+   sf->mapsize         = 0;
+   sf->idxname         = (idxname == (char *)NULL) ?
+                             (char *)NULL : (char *)strdup(idxname);
+
+   sfMapFile(sf);
 
   /*
    * Init cursor
@@ -304,17 +376,18 @@ SfOpen2(int fd, char *name,int *error) {
    cursor.what         = 0;
    cursor.data         = 0;
    cursor.file_header  = 0;
+   cursor.fileh_size   = 0;
+   cursor.datalines    = 0;
 
-
-#ifdef SPECFILE_USE_INDEX_FILE
   /*
    * Check if index file
    *   open it and continue from there
    */
-   idxret = sfOpenIndex(sf,&cursor,error);
-#else
    idxret = SF_INIT;
-#endif
+   if (sf->idxname != (char *)NULL) {
+      idxret = sfReadIndex(sf,&cursor,error);
+   }
+   last = sf->list.last;
 
    switch(idxret) {
       case SF_MODIFIED:
@@ -337,12 +410,17 @@ SfOpen2(int fd, char *name,int *error) {
 
   /*
    * Once is all done assign scan numbers and orders
+   * (the index file has them up to its last scan)
    */
-   sfAssignScanNumbers(sf);
+   if (idxret == SF_INIT) {
+      sfAssignScanNumbers(sf,sf->list.first);
+   } else if (idxret == SF_MODIFIED) {
+      sfAssignScanNumbers(sf,last);
+   }
 
-#ifdef SPECFILE_USE_INDEX_FILE
-   if (idxret != SF_READY) sfWriteIndex(sf,&cursor,error);
-#endif
+   if (sf->idxname != (char *)NULL && idxret != SF_READY) {
+      sfWriteIndex(sf,&cursor,error);
+   }
    return(sf);
 }
 
@@ -378,12 +456,17 @@ SfClose( SpecFile *sf )
      }
 
      free ((char *)sf->sfname);
-     if (sf->scanbuffer != NULL)
+     if (sf->idxname != NULL)
+        free ((char *)sf->idxname);
+
+     if (sf->scanbuffer != NULL && !SF_MAPPED(sf,sf->scanbuffer))
         free ((char *)sf->scanbuffer);
 
-     if (sf->filebuffer != NULL)
+     if (sf->filebuffer != NULL && !SF_MAPPED(sf,sf->filebuffer))
         free ((char *)sf->filebuffer);
 
+     sfUnmapFile(sf);
+
      if( close(sf->fd) ) {
 	  return( -1 ) ;
      }
@@ -421,6 +504,7 @@ SfUpdate ( SpecFile *sf, int *error )
 {
     struct stat mystat;
     long   mtime;
+    ObjectList *last;
    /*printf("In SfUpdate\n");
    __asm("int3");*/
     stat(sf->sfname,&mystat);
@@ -428,14 +512,17 @@ SfUpdate ( SpecFile *sf, int *error )
     mtime = mystat.st_mtime;
 
     if (sf->m_time != mtime)  {
+       last = sf->list.last;
        sfResumeRead (sf,&(sf->cursor),error);
+       sfMapFile    (sf);
        sfReadFile   (sf,&(sf->cursor),error);
 
        sf->m_time = mtime;
-       sfAssignScanNumbers(sf);
-#ifdef SPECFILE_USE_INDEX_FILE
-       sfWriteIndex (sf,&(sf->cursor),error);
-#endif
+       sfAssignScanNumbers(sf,(last != (ObjectList *)NULL) ? last :
+                                                             sf->list.first);
+       if (sf->idxname != (char *)NULL) {
+          sfWriteIndex (sf,&(sf->cursor),error);
+       }
        return(1);
     }else{
        return(0);
@@ -469,7 +556,7 @@ sfReadFile(SpecFile *sf,SfCursor *cursor,int *error) {
 
    int         fd;
 
-   char  *buffer,*ptr;
+   char  *buffer;
 
    long  size,bytesread;
 
@@ -477,6 +564,17 @@ sfReadFile(SpecFile *sf,SfCursor *cursor,int *error) {
 
    fd   = sf->fd;
 
+  /*
+   * A memory mapped file is parsed in place as a single buffer
+   */
+   if (sf->map != (char *)NULL && sf->mapsize - cursor->bytecnt > 1) {
+      sfReadBuffer(sf,cursor,NEWLINE,sf->map + cursor->bytecnt,
+                   sf->mapsize - cursor->bytecnt,error);
+      sf->no_scans = cursor->scanno;
+      sfSaveScan(sf,cursor,error);
+      return;
+   }
+
    size = 1024*1024;
 
 
@@ -499,18 +597,7 @@ sfReadFile(SpecFile *sf,SfCursor *cursor,int *error) {
 
    status              = NEWLINE;
    while ((bytesread = read(fd,buffer,size)) > 0 ) {
-
-      sfStartBuffer(sf,cursor,status,buffer[0],buffer[1],error);
-
-      cursor->bytecnt++;
-      for (ptr=buffer+1;ptr < buffer + bytesread -1; ptr++,cursor->bytecnt++) {
-          if (*(ptr-1) == '\n' ) {
-             sfNewLine(sf,cursor,*ptr,*(ptr+1),error);
-          }
-      }
-
-      cursor->bytecnt++;
-      status = statusEnd(buffer[bytesread-2],buffer[bytesread-1]);
+      status = sfReadBuffer(sf,cursor,status,buffer,bytesread,error);
   }
 
   free(buffer);
@@ -526,6 +613,120 @@ sfReadFile(SpecFile *sf,SfCursor *cursor,int *error) {
 }
 
 
+/*********************************************************************
+ *   Function:          short sfReadBuffer( sf, cursor, status, buffer,
+ *                                          size, error )
+ *
+ *   Description:       Indexes a block of the file.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *                      (2) Cursor, at the position of the block
+ *                      (3) Status at the end of the previous block
+ *                      (4) Block
+ *                      (5) Size of the block
+ *              Output:
+ *                      (6) error number
+ *   Returns:
+ *                      Status at the end of the block
+ *
+ *********************************************************************/
+static short
+sfReadBuffer(SpecFile *sf,SfCursor *cursor,short status,char *buffer,
+             long size,int *error) {
+
+   char  *ptr;
+
+   sfStartBuffer(sf,cursor,status,buffer[0],buffer[1],error);
+
+   cursor->bytecnt++;
+   for (ptr=buffer+1;ptr < buffer + size -1; ptr++,cursor->bytecnt++) {
+       if (*(ptr-1) == '\n' ) {
+          sfNewLine(sf,cursor,*ptr,*(ptr+1),error);
+       }
+   }
+
+   cursor->bytecnt++;
+   return(statusEnd(buffer[size-2],buffer[size-1]));
+}
+
+
+/*********************************************************************
+ *   Function:          void sfMapFile( sf )
+ *
+ *   Description:       Maps the file in memory, so that scans are
+ *                      parsed in place instead of being read in
+ *                      buffers. Maps it again if it has grown.
+ *                      Files which cannot be mapped are read.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *
+ *********************************************************************/
+static void
+sfMapFile( SpecFile *sf ) {
+#ifdef SPECFILE_USE_MMAP
+   struct stat  mystat;
+   void        *map;
+
+   if (fstat(sf->fd,&mystat) == -1 || !S_ISREG(mystat.st_mode) ||
+           mystat.st_size <= 0 || mystat.st_size == sf->mapsize) {
+      return;
+   }
+
+   sfUnmapFile(sf);
+
+   map = mmap(NULL,mystat.st_size,PROT_READ,MAP_SHARED,sf->fd,0);
+   if (map == MAP_FAILED) {
+      return;
+   }
+   sf->map     = (char *)map;
+   sf->mapsize = mystat.st_size;
+#endif
+   return;
+}
+
+
+/*********************************************************************
+ *   Function:          void sfUnmapFile( sf )
+ *
+ *   Description:       Releases the memory mapped file. The current
+ *                      scan is reset if its buffers were mapped.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *
+ *********************************************************************/
+static void
+sfUnmapFile( SpecFile *sf ) {
+#ifdef SPECFILE_USE_MMAP
+   if (sf->map == (char *)NULL) {
+      return;
+   }
+   if (SF_MAPPED(sf,sf->scanbuffer) || SF_MAPPED(sf,sf->filebuffer)) {
+      freeAllData(sf);
+      sf->current = (ObjectList *)NULL;
+   }
+   if (SF_MAPPED(sf,sf->scanbuffer)) {
+      sf->scanbuffer     = (char *)NULL;
+      sf->scanheadersize = 0;
+      sf->scansize       = 0;
+   }
+   if (SF_MAPPED(sf,sf->filebuffer)) {
+      sf->filebuffer     = (char *)NULL;
+      sf->filebuffersize = 0;
+   }
+   munmap(sf->map,sf->mapsize);
+   sf->map     = (char *)NULL;
+   sf->mapsize = 0;
+#endif
+   return;
+}
+
+
 static void
 sfResumeRead  ( SpecFile *sf, SfCursor *cursor, int *error) {
     cursor->bytecnt      = cursor->cursor;
@@ -541,104 +742,405 @@ sfResumeRead  ( SpecFile *sf, SfCursor *cursor, int *error) {
 }
 
 
-#ifdef SPECFILE_USE_INDEX_FILE
+/*********************************************************************
+ *   Function:          short sfReadIndex( sf, cursor, error )
+ *
+ *   Description:       Loads the index list from the index file.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *              Output:
+ *                      (2) Cursor at the end of the indexed part
+ *                      (3) error number
+ *   Returns:
+ *                      SF_READY    => the index is up to date
+ *                      SF_MODIFIED => scans were appended to the file
+ *                                     since the index was written
+ *                      SF_INIT     => no valid index, the list is empty
+ *
+ *   Possible errors:
+ *                      SF_ERR_MEMORY_ALLOC
+ *
+ *********************************************************************/
 static short
-sfOpenIndex ( SpecFile *sf, SfCursor *cursor, int *error) {
-    char *idxname;
-    short namelength;
-    int   sfi;
-
-    namelength = strlen(sf->sfname) + strlen(SF_ISFX) + 1;
-
-    idxname = (char *)malloc(sizeof(char) * namelength);
-
-    sprintf(idxname,"%s%s",sf->sfname,SF_ISFX);
+sfReadIndex( SpecFile *sf, SfCursor *cursor, int *error) {
+    struct stat    mystat;
+    unsigned char *buffer;
+    long           size;
+    int            sfi;
+    short          ret;
+
+    if ((sfi = open(sf->idxname,SF_OPENFLAG)) == -1) {
+        return(SF_INIT);
+    }
+    if (fstat(sfi,&mystat) == -1 ||
+            mystat.st_size < 8 * (1 + SF_IDX_HEADER + SF_IDX_CURSOR)) {
+        close(sfi);
+        return(SF_INIT);
+    }
+    size = mystat.st_size;
 
-    if ((sfi = open(idxname,SF_OPENFLAG)) == -1) {
-        free(idxname);
+    buffer = (unsigned char *) malloc(size);
+    if (buffer == (unsigned char *)NULL) {
+        close(sfi);
         return(SF_INIT);
+    }
+    if (read(sfi,buffer,size) != size) {
+        ret = SF_INIT;
     } else {
-        free(idxname);
-        return(sfReadIndex(sfi,sf,cursor,error));
+        ret = sfParseIndex(sf,cursor,buffer,size,error);
     }
+    close(sfi);
+    free(buffer);
+    return(ret);
 }
 
-
+
+/*********************************************************************
+ *   Function:          short sfParseIndex( sf, cursor, buffer, size,
+ *                                          error )
+ *
+ *   Description:       Checks the content of an index file against
+ *                      the file and fills the index list.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *                      (3) Content of the index file
+ *                      (4) Its size
+ *              Output:
+ *                      (2) Cursor at the end of the indexed part
+ *                      (5) error number
+ *   Returns:
+ *                      Same as sfReadIndex
+ *
+ *********************************************************************/
 static short
-sfReadIndex   ( int sfi, SpecFile *sf, SfCursor *cursor, int *error) {
-    SfCursor   filecurs;
-    char       buffer[200];
-    long       bytesread,i=0;
-    SpecScan   scan;
-    short      modif = 0;
-    long       mtime;
+sfParseIndex( SpecFile *sf, SfCursor *cursor, unsigned char *buffer,
+              long size, int *error) {
+    struct stat    mystat;
+    unsigned char *ptr;
+    SfCursor       filecurs;
+    SpecScan       scan;
+    ObjectList    *obj,
+                  *prevobj;
+    long long      header[SF_IDX_HEADER];
+    long           fsize, pathlen, nscans, i;
+    unsigned long  hash;
+
+    if (memcmp(buffer,SF_IDX_MAGIC,8) != 0) {
+        return(SF_INIT);
+    }
+    ptr = buffer + 8;
+    for (i = 0; i < SF_IDX_HEADER; i++, ptr += 8) {
+        header[i] = sfGetLong(ptr);
+    }
+    fsize   = (long) header[1];
+    pathlen = (long) header[4];
+    nscans  = (long) header[5];
+
+    if (header[0] != SF_IDX_VERSION || pathlen < 0 || nscans < 0 ||
+            pathlen > size || nscans > size / (8 * SF_IDX_SCAN) ||
+            size != 8 * (1 + SF_IDX_HEADER + SF_IDX_CURSOR +
+                         SF_IDX_SCAN * nscans) + pathlen) {
+        return(SF_INIT);
+    }
 
    /*
-    * read signature
+    * The key is the path, the size and the modification time
     */
-    bytesread = read(sfi,buffer,sizeof(SF_SIGNATURE));
-    if (strcmp(buffer,SF_SIGNATURE) || bytesread == 0 ) {
+    if (pathlen != (long) strlen(sf->sfname) ||
+            memcmp(ptr,sf->sfname,pathlen) != 0) {
+        return(SF_INIT);
+    }
+    ptr += pathlen;
+
+    if (fstat(sf->fd,&mystat) == -1 || mystat.st_size < fsize ||
+            (mystat.st_size == fsize && sfModTime(&mystat) != header[2])) {
+        return(SF_INIT);
+    }
+    if (sfTailHash(sf,fsize,&hash) == -1 ||
+            hash != (unsigned long long) header[3]) {
         return(SF_INIT);
     }
 
+    filecurs.scanno      = sfGetLong(ptr);
+    filecurs.cursor      = sfGetLong(ptr + 8);
+    filecurs.hdafoffset  = sfGetLong(ptr + 16);
+    filecurs.datalines   = sfGetLong(ptr + 24);
+    filecurs.dataoffset  = sfGetLong(ptr + 32);
+    filecurs.mcaspectra  = sfGetLong(ptr + 40);
+    filecurs.bytecnt     = sfGetLong(ptr + 48);
+    filecurs.what        = sfGetLong(ptr + 56);
+    filecurs.data        = sfGetLong(ptr + 64);
+    filecurs.file_header = sfGetLong(ptr + 72);
+    filecurs.fileh_size  = sfGetLong(ptr + 80);
+    ptr += 8 * SF_IDX_CURSOR;
+
+    if (filecurs.bytecnt != fsize || filecurs.scanno != nscans) {
+        return(SF_INIT);
+    }
    /*
-    * read cursor and specfile structure
+    * Reading is resumed at the beginning of the last scan
     */
-    if ( read(sfi,&mtime,   sizeof(long)) == 0)   return(SF_INIT);
-    if ( read(sfi,&filecurs, sizeof(SfCursor)) == 0) return(SF_INIT);
+    if (mystat.st_size > fsize && (nscans == 0 || filecurs.what != SCAN)) {
+        return(SF_INIT);
+    }
 
-    if (sf->m_time != mtime)  modif = 1;
+    for (i = 0; i < nscans; i++) {
+        sfGetScan(ptr + 8 * SF_IDX_SCAN * i,&scan);
+        if (scan.index != i + 1 || scan.offset < 0 || scan.size < 0 ||
+                scan.offset + scan.size > fsize) {
+            return(SF_INIT);
+        }
+    }
 
-    while(read(sfi,&scan, sizeof(SpecScan))) {
-        addToList(&(sf->list), (void *)&scan, (long)sizeof(SpecScan));
-        i++;
+    for (i = 0; i < nscans; i++, ptr += 8 * SF_IDX_SCAN) {
+        sfGetScan(ptr,&scan);
+        if (addToList(&(sf->list),(void *)&scan,
+                      (long)sizeof(SpecScan)) == -1) {
+            for (obj = sf->list.last; obj; obj = prevobj) {
+                prevobj = obj->prev;
+                free(obj->contents);
+                free(obj);
+            }
+            sf->list.first = (ObjectList *)NULL;
+            sf->list.last  = (ObjectList *)NULL;
+            *error = SF_ERR_MEMORY_ALLOC;
+            return(SF_INIT);
+        }
     }
-    sf->no_scans = i;
+    sf->no_scans = nscans;
 
     memcpy(cursor,&filecurs,sizeof(SfCursor));
 
-    if (modif) return(SF_MODIFIED);
+    if (mystat.st_size > fsize) return(SF_MODIFIED);
 
     return(SF_READY);
 }
 
-
-static void
-sfWriteIndex  ( SpecFile *sf, SfCursor *cursor, int *error) {
 
-    int         fdi;
-    char       *idxname;
-    short       namelength;
-    ObjectList *obj;
-    long        mtime;
+/*********************************************************************
+ *   Function:          void sfWriteIndex( sf, cursor, error )
+ *
+ *   Description:       Writes the index list to the index file.
+ *                      The file is replaced atomically, failures are
+ *                      ignored as the index is only a cache.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *                      (2) Cursor at the end of the file
+ *              Output:
+ *                      (3) error number
+ *
+ *********************************************************************/
+static void
+sfWriteIndex( SpecFile *sf, SfCursor *cursor, int *error) {
+    struct stat    mystat;
+    unsigned char *buffer,
+                  *ptr;
+    char          *tmpname;
+    ObjectList    *obj;
+    long           size, pathlen, nscans = 0;
+    unsigned long  hash;
+    int            fdi, ok;
+
+    if (fstat(sf->fd,&mystat) == -1 ||
+            sfTailHash(sf,cursor->bytecnt,&hash) == -1) {
+        return;
+    }
+    for (obj = sf->list.first; obj; obj = obj->next) {
+        nscans++;
+    }
+    pathlen = strlen(sf->sfname);
+    size    = 8 * (1 + SF_IDX_HEADER + SF_IDX_CURSOR + SF_IDX_SCAN * nscans)
+              + pathlen;
+
+    buffer  = (unsigned char *) malloc(size);
+    tmpname = (char *) malloc(strlen(sf->idxname) + 5);
+    if (buffer == (unsigned char *)NULL || tmpname == (char *)NULL) {
+        free(buffer);
+        free(tmpname);
+        return;
+    }
 
-    namelength = strlen(sf->sfname) + strlen(SF_ISFX) + 1;
+    memcpy(buffer,SF_IDX_MAGIC,8);
+    ptr = buffer + 8;
+    sfPutLong(ptr,      SF_IDX_VERSION);
+    sfPutLong(ptr + 8,  cursor->bytecnt);
+    sfPutLong(ptr + 16, sfModTime(&mystat));
+    sfPutLong(ptr + 24, hash);
+    sfPutLong(ptr + 32, pathlen);
+    sfPutLong(ptr + 40, nscans);
+    ptr += 8 * SF_IDX_HEADER;
+
+    memcpy(ptr,sf->sfname,pathlen);
+    ptr += pathlen;
+
+    sfPutLong(ptr,      cursor->scanno);
+    sfPutLong(ptr + 8,  cursor->cursor);
+    sfPutLong(ptr + 16, cursor->hdafoffset);
+    sfPutLong(ptr + 24, cursor->datalines);
+    sfPutLong(ptr + 32, cursor->dataoffset);
+    sfPutLong(ptr + 40, cursor->mcaspectra);
+    sfPutLong(ptr + 48, cursor->bytecnt);
+    sfPutLong(ptr + 56, cursor->what);
+    sfPutLong(ptr + 64, cursor->data);
+    sfPutLong(ptr + 72, cursor->file_header);
+    sfPutLong(ptr + 80, cursor->fileh_size);
+    ptr += 8 * SF_IDX_CURSOR;
+
+    for (obj = sf->list.first; obj; obj = obj->next) {
+        sfPutScan(ptr,(SpecScan *) obj->contents);
+        ptr += 8 * SF_IDX_SCAN;
+    }
 
-    idxname = (char *)malloc(sizeof(char) * namelength);
+   /*
+    * Write a temporary file and rename it, so that a concurrent
+    * reader never sees a partial index
+    */
+    sprintf(tmpname,"%s.tmp",sf->idxname);
+    if ((fdi = open(tmpname,SF_IDX_WRITEFLAG,SF_UMASK)) != -1) {
+        ok = (write(fdi,buffer,size) == size);
+        ok = (close(fdi) == 0) && ok;
+#ifdef _WINDOWS
+        if (ok) remove(sf->idxname);
+#endif
+        if (!ok || rename(tmpname,sf->idxname) != 0) {
+            remove(tmpname);
+        }
+    }
+    free(tmpname);
+    free(buffer);
+    return;
+}
 
-    sprintf(idxname,"%s%s",sf->sfname,SF_ISFX);
 
-    /* if ((fdi = open(idxname,SF_WRITEFLAG,SF_UMASK)) == -1) { */
-    if ((fdi = open(idxname,O_CREAT | O_WRONLY,SF_UMASK)) == -1) {
-        printf("    - cannot open. Error: (%d)\n",errno);
-        free(idxname);
-        return;
+/*********************************************************************
+ *   Function:          int sfTailHash( sf, size, hash )
+ *
+ *   Description:       Computes a checksum (32 bit FNV-1a) of the last
+ *                      SF_IDX_TAIL bytes of the first size bytes of
+ *                      the file, to detect that an indexed file was
+ *                      replaced rather than appended to.
+ *
+ *   Parameters:
+ *              Input :
+ *                      (1) SpecFile pointer
+ *                      (2) Size of the indexed part of the file
+ *              Output:
+ *                      (3) Checksum
+ *   Returns:
+ *                      0 if OK, -1 if the file could not be read
+ *
+ *********************************************************************/
+static int
+sfTailHash( SpecFile *sf, long size, unsigned long *hash) {
+    unsigned char  buffer[SF_IDX_TAIL];
+    unsigned char *ptr;
+    unsigned long  h = 2166136261UL;
+    long           start, nbytes, pos, i;
+
+    start  = (size > SF_IDX_TAIL) ? size - SF_IDX_TAIL : 0;
+    nbytes = size - start;
+
+    if (sf->map != (char *)NULL && size <= sf->mapsize) {
+        ptr = (unsigned char *)sf->map + start;
     } else {
-        mtime = sf->m_time;
-        write(fdi,SF_SIGNATURE,sizeof(SF_SIGNATURE));
- /*
-  * Swap bytes for linux
-  */
-        write(fdi, (void *) &mtime, sizeof(long));
-        write(fdi, (void *) cursor, sizeof(SfCursor));
-        for( obj = sf->list.first; obj ; obj = obj->next)
-           write(fdi,(void *) obj->contents, sizeof(SpecScan));
-        close(fdi);
-        free(idxname);
-        return;
+        pos = lseek(sf->fd,0,SEEK_CUR);
+        lseek(sf->fd,start,SEEK_SET);
+        i = read(sf->fd,buffer,nbytes);
+        lseek(sf->fd,pos,SEEK_SET);
+        if (i != nbytes) {
+            return(-1);
+        }
+        ptr = buffer;
     }
+
+    for (i = 0; i < nbytes; i++) {
+        h = ((h ^ ptr[i]) * 16777619UL) & 0xffffffffUL;
+    }
+    *hash = h;
+    return(0);
 }
+
+
+/*********************************************************************
+ *   Function:          long long sfModTime( mystat )
+ *
+ *   Description:       Returns the modification time of a file in
+ *                      nanoseconds, when the system provides it.
+ *
+ *********************************************************************/
+static long long
+sfModTime( struct stat *mystat ) {
+    long long mtime = (long long) mystat->st_mtime * 1000000000LL;
+#if defined(__APPLE__)
+    mtime += mystat->st_mtimespec.tv_nsec;
+#elif defined(__linux__) || defined(__CYGWIN__)
+    mtime += mystat->st_mtim.tv_nsec;
 #endif
+    return(mtime);
+}
+
+
+/*
+ * Little endian 64 bit integers of the index file
+ */
+static void
+sfPutLong( unsigned char *buffer, long long value ) {
+    int  i;
+    long long v = value;
+
+    for (i = 0; i < 8; i++) {
+        buffer[i] = (unsigned char) (v & 0xff);
+        v >>= 8;
+    }
+}
+
+
+static long long
+sfGetLong( unsigned char *buffer ) {
+    int  i;
+    unsigned long long v = 0;
+
+    for (i = 7; i >= 0; i--) {
+        v = (v << 8) | buffer[i];
+    }
+    return((long long) v);
+}
+
+
+static void
+sfPutScan( unsigned char *buffer, SpecScan *scan ) {
+    sfPutLong(buffer,      scan->index);
+    sfPutLong(buffer + 8,  scan->scan_no);
+    sfPutLong(buffer + 16, scan->order);
+    sfPutLong(buffer + 24, scan->offset);
+    sfPutLong(buffer + 32, scan->size);
+    sfPutLong(buffer + 40, scan->last);
+    sfPutLong(buffer + 48, scan->file_header);
+    sfPutLong(buffer + 56, scan->data_offset);
+    sfPutLong(buffer + 64, scan->hdafter_offset);
+    sfPutLong(buffer + 72, scan->mcaspectra);
+}
+
+
+static void
+sfGetScan( unsigned char *buffer, SpecScan *scan ) {
+    scan->index          = sfGetLong(buffer);
+    scan->scan_no        = sfGetLong(buffer + 8);
+    scan->order          = sfGetLong(buffer + 16);
+    scan->offset         = sfGetLong(buffer + 24);
+    scan->size           = sfGetLong(buffer + 32);
+    scan->last           = sfGetLong(buffer + 40);
+    scan->file_header    = sfGetLong(buffer + 48);
+    scan->data_offset    = sfGetLong(buffer + 56);
+    scan->hdafter_offset = sfGetLong(buffer + 64);
+    scan->mcaspectra     = sfGetLong(buffer + 72);
+}
 
 
 /*****************************************************************************
@@ -783,7 +1285,7 @@ sfSaveScan(SpecFile *sf, SfCursor *cursor,int *error) {
 
 
 static void
-sfAssignScanNumbers(SpecFile *sf) {
+sfAssignScanNumbers(SpecFile *sf, ObjectList *from) {
 
   int                    size,i;
   char                  *buffer,*ptr;
@@ -794,15 +1296,21 @@ sfAssignScanNumbers(SpecFile *sf) {
                         *object2;
   SpecScan              *scan,
                         *scan2;
+  SpecScan             **scans;
+  long                   nscans,n;
 
   size = 50;
   buffer = (char *) malloc(size);
 
-  for ( object = (sf->list).first; object; object=object->next) {
+  for ( object = from; object; object=object->next) {
         scan = (SpecScan *) object->contents;
 
-        lseek(sf->fd,scan->offset,SEEK_SET);
-        read(sf->fd,buffer,size);
+        if (sf->map != (char *)NULL && scan->offset + size <= sf->mapsize) {
+            memcpy(buffer,sf->map + scan->offset,size);
+        } else {
+            lseek(sf->fd,scan->offset,SEEK_SET);
+            read(sf->fd,buffer,size);
+        }
         buffer[49] = '\0';
 
         for ( ptr = buffer+3,i=0; *ptr != ' ';ptr++,i++) buffer2[i] = *ptr;
@@ -810,12 +1318,55 @@ sfAssignScanNumbers(SpecFile *sf) {
         buffer2[i] = '\0';
 
         scan->scan_no = atol(buffer2);
-        scan->order   = 1;
-        for ( object2 = (sf->list).first; object2 != object; object2=object2->next) {
-            scan2 = (SpecScan *) object2->contents;
-            if (scan2->scan_no == scan->scan_no) scan->order++;
-        }
   }
+  free(buffer);
+
+ /*
+  * The order of a scan is the number of scans before it (included)
+  * with the same number: sort the scans by number and position
+  */
+  nscans = 0;
+  for ( object = (sf->list).first; object; object=object->next) nscans++;
+
+  scans = (SpecScan **) malloc(sizeof(SpecScan *) * (nscans + 1));
+  if (scans != (SpecScan **)NULL) {
+     n = 0;
+     for ( object = (sf->list).first; object; object=object->next)
+         scans[n++] = (SpecScan *) object->contents;
+
+     qsort(scans,nscans,sizeof(SpecScan *),sfCompareScans);
+
+     for ( n = 0; n < nscans; n++) {
+         if (n > 0 && scans[n-1]->scan_no == scans[n]->scan_no) {
+             scans[n]->order = scans[n-1]->order + 1;
+         } else {
+             scans[n]->order = 1;
+         }
+     }
+     free(scans);
+  } else {
+     for ( object = from; object; object=object->next) {
+         scan = (SpecScan *) object->contents;
+         scan->order   = 1;
+         for ( object2 = (sf->list).first; object2 != object; object2=object2->next) {
+             scan2 = (SpecScan *) object2->contents;
+             if (scan2->scan_no == scan->scan_no) scan->order++;
+         }
+     }
+  }
+}
+
+
+static int
+sfCompareScans( const void *scan1, const void *scan2 ) {
+  SpecScan *s1 = *(SpecScan **) scan1,
+           *s2 = *(SpecScan **) scan2;
+
+  if (s1->scan_no != s2->scan_no)
+      return((s1->scan_no < s2->scan_no) ? -1 : 1);
+  if (s1->offset != s2->offset)
+      return((s1->offset < s2->offset) ? -1 : 1);
+  return(0);
 }
 
 void
@@ -136,21 +136,30 @@ sfSetCurrent( SpecFile *sf, long index,int *error )
      */
      scan = list->contents;
 
-     if (sf->scanbuffer != ( char * ) NULL) free(sf->scanbuffer);
+     if (sf->scanbuffer != ( char * ) NULL &&
+             !SF_MAPPED(sf,sf->scanbuffer)) free(sf->scanbuffer);
 
-     sf->scanbuffer = ( char *) malloc(scan->size);
-
-     if (sf->scanbuffer == (char *)NULL) {
-         *error = SF_ERR_MEMORY_ALLOC;
-         return(-1);
-     }
-
-     lseek(sf->fd,scan->offset,SEEK_SET);
-
-     nbytes = read(sf->fd,sf->scanbuffer,scan->size);
-     if ( nbytes == -1) {
-         *error = SF_ERR_FILE_READ;
-         return(-1);
+    /*
+     * With a memory mapped file, the scan is used in place
+     */
+     if (sf->map != (char *)NULL &&
+             scan->offset + scan->size <= sf->mapsize) {
+         sf->scanbuffer = sf->map + scan->offset;
+     } else {
+         sf->scanbuffer = ( char *) malloc(scan->size);
+
+         if (sf->scanbuffer == (char *)NULL) {
+             *error = SF_ERR_MEMORY_ALLOC;
+             return(-1);
+         }
+
+         lseek(sf->fd,scan->offset,SEEK_SET);
+
+         nbytes = read(sf->fd,sf->scanbuffer,scan->size);
+         if ( nbytes == -1) {
+             *error = SF_ERR_FILE_READ;
+             return(-1);
+         }
      }
      if ( sf->scanbuffer[0] != '#' || sf->scanbuffer[1] != 'S') {
          *error = SF_ERR_FILE_READ;
@@ -162,14 +171,19 @@ sfSetCurrent( SpecFile *sf, long index,int *error )
      * if different file read fileheader also
      */
      if (!sfSameFile(sf,list)) {
-        if (sf->filebuffer != ( char * ) NULL) free(sf->filebuffer);
+        if (sf->filebuffer != ( char * ) NULL &&
+                !SF_MAPPED(sf,sf->filebuffer)) free(sf->filebuffer);
 
         start        = scan->file_header;
         flist        = findFirstInFile(&(sf->list),scan->file_header);
         fscan        = flist->contents;
         fileheadsize = fscan->offset - start;
 
-        if (fileheadsize > 0) {
+        if (fileheadsize > 0 && sf->map != (char *)NULL &&
+                start + fileheadsize <= sf->mapsize) {
+            sf->filebuffer     = sf->map + start;
+            sf->filebuffersize = fileheadsize;
+        } else if (fileheadsize > 0) {
             sf->filebuffer = ( char *) malloc(fileheadsize);
             if (sf->filebuffer == (char *)NULL) {
                *error = SF_ERR_MEMORY_ALLOC;
@@ -32,6 +32,7 @@ import locale
 import logging
 import numpy
 import os
+import shutil
 import sys
 import tempfile
 import unittest
@@ -207,6 +208,18 @@ class TestSpecFile(unittest.TestCase):
         # number of returned scans
         self.assertEqual(i, len(self.sf))
 
+    def test_alternate_scans(self):
+        # switching the current scan must not mix up buffers
+        header1 = self.sf.scan_header(0)
+        data25 = self.sf.data(1)
+        file_headers = [self.sf.file_header(i) for i in range(3)]
+        self.assertNotEqual(file_headers[0], file_headers[2])
+        for i in range(3):
+            self.assertEqual(self.sf.scan_header(0), header1)
+            self.assertTrue(numpy.array_equal(self.sf.data(1), data25))
+            self.assertEqual(self.sf.file_header(2), file_headers[2])
+            self.assertEqual(self.sf.file_header(0), file_headers[0])
+
     def test_scan_index(self):
         self.assertEqual(self.scan1.index, 0)
         self.assertEqual(self.scan1_2.index, 2)
@@ -248,6 +261,14 @@ class TestSpecFile(unittest.TestCase):
         self.assertEqual(self.scan1.data.shape, (4, 3))
         self.assertAlmostEqual(numpy.sum(self.scan1.data), 113.631)
 
+    def test_data_with_mca(self):
+        """MCA lines interleaved with data lines are skipped"""
+        self.assertEqual(self.scan1_2.data.tolist(),
+                         [[1., 2.], [3., 4.], [5., 6.]])
+        self.assertEqual(self.sf.data(2).flags["C_CONTIGUOUS"], True)
+        self.assertEqual(self.scan1_2.data_column_by_name("duo").tolist(),
+                         [2., 4., 6.])
+
     def test_data_column_by_name(self):
         self.assertAlmostEqual(self.scan25.data_column_by_name("col2")[1],
                                1.2)
@@ -256,6 +277,17 @@ class TestSpecFile(unittest.TestCase):
         with self.assertRaises(KeyError):
             self.scan25.data_column_by_name("ygfxgfyxg")
 
+    def test_data_columns(self):
+        columns = self.scan25.data_columns(["col2", "column0"])
+        self.assertEqual(columns.shape, (2, self.scan25.data.shape[0]))
+        self.assertTrue(numpy.array_equal(columns,
+                                          self.scan25.data[:, [2, 0]].T))
+        columns = self.scan25.data_columns(["col2", "col2"])
+        self.assertTrue(numpy.array_equal(columns,
+                                          self.scan25.data[:, [2, 2]].T))
+        with self.assertRaises(KeyError):
+            self.scan25.data_columns(["col2", "ygfxgfyxg"])
+
     def test_motors(self):
         self.assertEqual(len(self.scan1.motor_names), 6)
         self.assertEqual(len(self.scan1.motor_positions), 6)
@@ -353,12 +385,107 @@ class TestSFLocale(unittest.TestCase):
         self.crunch_data()
 
 
+class TestSFIndexFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.tmpdir, "sf.dat")
+        self.index_file = self.fname + ".sfidx"
+        # the file starts with its first scan only
+        self.cut = sftext.index("#S 25")
+        self._write(sftext[:self.cut], "wb")
+
+    def tearDown(self):
+        gc.collect()
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, text, mode):
+        with open(self.fname, mode) as f:
+            f.write(text.encode("ascii"))
+
+    def assertSameScans(self, sf, reference):
+        self.assertEqual(sf.keys(), reference.keys())
+        for i in range(len(reference)):
+            self.assertEqual(sf.scan_header(i), reference.scan_header(i))
+            self.assertEqual(sf.file_header(i), reference.file_header(i))
+            self.assertTrue(numpy.array_equal(sf.data(i), reference.data(i)))
+
+    def test_create(self):
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertTrue(os.path.isfile(self.index_file))
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_reopen(self):
+        SpecFile(self.fname, index_file=self.index_file)
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertEqual(len(sf), 1)
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_appended_scans(self):
+        SpecFile(self.fname, index_file=self.index_file)
+        self._write(sftext[self.cut:], "ab")
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertEqual(sf.keys(), ["1.1", "25.1", "1.2"])
+        self.assertSameScans(sf, SpecFile(self.fname))
+        # the index file was updated
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_replaced_file(self):
+        SpecFile(self.fname, index_file=self.index_file)
+        self._write(sftext[self.cut:], "wb")
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertEqual(sf.keys(), ["25.1", "1.1"])
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_cache_directory(self):
+        previous = os.environ.get("XDG_CACHE_HOME")
+        os.environ["XDG_CACHE_HOME"] = os.path.join(self.tmpdir, "cache")
+        try:
+            sf = SpecFile(self.fname, index_file=True)
+        finally:
+            if previous is None:
+                del os.environ["XDG_CACHE_HOME"]
+            else:
+                os.environ["XDG_CACHE_HOME"] = previous
+        cache_dir = os.path.join(self.tmpdir, "cache", "silx", "specfile")
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_invalid_index_file(self):
+        with open(self.index_file, "wb") as f:
+            f.write(b"SFINDEX\n" + b"\xff" * 200)
+        sf = SpecFile(self.fname, index_file=self.index_file)
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+    def test_arguments(self):
+        sf = SpecFile(self.fname, index_file=False)
+        self.assertEqual(os.listdir(self.tmpdir), ["sf.dat"])
+        self.assertSameScans(sf, SpecFile(self.fname))
+
+        index_file = os.path.join(self.tmpdir, u"index_\u00e9.sfidx")
+        try:
+            index_file.encode(sys.getfilesystemencoding())
+        except UnicodeEncodeError:
+            pass
+        else:
+            sf = SpecFile(self.fname, index_file=index_file)
+            self.assertTrue(os.path.isfile(index_file))
+            self.assertSameScans(sf, SpecFile(self.fname))
+
+        self.assertRaises(TypeError, SpecFile, self.fname, index_file=1)
+        self.assertRaises(IOError, SpecFile,
+                          os.path.join(self.tmpdir, "missing.dat"),
+                          index_file=self.index_file)
+
+
 def suite():
     test_suite = unittest.TestSuite()
     test_suite.addTest(
         unittest.defaultTestLoader.loadTestsFromTestCase(TestSpecFile))
     test_suite.addTest(
         unittest.defaultTestLoader.loadTestsFromTestCase(TestSFLocale))
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestSFIndexFile))
     return test_suite
 
 
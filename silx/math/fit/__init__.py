@@ -27,7 +27,9 @@ __license__ = "MIT"
 __date__ = "22/06/2016"
 
 
-from .leastsq import leastsq, chisq_alpha_beta
+from .leastsq import leastsq, chisq_alpha_beta, linear_leastsq
 from .leastsq import \
     CFREE, CPOSITIVE, CQUOTED, CFIXED, \
     CFACTOR, CDELTA, CSUM
+from .peaks import peak_search
+from .filters import strip, snip1d, smooth1d
@@ -0,0 +1,271 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides background estimation of spectra.
+
+- :func:`strip` removes peaks by iteratively replacing each channel by the
+  average of its neighbours at a distance ``w``, when this average is lower.
+- :func:`snip1d` implements the Statistics-sensitive Non-linear Iterative
+  Peak-clipping algorithm, with a clipping window decreasing from
+  ``snip_width`` to 1 channel.
+- :func:`smooth1d` applies a moving average, optionally used by the other
+  functions before estimating the background.
+
+All functions accept a spectrum (1D array) or a stack of spectra (2D array,
+one spectrum per row). Stacks are processed in parallel.
+"""
+
+__authors__ = ["V.A. Sole"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+cimport cython
+from cython.parallel import prange
+from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
+import multiprocessing
+import numpy
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _smooth(double* data, double* work, Py_ssize_t n, int width) nogil:
+    """Replace data by its moving average over 2 * width + 1 channels.
+
+    The window is truncated at the borders of the spectrum.
+    """
+    cdef:
+        Py_ssize_t i, start, stop
+        double total = 0.0
+    if width < 1 or n < 2:
+        return
+    memcpy(work, data, n * sizeof(double))
+    start = 0
+    stop = min(width + 1, n)
+    for i in range(stop):
+        total += work[i]
+    for i in range(n):
+        data[i] = total / (stop - start)
+        if i + width + 1 < n:
+            total += work[i + width + 1]
+            stop += 1
+        if i - width >= 0:
+            total -= work[i - width]
+            start += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _strip(double* data, double* work, Py_ssize_t n, int w,
+                 int niterations, double factor,
+                 const char* anchors) nogil:
+    """Strip the peaks of data in place."""
+    cdef:
+        Py_ssize_t i
+        int iteration
+        double average
+    if n <= 2 * w:
+        return
+    for iteration in range(niterations):
+        memcpy(work, data, n * sizeof(double))
+        for i in range(w, n - w):
+            if anchors != NULL and anchors[i]:
+                continue
+            average = 0.5 * (work[i - w] + work[i + w])
+            if work[i] > average * factor:
+                data[i] = average
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _snip(double* data, double* work, Py_ssize_t n,
+                int snip_width) nogil:
+    """Clip the peaks of data in place with a decreasing window."""
+    cdef:
+        Py_ssize_t i
+        int p
+        double average
+    for p in range(snip_width, 0, -1):
+        if n <= 2 * p:
+            continue
+        memcpy(work, data, n * sizeof(double))
+        for i in range(p, n - p):
+            average = 0.5 * (work[i - p] + work[i + p])
+            if average < work[i]:
+                data[i] = average
+
+
+def _prepare(data, num_threads):
+    """Return a float64 2D copy of data and the number of threads to use"""
+    data = numpy.asarray(data)
+    if data.ndim not in (1, 2):
+        raise ValueError("Expected a 1D spectrum or a 2D stack of spectra")
+    result = numpy.array(numpy.atleast_2d(data), dtype=numpy.float64,
+                         order="C", copy=True)
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    return result, max(1, num_threads)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def smooth1d(data, int width=1, num_threads=None):
+    """smooth1d(data, width=1, num_threads=None)
+
+    Moving average of spectra.
+
+    :param data: A spectrum (1D) or a stack of spectra (2D, one per row)
+    :param int width: Half width of the averaging window, which spans
+        ``2 * width + 1`` channels
+    :param int num_threads: Number of threads to use for stacks of spectra
+        (default: the number of CPUs)
+    :return: The smoothed data as float64, with the same shape as data
+    """
+    cdef:
+        double[:, ::1] c_data
+        double* work
+        Py_ssize_t row, n, n_failed = 0
+        int c_num_threads
+    result, c_num_threads = _prepare(data, num_threads)
+    c_data = result
+    n = c_data.shape[1]
+    if n > 0 and width > 0:
+        for row in prange(c_data.shape[0], nogil=True,
+                          num_threads=c_num_threads):
+            work = <double*> malloc(n * sizeof(double))
+            if work == NULL:
+                n_failed += 1
+            else:
+                _smooth(&c_data[row, 0], work, n, width)
+                free(work)
+    if n_failed:
+        raise MemoryError()
+    return result.reshape(numpy.shape(data))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def strip(data, int w=1, int niterations=1000, double factor=1.0,
+          anchors=None, int smoothing=0, num_threads=None):
+    """strip(data, w=1, niterations=1000, factor=1.0, anchors=None, smoothing=0, num_threads=None)
+
+    Background estimation by iterative stripping of the peaks.
+
+    At each iteration, every channel ``i`` whose content is larger than
+    ``factor`` times the average of channels ``i - w`` and ``i + w`` is
+    replaced by this average.
+
+    :param data: A spectrum (1D) or a stack of spectra (2D, one per row)
+    :param int w: Distance of the neighbours used to compute the average
+    :param int niterations: Number of iterations
+    :param float factor: Scaling factor applied to the average
+    :param anchors: Indices of the channels left untouched by the stripping
+    :param int smoothing: Half width of the moving average applied to the
+        data before stripping (0 to disable)
+    :param int num_threads: Number of threads to use for stacks of spectra
+        (default: the number of CPUs)
+    :return: The background as float64, with the same shape as data
+    """
+    cdef:
+        double[:, ::1] c_data
+        char[::1] c_anchors
+        const char* anchors_ptr = NULL
+        double* work
+        Py_ssize_t row, n, n_failed = 0
+        int c_num_threads
+    if w < 1:
+        raise ValueError("w must be a positive integer")
+    result, c_num_threads = _prepare(data, num_threads)
+    c_data = result
+    n = c_data.shape[1]
+    if n == 0:
+        return result.reshape(numpy.shape(data))
+    if anchors is not None and len(anchors):
+        mask = numpy.zeros(n, dtype=numpy.int8)
+        mask[numpy.asarray(anchors, dtype=numpy.intp)] = 1
+        c_anchors = mask
+        anchors_ptr = &c_anchors[0]
+
+    for row in prange(c_data.shape[0], nogil=True, schedule="guided",
+                      num_threads=c_num_threads):
+        work = <double*> malloc(n * sizeof(double))
+        if work == NULL:
+            n_failed += 1
+        else:
+            _smooth(&c_data[row, 0], work, n, smoothing)
+            _strip(&c_data[row, 0], work, n, w, niterations, factor,
+                   anchors_ptr)
+            free(work)
+    if n_failed:
+        raise MemoryError()
+    return result.reshape(numpy.shape(data))
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def snip1d(data, int snip_width, int smoothing=0, num_threads=None):
+    """snip1d(data, snip_width, smoothing=0, num_threads=None)
+
+    Background estimation by the SNIP algorithm.
+
+    For each window width ``p`` from ``snip_width`` down to 1, every channel
+    ``i`` is replaced by the average of channels ``i - p`` and ``i + p``
+    when this average is lower.
+
+    :param data: A spectrum (1D) or a stack of spectra (2D, one per row)
+    :param int snip_width: Largest clipping window, typically of the order
+        of the FWHM of the peaks (in channels)
+    :param int smoothing: Half width of the moving average applied to the
+        data before clipping (0 to disable)
+    :param int num_threads: Number of threads to use for stacks of spectra
+        (default: the number of CPUs)
+    :return: The background as float64, with the same shape as data
+    """
+    cdef:
+        double[:, ::1] c_data
+        double* work
+        Py_ssize_t row, n, n_failed = 0
+        int c_num_threads
+    if snip_width < 1:
+        raise ValueError("snip_width must be a positive integer")
+    result, c_num_threads = _prepare(data, num_threads)
+    c_data = result
+    n = c_data.shape[1]
+    if n == 0:
+        return result.reshape(numpy.shape(data))
+
+    for row in prange(c_data.shape[0], nogil=True, schedule="guided",
+                      num_threads=c_num_threads):
+        work = <double*> malloc(n * sizeof(double))
+        if work == NULL:
+            n_failed += 1
+        else:
+            _smooth(&c_data[row, 0], work, n, smoothing)
+            _snip(&c_data[row, 0], work, n, snip_width)
+            free(work)
+    if n_failed:
+        raise MemoryError()
+    return result.reshape(numpy.shape(data))
@@ -46,6 +46,9 @@ import logging
 logging.basicConfig()
 _logger = logging.getLogger(__name__)
 
+# high resolution clock when available
+_timer = getattr(time, "perf_counter", time.time)
+
 # codes understood by the routine
 CFREE       = 0
 CPOSITIVE   = 1
@@ -61,7 +64,8 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
               deltachi=None, full_output=0,
               check_finite=True,
               left_derivative=False,
-              max_iter=100):
+              max_iter=100, deriv_windows=None, linear=None,
+              levels=1, level_binning=4, callback=None):
     """
     Use non-linear least squares Levenberg-Marquardt algorithm to fit a function, f, to
     data with optional constraints on the fitted parameters.
@@ -159,6 +163,53 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
 
     :param max_iter: Maximum number of iterations (default is 100)
 
+    :param deriv_windows:
+        None (default) or function declaring, for each parameter, the window of
+        data points on which the model depends on that parameter (the support
+        of its derivative). It will be called as ``deriv_windows(xdata, parameters)``
+        and has to return a sequence with one item per parameter: either None
+        (the parameter affects all the points), a ``slice`` or a ``(start, stop)``
+        pair of indices into the flattened data. Derivatives are then only
+        evaluated inside those windows and the curvature matrix is assembled
+        from the overlapping windows, which is much cheaper than the dense
+        calculation when fitting many narrow peaks. The window of a fitted
+        parameter is extended to the windows of the parameters related to it
+        by CFACTOR, CDELTA or CSUM constraints. It requires xdata and ydata
+        to have the same number of points and the model (and model_deriv) to
+        be evaluated point by point, since it will be called on slices of xdata.
+    :type deriv_windows: *optional*, None or callable
+
+    :param linear:
+        If True, the model is assumed to be linear in its parameters, that is
+        ``model(x, *p) = sum(p[i] * model(x, *e_i))`` where ``e_i`` is the i-th
+        unit vector. The problem is then solved directly by :func:`linear_leastsq`
+        instead of iterating, provided the constraints only use CFREE,
+        CPOSITIVE and CFIXED and levels is 1. The callback is then called
+        once with the solution. If None (default), the ``linear`` attribute
+        of the model is used when it has one.
+    :type linear: *optional*, None or bool
+
+    :param levels: Number of resolution levels (default is 1)
+        When larger than 1, the fit is first performed on binned versions of
+        the data, from the coarsest to the finest, each level starting from
+        the solution of the previous one, before the final fit on the full
+        data. Level ``k`` (``k = levels - 1, ..., 1``) averages the data by
+        groups of ``level_binning ** k`` points, with the uncertainties
+        propagated accordingly. It requires xdata and ydata to have the same
+        number of points and the model to be evaluated point by point.
+    :type levels: *optional*, int
+
+    :param level_binning: Binning factor between two resolution levels
+        (default is 4). It must be at least 2 when levels is larger than 1.
+    :type level_binning: *optional*, int
+
+    :param callback:
+        None (default) or function called after each iteration on the full
+        data as ``callback(info)`` where info is a dictionary with the keys
+        ``iteration``, ``parameters``, ``chisq``, ``flambda``, ``nfev`` and
+        ``timing`` (see below). The fit is stopped if it returns True.
+    :type callback: *optional*, None or callable
+
     :return: Returns a tuple of length 2 (or 3 if full_ouput is True) with the content:
 
          ``popt``: array
@@ -189,8 +240,23 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
             ``reduced_chisq``
                 The chi square ``np.sum( ((f(xdata, *popt) - ydata) / sigma)**2 )`` divided
                 by the number of degrees of freedom ``(M - number_of_free_parameters)``
+            ``levels``
+                One dictionary per resolution level, from the coarsest to the full
+                data, with the keys ``binning``, ``npoints``, ``niter``, ``nfev`` and
+                ``chisq``. ``niter`` and ``nfev`` above are the totals over the levels.
+            ``timing``
+                The time in seconds spent in each phase of the iterations: ``derivatives``
+                (calculation of chi square, curvature matrix and derivatives), ``solve``
+                (linear system), ``constraints`` (application of the constraints),
+                ``model`` (evaluation of the model at the new parameters) and ``total``.
+                Times of all the resolution levels are included.
+            ``stopped``
+                True if the fit has been stopped by the callback function
     """
     function_call_counter = 0
+    if levels > 1 and level_binning < 2:
+        raise ValueError("level_binning must be at least 2, got %s" %
+                         level_binning)
     if numpy.isscalar(p0):
         p0 = [p0]
     parameters = numpy.array(p0, dtype=numpy.float64, copy=False)
@@ -324,6 +390,63 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
                 constrained_fit = True
     if constrained_fit and (not full_output):
         _logger.warning("Recommended to set full_output to True when using constraints")
+    constraint_table = _compile_constraints(constraints)
+
+    if linear is None:
+        linear = getattr(model, "linear", False)
+    if linear and constraints is not None:
+        for i in range(nparameters):
+            if constraints[i][0] not in [CFREE, CPOSITIVE, CFIXED]:
+                _logger.info("Constraint %d not supported by the linear solver",
+                             constraints[i][0])
+                linear = False
+                break
+    if linear and levels > 1:
+        _logger.info("Multi-resolution fit not supported by the linear solver")
+        linear = False
+    if linear:
+        return _linear_model_leastsq(model, xdata, ydata, parameters, sigma,
+                                     constraints, full_output,
+                                     function_call_counter, callback)
+
+    level_info = []
+    level_iterations = 0
+    timing = {"derivatives": 0.0, "solve": 0.0, "constraints": 0.0,
+              "model": 0.0, "total": 0.0}
+    start_time = _timer()
+    if levels > 1 and xdata.size != ydata.size:
+        _logger.warning("Multi-resolution fit requires xdata and ydata of same size")
+    elif levels > 1:
+        xflat = xdata.reshape(-1)
+        for level in range(levels - 1, 0, -1):
+            binning = int(level_binning) ** level
+            if (ydata.size // binning) <= nparameters:
+                continue
+            xbin, ybin, sigmabin = _bin_data(xflat, ydata, sigma, binning)
+            parameters, cov, info = leastsq(model, xbin, ybin, parameters,
+                                            sigma=sigmabin,
+                                            constraints=constraints,
+                                            model_deriv=model_deriv,
+                                            epsfcn=epsfcn,
+                                            deltachi=deltachi,
+                                            full_output=True,
+                                            check_finite=False,
+                                            left_derivative=left_derivative,
+                                            max_iter=max_iter,
+                                            deriv_windows=deriv_windows,
+                                            linear=False)
+            function_call_counter += info["nfev"]
+            level_iterations += info["niter"]
+            level_info.append({"binning": binning,
+                               "npoints": ybin.size,
+                               "niter": info["niter"],
+                               "nfev": info["nfev"],
+                               "chisq": info["chisq"],
+                               "timing": info["timing"]})
+            for key in timing:
+                if key != "total":
+                    timing[key] += info["timing"][key]
+    level_function_calls = function_call_counter
 
     # Levenberg-Marquardt algorithm
     fittedpar = parameters.__copy__()
@@ -335,6 +458,9 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
     y = ydata
     chisq0 = -1
     iteration_counter = 0
+    stopped = False
+    level_timing = timing.copy()
+    level_start_time = _timer()
     while (iiter > 0):
         weight = weight0
         """
@@ -349,6 +475,7 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
         ignored or not between calls.
         """
         iteration_counter += 1
+        t0 = _timer()
         chisq0, alpha0, beta, internal_output = chisq_alpha_beta(
                                                  model, fittedpar,
                                                  x, y, weight, constraints=constraints,
@@ -356,57 +483,50 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
                                                  epsfcn=epsfcn,
                                                  left_derivative=left_derivative,
                                                  last_evaluation=last_evaluation,
-                                                 full_output=True)
+                                                 full_output=True,
+                                                 deriv_windows=deriv_windows,
+                                                 constraint_table=constraint_table)
         n_free = internal_output["n_free"]
         free_index = internal_output["free_index"]
         noigno = internal_output["noigno"]
         fitparam = internal_output["fitparam"]
         function_calls = internal_output["function_calls"]
         function_call_counter += function_calls
+        timing["derivatives"] += _timer() - t0
         #print("chisq0 = ", chisq0, n_free, fittedpar)
         #raise
         nr, nc = alpha0.shape
         flag = 0
         #lastdeltachi = chisq0
         while flag == 0:
+            t0 = _timer()
             alpha = alpha0 * (1.0 + flambda * numpy.identity(nr))
             deltapar = numpy.dot(beta, inv(alpha))
+            t1 = _timer()
+            timing["solve"] += t1 - t0
             if constraints is None:
                 newpar = fitparam + deltapar [0]
             else:
+                pwork = fitparam + deltapar [0]
+                quoted = constraint_table["quoted"][free_index]
+                if quoted.any():
+                    pmax = constraint_table["pmax"][free_index][quoted]
+                    pmin = constraint_table["pmin"][free_index][quoted]
+                    A = 0.5 * (pmax + pmin)
+                    B = 0.5 * (pmax - pmin)
+                    if (B == 0).any():
+                        raise ValueError("Invalid parameter limits")
+                    pwork[quoted] = A + \
+                                B * numpy.sin(numpy.arcsin((fitparam[quoted] - A)/B)+ \
+                                deltapar [0] [quoted])
                 newpar = parameters.__copy__()
-                pwork = numpy.zeros(deltapar.shape, numpy.float)
-                for i in range(n_free):
-                    if constraints is None:
-                        pwork [0] [i] = fitparam [i] + deltapar [0] [i]
-                    elif constraints [free_index[i]][0] == CFREE:
-                        pwork [0] [i] = fitparam [i] + deltapar [0] [i]
-                    elif constraints [free_index[i]][0] == CPOSITIVE:
-                        #abs method
-                        pwork [0] [i] = fitparam [i] + deltapar [0] [i]
-                        #square method
-                        #pwork [0] [i] = (numpy.sqrt(fitparam [i]) + deltapar [0] [i]) * \
-                        #                (numpy.sqrt(fitparam [i]) + deltapar [0] [i])
-                    elif constraints[free_index[i]][0] == CQUOTED:
-                        pmax = max(constraints[free_index[i]][1],
-                                   constraints[free_index[i]][2])
-                        pmin = min(constraints[free_index[i]][1],
-                                   constraints[free_index[i]][2])
-                        A = 0.5 * (pmax + pmin)
-                        B = 0.5 * (pmax - pmin)
-                        if B != 0:
-                            pwork [0] [i] = A + \
-                                        B * numpy.sin(numpy.arcsin((fitparam[i] - A)/B)+ \
-                                        deltapar [0] [i])
-                        else:
-                            txt = "Error processing constrained fit\n" 
-                            txt += "Parameter limits are %g and %g\n" % (pmin, pmax)
-                            txt += "A = %g B = %g"  % (A, B)
-                            raise ValueError("Invalid parameter limits")
-                    newpar[free_index[i]] = pwork [0] [i]
-                newpar = numpy.array(_get_parameters(newpar,constraints))
+                newpar[free_index] = pwork
+                newpar = _apply_constraints(newpar, constraint_table)
             workpar = numpy.take(newpar, noigno)
+            t0 = _timer()
+            timing["constraints"] += t0 - t1
             yfit = model(x, *workpar)
+            timing["model"] += _timer() - t0
             if last_evaluation is None:
                 if len(yfit.shape) > 1:
                     msg = "Supplied function does not return a 1D array of floats."
@@ -438,12 +558,28 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
                 flambda = flambda / 10.0
                 last_evaluation = yfit
             iiter = iiter -1
+        _logger.debug("Iteration %d: chisq = %g, flambda = %g, nfev = %d, "
+                      "timing = %s", iteration_counter, chisq0, flambda,
+                      function_call_counter, timing)
+        if callback is not None:
+            info = {"iteration": iteration_counter,
+                    "parameters": fittedpar.__copy__(),
+                    "chisq": chisq0,
+                    "flambda": flambda,
+                    "nfev": function_call_counter,
+                    "timing": timing.copy()}
+            if callback(info):
+                _logger.info("Fit stopped by callback at iteration %d",
+                             iteration_counter)
+                stopped = True
+                iiter = 0
     # this is the covariance matrix of the actually fitted parameters
     cov0 = inv(alpha0)
     if constraints is None:
         cov = cov0
     else:
         # yet another call needed with all the parameters being free
+        t0 = _timer()
         chisq, alpha, beta, internal_output = chisq_alpha_beta(
                                                  model, fittedpar,
                                                  x,y, weight, constraints=None,
@@ -451,13 +587,17 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
                                                  epsfcn=epsfcn,
                                                  left_derivative=left_derivative,
                                                  last_evaluation=last_evaluation,
-                                                 full_output=True)
+                                                 full_output=True,
+                                                 deriv_windows=deriv_windows)
+        timing["derivatives"] += _timer() - t0
         # obtained chisq should be identical to chisq0
         try:
             cov = inv(alpha)
         except LinAlgError:
             _logger.critical("Error calculating covariance matrix after successful fit")
             cov = None
+    end_time = _timer()
+    timing["total"] = end_time - start_time
     if not full_output:
         return fittedpar, cov
     else:
@@ -470,12 +610,237 @@ def leastsq(model, xdata, ydata, p0, sigma=None,
         ddict["uncertainties"] = sigmapar
         ddict["fvec"] = last_evaluation
         ddict["nfev"] = function_call_counter
-        ddict["niter"] = iteration_counter
+        ddict["niter"] = iteration_counter + level_iterations
+        level_info.append({"binning": 1,
+                           "npoints": y.size,
+                           "niter": iteration_counter,
+                           "nfev": function_call_counter - level_function_calls,
+                           "chisq": chisq0,
+                           "timing": dict((key, timing[key] - level_timing[key])
+                                          for key in timing)})
+        level_info[-1]["timing"]["total"] = end_time - level_start_time
+        ddict["levels"] = level_info
+        ddict["timing"] = timing
+        ddict["stopped"] = stopped
         return fittedpar, cov, ddict #, chisq/(len(yfit)-len(sigma0)), sigmapar,niter,lastdeltachi
 
+def linear_leastsq(basis, ydata, sigma=None, constraints=None, p0=None,
+                   full_output=False):
+    """
+    Solve directly the weighted linear least squares problem
+    ``ydata = numpy.dot(parameters, basis) + eps`` for one or many spectra.
+
+    Polynomial backgrounds or linear combinations of fixed spectra do not
+    need the iterations of :func:`leastsq`. Without positivity constraints,
+    the solution is obtained from an SVD based least squares solver applied
+    to the weighted design matrix (same weights for all the spectra) or from
+    the normal equations solved for all the spectra at once.
+    Positive parameters are obtained with an active set non negative least
+    squares algorithm applied to each spectrum.
+
+    :param basis: 2D array of dimension (n_parameters, M)
+        The functions evaluated at the M data points, one per row.
+
+    :param ydata: M-length sequence or 2D array of dimension (n_spectra, M)
+        The data to fit, one spectrum per row in the later case.
+
+    :param sigma: None or sequence of the same shape as ydata
+        The uncertainties on ydata. If None, they are assumed to be 1.
+
+    :param constraints:
+        If provided, a 2D sequence of dimension (n_parameters, 3) with the
+        same meaning as in :func:`leastsq`. Only CFREE, CPOSITIVE and CFIXED
+        are supported.
+    :type constraints: *optional*, None or 2D sequence
+
+    :param p0: N-length sequence
+        Values of the parameters with a CFIXED constraint. Default is 0.
+    :type p0: *optional*, None or sequence
+
+    :param full_output: bool, optional
+        non-zero to return all optional outputs. The default is 0
+
+    :return: Returns a tuple of length 2 (or 3 if full_ouput is True) with the content:
+
+         ``popt``: array
+           The optimal parameters, of dimension (n_parameters,) or
+           (n_spectra, n_parameters)
+         ``pcov``: array
+           The covariance matrix of the parameters, of dimension
+           (n_parameters, n_parameters) or (n_spectra, n_parameters, n_parameters),
+           as if all the parameters were free.
+         ``infodict``: dict
+           a dictionary of optional outputs with the keys ``uncertainties``,
+           ``fvec``, ``chisq``, ``reduced_chisq`` and ``niter``, as in
+           :func:`leastsq`, with one value per spectrum for stacks.
+    """
+    basis = numpy.array(basis, dtype=numpy.float64, copy=False)
+    ydata = numpy.array(ydata, dtype=numpy.float64, copy=False)
+    if basis.ndim == 1:
+        basis = basis.reshape(1, -1)
+    if basis.ndim != 2:
+        raise ValueError("basis must be a 2D array")
+    nparameters, npoints = basis.shape
+    single = ydata.ndim == 1
+    y = ydata.reshape(-1, npoints)
+    nspectra = y.shape[0]
+
+    codes = numpy.zeros(nparameters, dtype=numpy.int64)
+    if constraints is not None:
+        for i in range(nparameters):
+            codes[i] = constraints[i][0]
+        if not numpy.all((codes == CFREE) | (codes == CPOSITIVE) |
+                         (codes == CFIXED)):
+            raise ValueError("Only CFREE, CPOSITIVE and CFIXED constraints are supported")
+    fixed = codes == CFIXED
+    free = numpy.logical_not(fixed)
+    positive = (codes == CPOSITIVE)[free]
+    if not free.any():
+        raise ValueError("No free parameters to fit")
+    parameters = numpy.zeros((nspectra, nparameters), numpy.float64)
+    if p0 is not None:
+        parameters[:, fixed] = numpy.array(p0, dtype=numpy.float64)[fixed]
+    ywork = y - numpy.dot(parameters[:, fixed], basis[fixed])
+    free_basis = basis[free]
+
+    shared_weight = True
+    if sigma is None:
+        weight = None
+        alpha = numpy.inner(basis, basis)
+        alpha = numpy.resize(alpha, (nspectra, nparameters, nparameters))
+    else:
+        sigma = numpy.array(sigma, dtype=numpy.float64, copy=False)
+        sigma = sigma.reshape(-1, npoints)
+        shared_weight = sigma.shape[0] == 1
+        weight = 1.0 / (sigma + numpy.equal(sigma, 0))
+        weight = weight * weight
+        weight = numpy.resize(weight, (nspectra, npoints))
+        alpha = numpy.einsum("im,sm,jm->sij", basis, weight, basis)
+
+    niter = numpy.ones(nspectra, dtype=numpy.int64)
+    if positive.any():
+        free_alpha = alpha[:, free][:, :, free]
+        if weight is None:
+            beta = numpy.dot(ywork, free_basis.T)
+        else:
+            beta = numpy.dot(weight * ywork, free_basis.T)
+        for i in range(nspectra):
+            parameters[i, free], niter[i] = _nnls(free_alpha[i], beta[i],
+                                                  positive)
+    elif weight is None:
+        # same design matrix for all the spectra
+        solution = numpy.linalg.lstsq(free_basis.T, ywork.T, rcond=-1)[0]
+        parameters[:, free] = solution.T
+    elif shared_weight:
+        # same weighted design matrix for all the spectra
+        row_scale = numpy.sqrt(weight[0])[:, numpy.newaxis]
+        solution = numpy.linalg.lstsq(free_basis.T * row_scale,
+                                      ywork.T * row_scale, rcond=-1)[0]
+        parameters[:, free] = solution.T
+    else:
+        # scale rows and columns to improve the conditioning
+        free_alpha = alpha[:, free][:, :, free]
+        beta = numpy.dot(weight * ywork, free_basis.T)
+        scale = numpy.sqrt(numpy.diagonal(free_alpha, axis1=1, axis2=2))
+        scale = scale + numpy.equal(scale, 0)
+        free_alpha = free_alpha / (scale[:, :, numpy.newaxis] *
+                                   scale[:, numpy.newaxis, :])
+        parameters[:, free] = numpy.linalg.solve(
+            free_alpha, (beta / scale)[:, :, numpy.newaxis])[:, :, 0] / scale
+
+    try:
+        cov = numpy.linalg.inv(alpha)
+    except LinAlgError:
+        _logger.critical("Error calculating covariance matrix")
+        cov = None
+
+    if not full_output:
+        if single:
+            return parameters[0], None if cov is None else cov[0]
+        return parameters, cov
+
+    fvec = numpy.dot(parameters, basis)
+    residuals = (y - fvec) ** 2
+    if weight is not None:
+        residuals *= weight
+    chisq = residuals.sum(axis=1)
+    nfree = free.sum()
+    uncertainties = numpy.zeros((nspectra, nparameters), numpy.float64)
+    try:
+        free_cov = numpy.linalg.inv(alpha[:, free][:, :, free])
+        uncertainties[:, free] = numpy.sqrt(abs(
+            numpy.diagonal(free_cov, axis1=1, axis2=2)))
+    except LinAlgError:
+        _logger.critical("Error calculating uncertainties")
+    ddict = {}
+    ddict["chisq"] = chisq
+    ddict["reduced_chisq"] = chisq / max(npoints - nfree, 1)
+    ddict["uncertainties"] = uncertainties
+    ddict["fvec"] = fvec
+    ddict["niter"] = niter
+    if single:
+        for key in ddict:
+            ddict[key] = ddict[key][0]
+        return parameters[0], None if cov is None else cov[0], ddict
+    return parameters, cov, ddict
+
+def _linear_model_leastsq(model, x, y, parameters, sigma, constraints,
+                          full_output, function_call_counter, callback=None):
+    """
+    Solve :func:`leastsq` for a model linear in its parameters by building
+    its basis with one evaluation per parameter and calling
+    :func:`linear_leastsq`.
+
+    The callback, if any, is called once with the solution and the output
+    dictionary has the same keys as the one of :func:`leastsq`, with a
+    single resolution level.
+    """
+    timing = {"derivatives": 0.0, "solve": 0.0, "constraints": 0.0,
+              "model": 0.0, "total": 0.0}
+    start_time = _timer()
+    nparameters = len(parameters)
+    basis = numpy.zeros((nparameters, y.size), numpy.float64)
+    for i in range(nparameters):
+        unit = numpy.zeros((nparameters,), numpy.float64)
+        unit[i] = 1.0
+        evaluation = model(x, *unit)
+        function_call_counter += 1
+        basis[i] = numpy.asarray(evaluation).reshape(-1)
+    t0 = _timer()
+    timing["model"] = t0 - start_time
+    fittedpar, cov, ddict = linear_leastsq(basis, y, sigma=sigma,
+                                           constraints=constraints,
+                                           p0=parameters, full_output=True)
+    timing["solve"] = _timer() - t0
+    timing["total"] = _timer() - start_time
+    stopped = False
+    if callback is not None:
+        info = {"iteration": 1,
+                "parameters": fittedpar.__copy__(),
+                "chisq": ddict["chisq"],
+                "flambda": 0.0,
+                "nfev": function_call_counter,
+                "timing": timing.copy()}
+        if callback(info):
+            stopped = True
+    if not full_output:
+        return fittedpar, cov
+    ddict["covariance"] = cov
+    ddict["nfev"] = function_call_counter
+    ddict["levels"] = [{"binning": 1,
+                        "npoints": y.size,
+                        "niter": ddict["niter"],
+                        "nfev": function_call_counter,
+                        "chisq": ddict["chisq"],
+                        "timing": timing.copy()}]
+    ddict["timing"] = timing
+    ddict["stopped"] = stopped
+    return fittedpar, cov, ddict
+
 def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
                    model_deriv=None, epsfcn=None, left_derivative=False,
-                   last_evaluation=None, full_output=False):
+                   last_evaluation=None, full_output=False,
+                   deriv_windows=None, constraint_table=None):
 
     """
     Get chi square, the curvature matrix alpha and the matrix beta according to the input parameters.
@@ -559,6 +924,17 @@ def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
             evaluating the function, that is as the result of ``model(x, *parameters)`` thus avoiding
             the evaluation call.
 
+    :param deriv_windows: None or callable
+            If supplied, ``deriv_windows(x, parameters)`` returns for each parameter
+            None, a ``slice`` or a ``(start, stop)`` pair of indices delimiting the
+            points where the model depends on that parameter. Derivatives are only
+            calculated inside those windows and alpha is built from their overlaps.
+
+    :param constraint_table: None or dict
+            The constraints already translated by :func:`_compile_constraints`,
+            in order to avoid doing it again at each iteration of a fit.
+            If None, it is obtained from constraints.
+
     :param full_output: bool, optional
             Additional output used for internal purposes with the keys:
         ``function_calls``
@@ -634,6 +1010,15 @@ def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
         pwork [free_index[i]] = fitparam [i]
     if n_free == 0:
         raise ValueError("No free parameters to fit")
+    if constraint_table is None:
+        constraint_table = _compile_constraints(constraints)
+    if deriv_windows is not None:
+        return _chisq_alpha_beta_windowed(model, parameters, x, y, weight,
+                                          constraint_table, model_deriv,
+                                          left_derivative, last_evaluation,
+                                          full_output, deriv_windows,
+                                          n_free, fitparam, free_index,
+                                          noigno, derivfactor, delta, pwork)
     function_calls = 0
     if not left_derivative:
         if last_evaluation is not None:
@@ -646,15 +1031,13 @@ def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
         if model_deriv is None:
             #pwork = parameters.__copy__()
             pwork[free_index[i]] = fitparam [i] + delta [i]
-            newpar = _get_parameters(pwork.tolist(), constraints)
-            newpar = numpy.take(newpar,noigno)
+            newpar = _apply_constraints(pwork, constraint_table)[noigno]
             f1 = model(x, *newpar)
             f1.shape = -1
             function_calls += 1
             if left_derivative:
                 pwork[free_index[i]] = fitparam [i] - delta [i]
-                newpar = _get_parameters(pwork.tolist(), constraints)
-                newpar=numpy.take(newpar,noigno)
+                newpar = _apply_constraints(pwork, constraint_table)[noigno]
                 f2 = model(x, *newpar)
                 function_calls += 1
                 help0 = (f1 - f2) / (2.0 * delta[i])
@@ -680,8 +1063,7 @@ def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
             yfit = model(x, *fitparam)
             yfit.shape = -1
         else:
-            newpar = _get_parameters(pwork.tolist(), constraints)
-            newpar = numpy.take(newpar,noigno)
+            newpar = _apply_constraints(pwork, constraint_table)[noigno]
             yfit = model(x, *newpar)
             yfit.shape = -1
         function_calls += 1
@@ -714,6 +1096,282 @@ def chisq_alpha_beta(model, parameters, x, y, weight, constraints=None,
     else:
         return chisq, alpha, beta
 
+def _chisq_alpha_beta_windowed(model, parameters, x, y, weight, constraint_table,
+                               model_deriv, left_derivative, last_evaluation,
+                               full_output, deriv_windows, n_free, fitparam,
+                               free_index, noigno, derivfactor, delta, pwork):
+    """
+    Sparse counterpart of :func:`chisq_alpha_beta`.
+
+    The derivative respect to each free parameter is only calculated on its
+    support window and the elements of alpha are only accumulated where the
+    windows of the two involved parameters overlap.
+    """
+    nr = y.size
+    if x.size != nr:
+        raise ValueError("deriv_windows requires xdata and ydata of same size")
+    xw = x.reshape(-1)
+    windows = _get_windows(deriv_windows, x, parameters, nr)
+    windows = _get_related_windows(windows, constraint_table)
+    function_calls = 0
+    if last_evaluation is not None:
+        yfit = last_evaluation
+    else:
+        newpar = _apply_constraints(pwork, constraint_table)[noigno]
+        yfit = model(x, *newpar)
+        yfit.shape = -1
+        function_calls += 1
+    deriv = []
+    for i in range(n_free):
+        start, stop = windows[free_index[i]]
+        if model_deriv is None:
+            pwork[free_index[i]] = fitparam[i] + delta[i]
+            newpar = _apply_constraints(pwork, constraint_table)[noigno]
+            f1 = model(xw[start:stop], *newpar)
+            f1.shape = -1
+            function_calls += 1
+            if left_derivative:
+                pwork[free_index[i]] = fitparam[i] - delta[i]
+                newpar = _apply_constraints(pwork, constraint_table)[noigno]
+                f2 = model(xw[start:stop], *newpar)
+                f2.shape = -1
+                function_calls += 1
+                help0 = (f1 - f2) / (2.0 * delta[i])
+            else:
+                help0 = (f1 - yfit[start:stop]) / delta[i]
+            pwork[free_index[i]] = fitparam[i]
+        else:
+            help0 = model_deriv(xw[start:stop], pwork, free_index[i])
+            help0 = numpy.asarray(help0).reshape(-1)
+        deriv.append(help0 * derivfactor[i])
+    deltay = y - yfit
+    help0 = weight * deltay
+    alpha = numpy.zeros((n_free, n_free), numpy.float64)
+    beta = numpy.zeros((1, n_free), numpy.float64)
+    for i in range(n_free):
+        start_i, stop_i = windows[free_index[i]]
+        beta[0, i] = numpy.dot(help0[start_i:stop_i], deriv[i])
+        wderivi = weight[start_i:stop_i] * deriv[i]
+        for j in range(i + 1):
+            start_j, stop_j = windows[free_index[j]]
+            start = max(start_i, start_j)
+            stop = min(stop_i, stop_j)
+            if start < stop:
+                alpha[i, j] = numpy.dot(wderivi[start - start_i:stop - start_i],
+                                        deriv[j][start - start_j:stop - start_j])
+                alpha[j, i] = alpha[i, j]
+    chisq = (help0 * deltay).sum()
+    if full_output:
+        ddict = {}
+        ddict["n_free"] = n_free
+        ddict["free_index"] = free_index
+        ddict["noigno"] = noigno
+        ddict["fitparam"] = fitparam
+        ddict["derivfactor"] = derivfactor
+        ddict["function_calls"] = function_calls
+        return chisq, alpha, beta, ddict
+    else:
+        return chisq, alpha, beta
+
+def _nnls(alpha, beta, positive, max_iter=None):
+    """
+    Minimize ``0.5 * p.alpha.p - beta.p`` with the parameters flagged in
+    positive constrained to be non negative (Lawson-Hanson active set
+    algorithm applied to the normal equations).
+
+    :return: The solution and the number of iterations
+    """
+    nparameters = len(beta)
+    if max_iter is None:
+        max_iter = 3 * nparameters
+    tolerance = 10 * numpy.finfo(numpy.float64).eps * \
+                abs(alpha).sum(axis=0).max() * nparameters
+
+    def solve(passive):
+        solution = numpy.zeros((nparameters,), numpy.float64)
+        if passive.any():
+            solution[passive] = numpy.linalg.lstsq(alpha[passive][:, passive],
+                                                   beta[passive],
+                                                   rcond=-1)[0]
+        return solution
+
+    # unconstrained parameters are always part of the passive set
+    passive = numpy.logical_not(positive)
+    x = solve(passive)
+    niter = 0
+    while niter < max_iter:
+        gradient = beta - numpy.dot(alpha, x)
+        candidates = positive & numpy.logical_not(passive) & \
+                     (gradient > tolerance)
+        if not candidates.any():
+            break
+        niter += 1
+        passive[numpy.argmax(numpy.where(candidates, gradient, -numpy.inf))] = True
+        while True:
+            z = solve(passive)
+            infeasible = passive & positive & (z <= 0)
+            if not infeasible.any():
+                x = z
+                break
+            difference = x[infeasible] - z[infeasible]
+            step = numpy.where(difference > 0,
+                               x[infeasible] / (difference + (difference <= 0)),
+                               0.0).min()
+            x = x + step * (z - x)
+            passive &= numpy.logical_not(positive & (x <= tolerance))
+            x[positive & numpy.logical_not(passive)] = 0.0
+    else:
+        _logger.warning("Non negative least squares did not converge")
+    return x, max(niter, 1)
+
+def _bin_data(x, y, sigma, binning):
+    """
+    Average consecutive points of the data by groups of binning points.
+
+    The last group may be smaller. The uncertainties are those of the mean.
+
+    :return: The binned x, y and sigma
+    """
+    npoints = y.size
+    starts = numpy.arange(0, npoints, binning)
+    counts = numpy.diff(numpy.append(starts, npoints)).astype(numpy.float64)
+    xbin = numpy.add.reduceat(x, starts) / counts
+    ybin = numpy.add.reduceat(y, starts) / counts
+    sigmabin = numpy.sqrt(numpy.add.reduceat(sigma * sigma, starts)) / counts
+    return xbin, ybin, sigmabin
+
+def _get_windows(deriv_windows, x, parameters, npoints):
+    """
+    Evaluate the support windows of the parameters and return them as a list
+    of (start, stop) indices clipped to the [0, npoints] interval.
+    """
+    windows = []
+    for window in deriv_windows(x, parameters):
+        if window is None:
+            start, stop = 0, npoints
+        elif isinstance(window, slice):
+            start, stop, step = window.indices(npoints)
+            if step != 1:
+                raise ValueError("Derivative windows must be contiguous")
+        else:
+            start = min(max(int(window[0]), 0), npoints)
+            stop = min(max(int(window[1]), 0), npoints)
+        windows.append((start, max(start, stop)))
+    if len(windows) != len(parameters):
+        raise ValueError("Expected %d derivative windows, got %d" %
+                         (len(parameters), len(windows)))
+    return windows
+
+def _get_related_windows(windows, table):
+    """
+    Extend the window of each parameter to the windows of the parameters
+    related to it through CFACTOR, CDELTA or CSUM constraints, because a
+    variation of that parameter is propagated to them.
+
+    :param windows: List of (start, stop) indices as returned by
+        :func:`_get_windows`
+    :param table: Output of :func:`_compile_constraints`
+    :return: A new list of (start, stop) indices
+    """
+    if table is None or not len(table["targets"]):
+        return windows
+    windows = list(windows)
+    related = {}
+    for target, source in zip(table["targets"], table["sources"]):
+        if source != target:
+            # ignored parameters are their own source
+            related[target] = source
+    for target in related:
+        # follow the chain of related parameters up to a fitted one
+        root = related[target]
+        for i in range(len(related)):
+            if root not in related:
+                break
+            root = related[root]
+        start, stop = windows[target]
+        root_start, root_stop = windows[root]
+        if root_start >= root_stop:
+            windows[root] = (start, stop)
+        elif start < stop:
+            windows[root] = (min(root_start, start), max(root_stop, stop))
+    return windows
+
+def _compile_constraints(constraints):
+    """
+    Translate the constraints into index and coefficient arrays in order to
+    apply them to the parameters with vectorized operations.
+
+    The related parameters (CFACTOR, CDELTA, CSUM and CIGNORED) are all
+    expressed as ``newparam[target] = factor * newparam[source] + offset``.
+
+    :param constraints: None or 2D sequence of dimension (n_parameters, 3)
+    :return: None if constraints is None, else a dictionary with the keys
+        ``positive``, ``quoted``, ``pmin``, ``pmax``, ``targets``,
+        ``sources``, ``factors``, ``offsets`` and ``sequential``
+    """
+    if constraints is None:
+        return None
+    n_param = len(constraints)
+    codes = numpy.array([constraint[0] for constraint in constraints],
+                        dtype=numpy.int64).reshape(-1)
+    values = numpy.zeros((n_param, 2), numpy.float64)
+    for i, constraint in enumerate(constraints):
+        if codes[i] not in (CFREE, CPOSITIVE, CFIXED, -CFIXED):
+            values[i] = constraint[1], constraint[2]
+    table = {}
+    table["positive"] = numpy.nonzero(codes == CPOSITIVE)[0]
+    table["quoted"] = codes == CQUOTED
+    table["pmin"] = values.min(axis=1)
+    table["pmax"] = values.max(axis=1)
+
+    targets = numpy.nonzero((codes == CFACTOR) | (codes == CDELTA) |
+                            (codes == CSUM) | (codes == CIGNORED))[0]
+    target_codes = codes[targets]
+    ignored = target_codes == CIGNORED
+    sources = values[targets, 0].astype(numpy.intp)
+    sources[ignored] = targets[ignored]
+    factors = numpy.ones(len(targets), numpy.float64)
+    factors[target_codes == CFACTOR] = values[targets, 1][target_codes == CFACTOR]
+    factors[target_codes == CSUM] = -1.0
+    factors[ignored] = 0.0
+    offsets = values[targets, 1].copy()
+    offsets[(target_codes == CFACTOR) | ignored] = 0.0
+    table["targets"] = targets
+    table["sources"] = sources
+    table["factors"] = factors
+    table["offsets"] = offsets
+    # related parameters are evaluated in increasing index order, a parameter
+    # related to a previous related parameter needs that order to be kept
+    is_target = numpy.zeros(n_param, dtype=numpy.bool_)
+    is_target[targets] = True
+    table["sequential"] = bool(numpy.any(is_target[sources] &
+                                         (sources < targets)))
+    return table
+
+def _apply_constraints(parameters, table):
+    """
+    Vectorized equivalent of :func:`_get_parameters` using the output of
+    :func:`_compile_constraints`.
+
+    :return: A new array with the parameters after applying the constraints
+    """
+    newparam = numpy.array(parameters, dtype=numpy.float64)
+    if table is None:
+        return newparam
+    positive = table["positive"]
+    newparam[positive] = abs(newparam[positive])
+    targets = table["targets"]
+    if table["sequential"]:
+        for target, source, factor, offset in zip(targets,
+                                                  table["sources"],
+                                                  table["factors"],
+                                                  table["offsets"]):
+            newparam[target] = factor * newparam[source] + offset
+    elif len(targets):
+        newparam[targets] = table["factors"] * newparam[table["sources"]] + \
+                            table["offsets"]
+    return newparam
+
 def _get_parameters(parameters, constraints):
     """
     Apply constraints to input parameters.
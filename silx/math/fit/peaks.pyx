@@ -0,0 +1,303 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""This module provides a peak search routine to seed multi-peak fits.
+
+:func:`peak_search` correlates the spectrum with the (sign inverted) second
+derivative of a gaussian of the expected FWHM. A peak is reported at every
+local maximum of that response which exceeds ``sensitivity`` times its
+standard deviation, assuming Poisson statistics on the data (counts).
+Each peak is then described by its position (with sub-channel refinement),
+its height above the local background and an estimation of its FWHM,
+obtained on a lightly smoothed copy of the data.
+
+The peaks are returned as a (n_peaks, 3) array of (height, position, fwhm)
+rows, so that ``peaks.ravel()`` can directly be used as the initial
+parameters of a sum of gaussians given to :func:`silx.math.fit.leastsq`::
+
+    peaks = peak_search(y, fwhm=10)
+    p0 = [background, slope] + peaks.ravel().tolist()
+
+Stacks of spectra (2D arrays, one spectrum per row) are processed in
+parallel.
+"""
+
+__authors__ = ["V.A. Sole"]
+__license__ = "MIT"
+__date__ = "22/06/2016"
+
+cimport cython
+from cython.parallel import prange
+from libc.math cimport sqrt, fabs
+import multiprocessing
+import numpy
+
+cdef double FWHM_FACTOR = 2.3548200450309493
+
+
+def _gaussian_kernels(double fwhm):
+    """Return the second derivative, noise and smoothing kernels
+
+    :param float fwhm: Expected full width at half maximum in channels
+    :return: 3 1D arrays of float64 and the smoothing sigma
+    """
+    sigma = fwhm / FWHM_FACTOR
+    half = max(int(numpy.ceil(3 * sigma)), 1)
+    k = numpy.arange(-half, half + 1, dtype=numpy.float64) / sigma
+    deriv = (1.0 - k * k) * numpy.exp(-0.5 * k * k)
+    # zero area: constant and linear backgrounds give no response
+    deriv -= deriv.mean()
+    noise = deriv * deriv
+
+    smooth_sigma = sigma / 3.0
+    half = max(int(numpy.ceil(3 * smooth_sigma)), 1)
+    k = numpy.arange(-half, half + 1, dtype=numpy.float64) / smooth_sigma
+    smooth = numpy.exp(-0.5 * k * k)
+    smooth /= smooth.sum()
+    return deriv, noise, smooth, smooth_sigma
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double _correlate(double[:, ::1] data, Py_ssize_t row,
+                              double[::1] kernel, Py_ssize_t index,
+                              bint absolute) nogil:
+    """Correlate one row of data with a kernel centered on index.
+
+    Data outside the spectrum are replaced by the closest channel.
+    """
+    cdef:
+        Py_ssize_t n = data.shape[1]
+        Py_ssize_t half = (kernel.shape[0] - 1) // 2
+        Py_ssize_t k, j
+        double value, result = 0.0
+    for k in range(kernel.shape[0]):
+        j = min(max(index + k - half, 0), n - 1)
+        value = data[row, j]
+        if absolute:
+            value = fabs(value)
+        result += kernel[k] * value
+    return result
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t _flag_peaks(double[:, ::1] data, Py_ssize_t row,
+                            Py_ssize_t begin, Py_ssize_t end,
+                            double[::1] deriv, double[::1] noise,
+                            double sensitivity,
+                            char[:, ::1] flags) nogil:
+    """Flag the channels of one spectrum where a peak is found
+
+    :return: The number of peaks found
+    """
+    cdef:
+        Py_ssize_t i, count = 0
+        double previous, current, following
+    if begin >= end:
+        return 0
+    previous = _correlate(data, row, deriv, begin - 1, False)
+    current = _correlate(data, row, deriv, begin, False)
+    for i in range(begin, end):
+        following = _correlate(data, row, deriv, i + 1, False)
+        if current > 0 and current >= previous and current > following:
+            if current > sensitivity * sqrt(_correlate(data, row, noise,
+                                                       i, True)):
+                flags[row, i] = 1
+                count += 1
+        previous = current
+        current = following
+    return count
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef double _half_crossing(double[:, ::1] data, Py_ssize_t row,
+                           double[::1] smooth, Py_ssize_t index,
+                           int step, Py_ssize_t limit,
+                           double half, double base0, double slope) nogil:
+    """Return the position where the smoothed spectrum (minus the linear
+    background) falls under half, walking from index by steps of step.
+
+    :return: The interpolated position or -1 if not found before limit
+    """
+    cdef:
+        Py_ssize_t j = index
+        double value, last
+    last = _correlate(data, row, smooth, j, False) - base0 - slope * j
+    while j != limit:
+        j += step
+        value = _correlate(data, row, smooth, j, False) - base0 - slope * j
+        if value <= half:
+            if last == value:
+                return j
+            return j - step * (half - value) / (last - value)
+        last = value
+    return -1.0
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void _describe_peaks(double[:, ::1] data, Py_ssize_t row,
+                          Py_ssize_t begin, Py_ssize_t end,
+                          double[::1] deriv, double[::1] smooth,
+                          double smooth_sigma, double fwhm,
+                          char[:, ::1] flags, double[:, ::1] result,
+                          Py_ssize_t offset) nogil:
+    """Fill one row of result with (height, position, fwhm) per peak
+    flagged in the spectrum.
+    """
+    cdef:
+        Py_ssize_t n = data.shape[1]
+        Py_ssize_t i, left, right, count = 0
+        Py_ssize_t reach = <Py_ssize_t> (3.0 * fwhm + 1.0)
+        double r_minus, r_zero, r_plus, denom, delta
+        double base0, slope, height, half, x_left, x_right
+        double measured, smooth_fwhm = FWHM_FACTOR * smooth_sigma
+    for i in range(begin, end):
+        if not flags[row, i]:
+            continue
+
+        # sub-channel position from a parabola through the response
+        r_minus = _correlate(data, row, deriv, i - 1, False)
+        r_zero = _correlate(data, row, deriv, i, False)
+        r_plus = _correlate(data, row, deriv, i + 1, False)
+        denom = r_minus - 2.0 * r_zero + r_plus
+        delta = 0.0
+        if denom < 0:
+            delta = 0.5 * (r_minus - r_plus) / denom
+            delta = min(max(delta, -0.5), 0.5)
+
+        # linear background under the peak
+        left = max(i - <Py_ssize_t> (1.5 * fwhm + 0.5), 0)
+        right = min(i + <Py_ssize_t> (1.5 * fwhm + 0.5), n - 1)
+        base0 = _correlate(data, row, smooth, left, False)
+        slope = 0.0
+        if right > left:
+            slope = (_correlate(data, row, smooth, right, False) - base0) / \
+                    (right - left)
+        base0 -= slope * left
+        height = _correlate(data, row, smooth, i, False) - base0 - slope * i
+        half = 0.5 * height
+
+        x_left = _half_crossing(data, row, smooth, i, -1,
+                                max(i - reach, 0), half, base0, slope)
+        x_right = _half_crossing(data, row, smooth, i, 1,
+                                 min(i + reach, n - 1), half, base0, slope)
+        if x_left >= 0 and x_right >= 0:
+            measured = x_right - x_left
+        elif x_left >= 0:
+            measured = 2.0 * (i - x_left)
+        elif x_right >= 0:
+            measured = 2.0 * (x_right - i)
+        else:
+            measured = sqrt(fwhm * fwhm + smooth_fwhm * smooth_fwhm)
+
+        # remove the broadening introduced by the smoothing
+        if measured > 1.01 * smooth_fwhm:
+            height *= measured / sqrt(measured * measured -
+                                      smooth_fwhm * smooth_fwhm)
+            measured = sqrt(measured * measured - smooth_fwhm * smooth_fwhm)
+        result[offset + count, 0] = height
+        result[offset + count, 1] = i + delta
+        result[offset + count, 2] = measured
+        count += 1
+
+
+def peak_search(data, fwhm, sensitivity=3.5,
+                begin_index=None, end_index=None, num_threads=None):
+    """peak_search(data, fwhm, sensitivity=3.5, begin_index=None, end_index=None, num_threads=None)
+
+    Find the peaks of a spectrum or of a stack of spectra.
+
+    :param data: A spectrum (1D) or a stack of spectra (2D, one per row)
+    :type data: numpy.ndarray
+    :param float fwhm: Expected full width at half maximum of the peaks,
+        in channels
+    :param float sensitivity: Minimum ratio between the peak response and
+        its standard deviation for a peak to be reported
+    :param int begin_index: First channel to search (default: 0)
+    :param int end_index: Channel after the last one to search
+        (default: the whole spectrum)
+    :param int num_threads: Number of threads to use for stacks of spectra
+        (default: the number of CPUs)
+    :return: For a spectrum, a (n_peaks, 3) float64 array of
+        (height, position, fwhm) rows sorted by position.
+        For a stack, a list with one such array per spectrum.
+    :raises ValueError: If data is not 1D or 2D or fwhm is not positive
+    """
+    cdef:
+        double[:, ::1] c_data
+        double[::1] deriv, noise, smooth
+        double[:, ::1] result
+        char[:, ::1] flags
+        Py_ssize_t[::1] counts, offsets
+        Py_ssize_t row, n_spectra, n, begin, end
+        double c_sensitivity = sensitivity
+        double c_fwhm = fwhm
+        double smooth_sigma
+        int c_num_threads
+
+    data = numpy.asarray(data)
+    if data.ndim not in (1, 2):
+        raise ValueError("Expected a 1D spectrum or a 2D stack of spectra")
+    if not c_fwhm > 0:
+        raise ValueError("fwhm must be positive")
+    c_data = numpy.ascontiguousarray(numpy.atleast_2d(data),
+                                     dtype=numpy.float64)
+    n_spectra = c_data.shape[0]
+    n = c_data.shape[1]
+
+    begin = 0 if begin_index is None else begin_index
+    end = n if end_index is None else end_index
+    begin = max(begin, 1)
+    end = min(end, n - 1)
+
+    if num_threads is None:
+        num_threads = multiprocessing.cpu_count()
+    c_num_threads = max(1, num_threads)
+
+    deriv, noise, smooth, smooth_sigma = _gaussian_kernels(c_fwhm)
+    flags = numpy.zeros((n_spectra, n), dtype=numpy.int8)
+    counts = numpy.zeros(n_spectra, dtype=numpy.intp)
+
+    for row in prange(n_spectra, nogil=True, schedule="guided",
+                      num_threads=c_num_threads):
+        counts[row] = _flag_peaks(c_data, row, begin, end, deriv, noise,
+                                  c_sensitivity, flags)
+
+    offsets = numpy.concatenate(([0], numpy.cumsum(counts))).astype(numpy.intp)
+    result = numpy.zeros((offsets[n_spectra], 3), dtype=numpy.float64)
+
+    for row in prange(n_spectra, nogil=True, schedule="guided",
+                      num_threads=c_num_threads):
+        if counts[row]:
+            _describe_peaks(c_data, row, begin, end, deriv, smooth,
+                            smooth_sigma, c_fwhm, flags, result, offsets[row])
+
+    peaks = numpy.asarray(result)
+    if data.ndim == 1:
+        return peaks
+    return [peaks[offsets[row]:offsets[row + 1]] for row in range(n_spectra)]
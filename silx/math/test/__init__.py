@@ -33,6 +33,8 @@ from .test_histogramnd_error import suite as test_histo_error
 from .test_histogramnd_vs_np import suite as test_histo_vs_np
 from .test_HistogramndLut_nominal import suite as test_histolut_nominal
 from .test_fit import suite as test_curve_fit
+from .test_peaks import suite as test_peaks
+from .test_filters import suite as test_filters
 
 
 def suite():
@@ -42,4 +44,6 @@ def suite():
     test_suite.addTest(test_histo_vs_np())
     test_suite.addTest(test_histolut_nominal())
     test_suite.addTest(test_curve_fit())
+    test_suite.addTest(test_peaks())
+    test_suite.addTest(test_filters())
     return test_suite
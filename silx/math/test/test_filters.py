@@ -0,0 +1,100 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""
+Tests of the background estimation functions.
+"""
+
+import unittest
+
+import numpy
+
+from silx.math.fit import strip, snip1d, smooth1d
+
+
+class TestBackground(unittest.TestCase):
+    """Unit tests of strip, snip1d and smooth1d."""
+
+    def setUp(self):
+        x = numpy.arange(2000.)
+        self.background = 100 + 0.05 * x + 50 * numpy.sin(x / 600.)
+        self.y = self.background * 1
+        for height, position, fwhm in [(1000., 300., 12.),
+                                       (500., 800., 20.),
+                                       (200., 1500., 8.)]:
+            dummy = 2.3548200450309493 * (x - position) / fwhm
+            self.y += height * numpy.exp(-0.5 * dummy * dummy)
+
+    def testSmooth(self):
+        data = numpy.array([1., 2., 3., 4., 5.])
+        self.assertTrue(numpy.allclose(smooth1d(data, 1),
+                                       [1.5, 2., 3., 4., 4.5]))
+        self.assertTrue(numpy.array_equal(smooth1d(data, 0), data))
+        self.assertTrue(numpy.allclose(smooth1d(numpy.ones((3, 50)), 4), 1.))
+
+    def testSnip(self):
+        background = snip1d(self.y, 30)
+        self.assertEqual(background.shape, self.y.shape)
+        self.assertTrue(numpy.all(background <= self.y))
+        self.assertLess(abs(background - self.background).max(), 1.)
+        smoothed = snip1d(self.y, 30, smoothing=2)
+        self.assertLess(abs(smoothed - self.background).max(), 1.)
+        self.assertRaises(ValueError, snip1d, self.y, 0)
+
+    def testStrip(self):
+        background = strip(self.y, w=4, niterations=2000)
+        self.assertTrue(numpy.all(background <= self.y))
+        self.assertLess(abs(background - self.background)[20:-20].mean(), 2.)
+        anchored = strip(self.y, w=4, niterations=2000, anchors=[300])
+        self.assertEqual(anchored[300], self.y[300])
+        # factor larger than 1 keeps more of the data
+        self.assertTrue(numpy.all(strip(self.y, 4, 2000, factor=1.1) >=
+                                  background))
+
+    def testStack(self):
+        numpy.random.seed(0)
+        stack = numpy.random.poisson(numpy.tile(self.y, (7, 1)))
+        for function in (lambda d, n: snip1d(d, 30, num_threads=n),
+                         lambda d, n: strip(d, 4, 100, num_threads=n),
+                         lambda d, n: smooth1d(d, 3, num_threads=n)):
+            result = function(stack, 3)
+            self.assertEqual(result.shape, stack.shape)
+            self.assertEqual(result.dtype, numpy.float64)
+            self.assertTrue(numpy.array_equal(result, function(stack, 1)))
+            self.assertTrue(numpy.array_equal(result[4], function(stack[4], 1)))
+
+    def testEmpty(self):
+        self.assertEqual(snip1d(numpy.array([]), 3).shape, (0,))
+        self.assertEqual(strip(numpy.zeros((3, 0))).shape, (3, 0))
+        self.assertRaises(ValueError, strip, numpy.zeros((2, 2, 2)))
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestBackground))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest="suite")
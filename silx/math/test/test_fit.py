@@ -207,6 +207,26 @@ class Test_leastsq(unittest.TestCase):
                                                       fittedpar[i])
             self.assertTrue(test_condition, msg)
 
+    def testConstraintsTable(self):
+        from silx.math.fit.leastsq import _compile_constraints, \
+            _apply_constraints, _get_parameters
+        CQUOTED = 2
+        CFACTOR = 4
+        CDELTA = 5
+        CSUM = 6
+        CIGNORED = 7
+        parameters = numpy.array([10.5, -2, 10000.0, 20., 150, 5000, 900., 300])
+        constraints = [[0, 0, 0], [1, 0, 0], [CQUOTED, 9000, 12000],
+                       [3, 0, 0], [CSUM, 6, 1000], [CFACTOR, 2, 0.5],
+                       [CDELTA, 5, 10.], [CIGNORED, 0, 0]]
+        table = _compile_constraints(constraints)
+        expected = _get_parameters(parameters.tolist(), constraints)
+        obtained = _apply_constraints(parameters, table)
+        self.assertTrue(numpy.allclose(expected, obtained))
+        self.assertTrue(table["sequential"])
+        # the input parameters are left untouched
+        self.assertEqual(parameters[1], -2)
+
     def testUnconstrainedFitAnalyticalDerivative(self):
         parameters_actual = [10.5, 2, 1000.0, 20., 15]
         x = numpy.arange(10000.)
@@ -228,6 +248,245 @@ class Test_leastsq(unittest.TestCase):
                                                       fittedpar[i])
             self.assertTrue(test_condition, msg)
 
+    def testDerivativeWindows(self):
+        parameters_actual = [10.5, 2, 10000.0, 2000., 15,
+                             5000, 5000., 30, 2000., 7000., 20.]
+        x = numpy.arange(10000.)
+        y = self.gauss(x, *parameters_actual)
+        sigma = numpy.sqrt(y)
+        parameters_estimate = [0.0, 1.0, 9000.0, 2010., 12,
+                               4500, 4990., 25, 1800., 7005., 25.]
+        model_function = self.gauss
+
+        def windows(x, params):
+            result = [None, None]
+            for i in range(2, len(params), 3):
+                position, fwhm = params[i + 1], abs(params[i + 2])
+                start, stop = numpy.searchsorted(x, [position - 5 * fwhm,
+                                                     position + 5 * fwhm])
+                result += [(start, stop)] * 3
+            return result
+
+        dense_par, dense_cov = self.instance(model_function, x, y,
+                                             parameters_estimate,
+                                             sigma=sigma)
+        for model_deriv in [None, self.gauss_derivative]:
+            fittedpar, cov, info = self.instance(model_function, x, y,
+                                                 parameters_estimate,
+                                                 sigma=sigma,
+                                                 model_deriv=model_deriv,
+                                                 deriv_windows=windows,
+                                                 full_output=True)
+            test_condition = numpy.allclose(parameters_actual, fittedpar)
+            if not test_condition:
+                msg = "Unsuccessfull fit\n"
+                for i in range(len(fittedpar)):
+                    msg += "Expected %g obtained %g\n" % (parameters_actual[i],
+                                                          fittedpar[i])
+                self.assertTrue(test_condition, msg)
+            self.assertTrue(numpy.allclose(numpy.diag(dense_cov),
+                                           numpy.diag(cov),
+                                           rtol=1.0e-3))
+
+        # the height of the third peak is related to the height of the first
+        # one and its position to the position of the second one
+        CFACTOR = 4
+        CDELTA = 5
+        constraints = [[0, 0, 0]] * len(parameters_actual)
+        constraints[8] = [CFACTOR, 2, 0.2]
+        constraints[9] = [CDELTA, 6, 2000.]
+        dense_par, dense_cov, dense_info = self.instance(model_function, x, y,
+                                                         parameters_estimate,
+                                                         sigma=sigma,
+                                                         constraints=constraints,
+                                                         full_output=True)
+        fittedpar, cov, info = self.instance(model_function, x, y,
+                                             parameters_estimate,
+                                             sigma=sigma,
+                                             constraints=constraints,
+                                             deriv_windows=windows,
+                                             full_output=True)
+        self.assertTrue(numpy.allclose(parameters_actual, fittedpar))
+        self.assertTrue(numpy.allclose(dense_info["uncertainties"],
+                                       info["uncertainties"],
+                                       rtol=1.0e-3))
+
+    def testLinearLeastsq(self):
+        from silx.math.fit import linear_leastsq
+        CPOSITIVE = 1
+        CFIXED = 3
+        x = numpy.linspace(0, 1, 500)
+        basis = numpy.array([numpy.ones(x.shape), x, x * x,
+                             self.gauss(x, 0, 0, 1.0, 0.5, 0.1)])
+        parameters_actual = numpy.array([[1.0, -2.0, 3.0, 5.0],
+                                         [2.0, 4.0, -6.0, 10.0]])
+        y = numpy.dot(parameters_actual, basis)
+        sigma = numpy.sqrt(abs(y) + 1)
+
+        fittedpar, cov = linear_leastsq(basis, y[0])
+        self.assertTrue(numpy.allclose(parameters_actual[0], fittedpar))
+        for s in [None, sigma]:
+            fittedpar, cov, info = linear_leastsq(basis, y, sigma=s,
+                                                  full_output=True)
+            self.assertTrue(numpy.allclose(parameters_actual, fittedpar))
+            self.assertEqual(cov.shape, (2, 4, 4))
+            self.assertTrue(numpy.allclose(info["chisq"], 0.0))
+
+        # same uncertainties for all the spectra
+        noisy = y + numpy.sin(50 * x)
+        fittedpar = linear_leastsq(basis, noisy, sigma=sigma[0])[0]
+        weight = 1.0 / sigma[0] ** 2
+        alpha = numpy.inner(basis * weight, basis)
+        for i in range(2):
+            beta = numpy.dot(basis * weight, noisy[i])
+            self.assertTrue(numpy.allclose(fittedpar[i],
+                                           numpy.linalg.solve(alpha, beta)))
+
+        # slope constrained to be positive, gaussian fixed
+        constraints = [[0, 0, 0], [CPOSITIVE, 0, 0], [0, 0, 0], [CFIXED, 0, 0]]
+        fittedpar, cov = linear_leastsq(basis, y, sigma=sigma,
+                                        constraints=constraints,
+                                        p0=[0.0, 0.0, 0.0, 5.0])
+        self.assertEqual(fittedpar[0, 1], 0.0)
+        self.assertTrue(numpy.allclose(fittedpar[:, 3], 5.0))
+        self.assertTrue(numpy.all(fittedpar[:, 1] >= 0))
+        # first spectrum equivalent to a fit without the slope
+        free = [0, 2]
+        weight = 1.0 / sigma[0] ** 2
+        alpha = numpy.inner(basis[free] * weight, basis[free])
+        beta = numpy.dot(basis[free] * weight, y[0] - 5.0 * basis[3])
+        self.assertTrue(numpy.allclose(fittedpar[0, free],
+                                       numpy.linalg.solve(alpha, beta)))
+
+        self.assertRaises(ValueError, linear_leastsq, basis, y,
+                          constraints=[[0, 0, 0], [4, 0, 2.0],
+                                       [0, 0, 0], [0, 0, 0]])
+
+    def testLinearModel(self):
+        def polynomial(x, *params):
+            return params[0] + params[1] * x + params[2] * x * x
+
+        parameters_actual = [10.5, -2, 0.03]
+        x = numpy.arange(1000.)
+        y = polynomial(x, *parameters_actual)
+        sigma = numpy.sqrt(abs(y))
+        parameters_estimate = [0.0, 0.0, 0.0]
+        fittedpar, cov, info = self.instance(polynomial, x, y,
+                                             parameters_estimate,
+                                             sigma=sigma,
+                                             linear=True,
+                                             full_output=True)
+        self.assertTrue(numpy.allclose(parameters_actual, fittedpar))
+        self.assertEqual(info["nfev"], 3)
+        self.assertEqual(info["niter"], 1)
+        self.assertEqual(len(info["levels"]), 1)
+        self.assertFalse(info["stopped"])
+        self.assertTrue(0 <= info["timing"]["solve"] <= info["timing"]["total"])
+
+        calls = []
+        fittedpar1, cov1, info = self.instance(polynomial, x, y,
+                                               parameters_estimate,
+                                               sigma=sigma,
+                                               linear=True,
+                                               full_output=True,
+                                               callback=calls.append)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(numpy.allclose(calls[0]["parameters"], fittedpar))
+
+        # coarse levels are fitted iteratively
+        fittedpar1, cov1, info = self.instance(polynomial, x, y,
+                                               parameters_estimate,
+                                               sigma=sigma,
+                                               linear=True,
+                                               full_output=True,
+                                               levels=2)
+        self.assertTrue(numpy.allclose(parameters_actual, fittedpar1))
+        self.assertEqual(len(info["levels"]), 2)
+
+        polynomial.linear = True
+        fittedpar2, cov2 = self.instance(polynomial, x, y,
+                                         parameters_estimate,
+                                         sigma=sigma)
+        self.assertTrue(numpy.allclose(fittedpar, fittedpar2))
+        self.assertTrue(numpy.allclose(cov, cov2))
+        fittedpar3, cov3 = self.instance(polynomial, x, y,
+                                         parameters_estimate,
+                                         sigma=sigma,
+                                         linear=False)
+        self.assertTrue(numpy.allclose(fittedpar, fittedpar3))
+        self.assertTrue(numpy.allclose(cov, cov3, rtol=1.0e-3))
+
+    def testMultiResolution(self):
+        parameters_actual = [10.5, 2, 10000.0, 20000., 150, 5000, 60900., 300]
+        x = numpy.arange(100000.)
+        y = self.gauss(x, *parameters_actual)
+        sigma = numpy.sqrt(y)
+        parameters_estimate = [0.0, 1.0, 9000.0, 20100., 130, 4500, 60800, 320]
+        model_function = self.gauss
+
+        fittedpar, cov, info = self.instance(model_function, x, y,
+                                             parameters_estimate,
+                                             sigma=sigma,
+                                             full_output=True,
+                                             levels=3)
+        test_condition = numpy.allclose(parameters_actual, fittedpar)
+        if not test_condition:
+            msg = "Unsuccessfull fit\n"
+            for i in range(len(fittedpar)):
+                msg += "Expected %g obtained %g\n" % (parameters_actual[i],
+                                                      fittedpar[i])
+            self.assertTrue(test_condition, msg)
+        levels = info["levels"]
+        self.assertEqual([level["binning"] for level in levels], [16, 4, 1])
+        self.assertEqual([level["npoints"] for level in levels],
+                         [6250, 25000, 100000])
+        self.assertEqual(sum(level["nfev"] for level in levels), info["nfev"])
+        self.assertEqual(sum(level["niter"] for level in levels), info["niter"])
+
+        fittedpar, cov, info = self.instance(model_function, x, y,
+                                             parameters_estimate,
+                                             sigma=sigma,
+                                             full_output=True)
+        self.assertEqual(len(info["levels"]), 1)
+
+        for level_binning in [1, 0, -2]:
+            self.assertRaises(ValueError, self.instance, model_function, x, y,
+                              parameters_estimate, sigma=sigma, levels=3,
+                              level_binning=level_binning)
+
+    def testCallback(self):
+        parameters_actual = [10.5, 2, 1000.0, 20., 15]
+        x = numpy.arange(10000.)
+        y = self.gauss(x, *parameters_actual)
+        parameters_estimate = [0.0, 1.0, 900.0, 25., 10]
+        iterations = []
+
+        def callback(info):
+            iterations.append(info["iteration"])
+            self.assertEqual(len(info["parameters"]), 5)
+            self.assertTrue(info["nfev"] > 0)
+            return False
+
+        fittedpar, cov, info = self.instance(self.gauss, x, y,
+                                             parameters_estimate,
+                                             full_output=True,
+                                             callback=callback)
+        self.assertTrue(numpy.allclose(parameters_actual, fittedpar))
+        self.assertEqual(iterations, list(range(1, info["niter"] + 1)))
+        self.assertFalse(info["stopped"])
+        for key in ["derivatives", "solve", "constraints", "model"]:
+            self.assertTrue(0 <= info["timing"][key] <= info["timing"]["total"])
+
+        def stop(info):
+            return info["iteration"] >= 2
+
+        fittedpar, cov, info = self.instance(self.gauss, x, y,
+                                             parameters_estimate,
+                                             full_output=True,
+                                             callback=stop)
+        self.assertTrue(info["stopped"])
+        self.assertEqual(info["niter"], 2)
+
     def testBadlyShapedData(self):
         parameters_actual = [10.5, 2, 1000.0, 20., 15]
         x = numpy.arange(10000.).reshape(1000, 10)
@@ -0,0 +1,120 @@
+# coding: utf-8
+# /*##########################################################################
+# Copyright (C) 2016 European Synchrotron Radiation Facility
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+# ############################################################################*/
+"""
+Tests of the peak_search function.
+"""
+
+import unittest
+
+import numpy
+
+from silx.math.fit import peak_search, leastsq
+
+
+def gauss(x, *params):
+    params = numpy.array(params, copy=False, dtype=numpy.float64)
+    result = params[0] + params[1] * x
+    for i in range(2, len(params), 3):
+        height, position, fwhm = params[i:(i + 3)]
+        dummy = 2.3548200450309493 * (x - position) / fwhm
+        result += height * numpy.exp(-0.5 * dummy * dummy)
+    return result
+
+
+class TestPeakSearch(unittest.TestCase):
+    """Unit tests of the peak_search function."""
+
+    def setUp(self):
+        self.x = numpy.arange(2000.)
+        self.peaks = [[1000., 300.3, 12.],
+                      [500., 800.7, 20.],
+                      [200., 1500., 8.],
+                      [900., 1530., 10.]]
+        self.y = gauss(self.x, 20., 0.01, *numpy.ravel(self.peaks))
+
+    def testNoiseFree(self):
+        peaks = peak_search(self.y, 12)
+        self.assertEqual(peaks.shape, (4, 3))
+        self.assertTrue(numpy.allclose(peaks[:, 1],
+                                       [p[1] for p in self.peaks],
+                                       atol=0.1))
+        self.assertTrue(numpy.allclose(peaks[:, 0],
+                                       [p[0] for p in self.peaks],
+                                       rtol=0.15))
+        self.assertTrue(numpy.allclose(peaks[:, 2],
+                                       [p[2] for p in self.peaks],
+                                       rtol=0.15))
+
+    def testPoissonNoise(self):
+        numpy.random.seed(0)
+        y = numpy.random.poisson(self.y).astype(numpy.float64)
+        peaks = peak_search(y, 12)
+        self.assertEqual(len(peaks), 4)
+        self.assertTrue(numpy.allclose(peaks[:, 1],
+                                       [p[1] for p in self.peaks],
+                                       atol=1.0))
+
+    def testFlat(self):
+        self.assertEqual(len(peak_search(numpy.ones(100) * 50, 10)), 0)
+        self.assertEqual(len(peak_search(numpy.zeros(100), 10)), 0)
+        self.assertEqual(len(peak_search(numpy.array([]), 10)), 0)
+
+    def testIndexRange(self):
+        peaks = peak_search(self.y, 12, begin_index=600, end_index=1510)
+        self.assertTrue(numpy.allclose(peaks[:, 1], [800.7, 1500.],
+                                       atol=0.1))
+
+    def testStack(self):
+        stack = numpy.array([self.y, numpy.ones(2000), self.y[::-1]])
+        reference = peak_search(self.y, 12)
+        for num_threads in (1, 3):
+            result = peak_search(stack, 12, num_threads=num_threads)
+            self.assertEqual(len(result), 3)
+            self.assertTrue(numpy.array_equal(result[0], reference))
+            self.assertEqual(len(result[1]), 0)
+            self.assertTrue(numpy.allclose(result[2][::-1, 1],
+                                           1999. - reference[:, 1]))
+
+    def testErrors(self):
+        self.assertRaises(ValueError, peak_search, self.y, 0)
+        self.assertRaises(ValueError, peak_search,
+                          numpy.ones((2, 2, 2)), 10)
+
+    def testSeedFit(self):
+        peaks = peak_search(self.y, 12)
+        p0 = [0., 0.] + peaks.ravel().tolist()
+        fittedpar, cov = leastsq(gauss, self.x, self.y, p0)
+        self.assertTrue(numpy.allclose(fittedpar[2:],
+                                       numpy.ravel(self.peaks)))
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestPeakSearch))
+    return test_suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest="suite")